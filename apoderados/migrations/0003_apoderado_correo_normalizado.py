@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:03
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Lower, Trim
+
+
+def poblar_correo_normalizado(apps, schema_editor):
+    Apoderado = apps.get_model('apoderados', 'Apoderado')
+    Apoderado.objects.update(correo_normalizado=Lower(Trim(Coalesce('correo', models.Value('')))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apoderados', '0002_apoderado_dni'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apoderado',
+            name='correo_normalizado',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=254),
+        ),
+        migrations.RunPython(poblar_correo_normalizado, migrations.RunPython.noop),
+    ]
@@ -5,8 +5,19 @@ class Apoderado(models.Model):
     apellidos = models.CharField(max_length=120)
     telefono = models.CharField(max_length=15, unique=True)
     correo = models.EmailField(blank=True, null=True)
+    # Copia en minúsculas y sin espacios de `correo`, indexada para las
+    # búsquedas por email (ver apoderados.services).
+    correo_normalizado = models.CharField(max_length=254, blank=True, db_index=True, editable=False)
     direccion = models.CharField(max_length=200, blank=True)
     dni = models.CharField(max_length=8, unique=True)
        
+    def save(self, *args, **kwargs):
+        from .services import normalizar_correo
+        self.correo_normalizado = normalizar_correo(self.correo)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'correo' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'correo_normalizado'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.apellidos}, {self.nombres}"
@@ -0,0 +1,25 @@
+from estudiantes.models import Inscripcion
+
+
+def normalizar_correo(correo):
+    return (correo or '').strip().lower()
+
+
+def inscripciones_por_correo(correo):
+    """
+    Inscripciones de los estudiantes cuyo apoderado usa ese correo, de la
+    más reciente a la más antigua. Filtra por `correo_normalizado` (índice)
+    en lugar de un `iexact` que obliga a recorrer la tabla.
+    """
+    correo = normalizar_correo(correo)
+    if not correo:
+        return Inscripcion.objects.none()
+    return (
+        Inscripcion.objects
+        .filter(estudiante__apoderado__correo_normalizado=correo)
+        .order_by('-id')
+    )
+
+
+def ultima_inscripcion_por_correo(correo):
+    return inscripciones_por_correo(correo).first()
@@ -1,6 +1,19 @@
-from django.contrib import admin
-from .models import Curso, Profesor, Aula, Horario, Asignacion, Dia
+from django import forms
+from django.contrib import admin, messages
+from django.core import signing
+from django.core.exceptions import ValidationError
 from django.db.models import Count
+from django.http import HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import path, reverse
+from .conflictos import conflictos_de
+from .services import promover_espera
+from .solver import aplicar_propuesta, resolver_horarios
+from .models import Curso, Profesor, Aula, Horario, Asignacion, Dia
+
+# La vista previa del solver viaja firmada en el formulario de «Aplicar».
+FIRMA_PROPUESTA = 'docentes.resolver_horarios'
+
 
 @admin.register(Curso)
 class CursoAdmin(admin.ModelAdmin):
@@ -29,31 +42,159 @@ class AulaAdmin(admin.ModelAdmin):
 class HorarioAdmin(admin.ModelAdmin):
     list_display = ('dias_summary','hora_inicio','hora_fin')
     list_filter = ('dias',)
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('dias')
     def dias_summary(self, obj):
         return ", ".join([d.get_codigo_display() for d in obj.dias.all()])
     dias_summary.short_description = "Días"
     # Mostrar selector M2M amigable
     filter_horizontal = ('dias',)
 
+class AsignacionAdminForm(forms.ModelForm):
+    class Meta:
+        model = Asignacion
+        fields = '__all__'
+
+    def clean(self):
+        # uniq_aula_horario solo cubre el mismo par exacto: aquí se rechazan
+        # también los solapamientos de aula o profesor con otras asignaciones.
+        cleaned = super().clean()
+        horario = cleaned.get('horario')
+        aula = cleaned.get('aula')
+        profesores = cleaned.get('profesores')
+        if horario is None or (aula is None and not profesores):
+            return cleaned
+        conflictos = conflictos_de(
+            self.instance.pk,
+            aula.pk if aula else None,
+            horario,
+            [p.pk for p in profesores or ()],
+            cleaned.get('fecha_inicio'),
+            cleaned.get('fecha_fin'),
+        )
+        if conflictos:
+            otras = {a.pk: a for a in Asignacion.objects.filter(pk__in={c.a for c in conflictos} | {c.b for c in conflictos})}
+            dias = dict(Dia.DIAS)
+            nombres = {p.pk: str(p) for p in profesores or ()}
+            mensajes = []
+            for c in conflictos:
+                otra = otras.get(c.b if c.a in (self.instance.pk, 0) else c.a)
+                recurso = "por el aula" if c.recurso == 'aula' else f"por el profesor {nombres.get(c.recurso_id, '')}"
+                mensajes.append(f"Se cruza con «{otra}» {recurso} el {dias.get(c.dia, c.dia)}.")
+            raise ValidationError(mensajes)
+        return cleaned
+
+
 @admin.register(Asignacion)
 class AsignacionAdmin(admin.ModelAdmin):
+    form = AsignacionAdminForm
     list_display = ('plan','profesores_list','aula','horario','grado','fecha_inicio','fecha_fin', 'cupos', 'precio')
     list_filter = ('plan','profesores','aula','horario','grado')
     search_fields = ('profesores__apellidos','profesores__nombres','plan__nombre')
+    list_select_related = ('plan', 'aula', 'horario')
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(num_matriculas=Count('matriculas'))
+        return (
+            super().get_queryset(request)
+            .prefetch_related('profesores')
+            .annotate(en_espera=Count('esperas'))
+        )
     def profesores_list(self, obj):
         profs = ', '.join(str(p) for p in obj.profesores.all())
         return profs or '—'
     profesores_list.short_description = 'Profesor(es)'
     def cupos(self, obj):
         maximo = getattr(obj, 'cupo_maximo', None)
-        usados = getattr(obj, 'num_matriculas', 0)
-        return f"{usados}/{maximo if maximo is not None else '—'}"
+        usados = obj.ocupados
+        texto = f"{usados}/{maximo if maximo is not None else '—'}"
+        if obj.retenidos:
+            texto += f" (+{obj.retenidos} retenidos)"
+        if getattr(obj, 'en_espera', 0):
+            texto += f" · {obj.en_espera} en espera"
+        return texto
 
     cupos.short_description = "Cupos usados"
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'cupo_maximo' in form.changed_data:
+            # Los cupos nuevos van primero a la lista de espera.
+            promovidas = promover_espera([obj.pk])
+            if promovidas:
+                self.message_user(
+                    request,
+                    f"{len(promovidas)} matrícula(s) salieron de la lista de espera.",
+                    level=messages.SUCCESS,
+                )
+
+    def get_urls(self):
+        custom = [
+            path('resolver-horarios/', self.admin_site.admin_view(self.resolver_horarios_view),
+                 name='docentes_asignacion_resolver_horarios'),
+        ]
+        return custom + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['resolver_horarios_url'] = reverse('admin:docentes_asignacion_resolver_horarios')
+        return super().changelist_view(request, extra_context=extra_context)
+
+    def resolver_horarios_view(self, request):
+        """
+        Propuesta del solver para las asignaciones sin aula u horario (GET:
+        vista previa con el diff; POST: aplica la propuesta que se mostró,
+        firmada en el formulario, sin volver a resolver).
+        """
+        if request.method == 'POST':
+            if not self.has_change_permission(request):
+                self.message_user(request, "No tienes permiso para modificar asignaciones.", level=messages.ERROR)
+                return HttpResponseRedirect(reverse('admin:docentes_asignacion_changelist'))
+            try:
+                propuesta = {
+                    pk: (horario_id, aula_id)
+                    for pk, horario_id, aula_id in signing.loads(request.POST.get('propuesta', ''), salt=FIRMA_PROPUESTA)
+                }
+            except signing.BadSignature:
+                self.message_user(request, "La vista previa no es válida; vuelve a generarla.", level=messages.ERROR)
+                return HttpResponseRedirect(reverse('admin:docentes_asignacion_resolver_horarios'))
+            n = aplicar_propuesta(propuesta)
+            self.message_user(request, f"{n} asignación(es) actualizadas.", level=messages.SUCCESS)
+            if n < len(propuesta):
+                self.message_user(
+                    request,
+                    f"{len(propuesta) - n} asignación(es) cambiaron desde la vista previa y no se aplicaron.",
+                    level=messages.WARNING,
+                )
+            return HttpResponseRedirect(reverse('admin:docentes_asignacion_changelist'))
+
+        resultado = resolver_horarios()
+        ids = set(resultado.propuesta) | set(resultado.sin_solucion)
+        asignaciones = Asignacion.objects.select_related('aula', 'horario').in_bulk(ids)
+        horarios = Horario.objects.in_bulk({h for h, _ in resultado.propuesta.values()})
+        aulas = Aula.objects.in_bulk({a for _, a in resultado.propuesta.values()})
+        filas = []
+        for pk, (horario_id, aula_id) in sorted(resultado.propuesta.items()):
+            a = asignaciones[pk]
+            filas.append({
+                'asignacion': a,
+                'horario_actual': a.horario,
+                'horario_nuevo': horarios[horario_id],
+                'aula_actual': a.aula,
+                'aula_nueva': aulas[aula_id],
+            })
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Resolver aulas y horarios',
+            'filas': filas,
+            'sin_solucion': [asignaciones[pk] for pk in resultado.sin_solucion],
+            'completo': resultado.completo,
+            'propuesta': signing.dumps(
+                [[pk, h, x] for pk, (h, x) in sorted(resultado.propuesta.items())], salt=FIRMA_PROPUESTA,
+            ),
+            'opts': self.model._meta,
+            'app_label': self.model._meta.app_label,
+        }
+        return render(request, 'admin/docentes/asignacion/resolver_horarios.html', context)
+
 
 @admin.register(Dia)
 class DiaAdmin(admin.ModelAdmin):
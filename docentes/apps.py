@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DocentesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'docentes'
+
+    def ready(self):
+        # registra las señales que renuevan la versión del catálogo JSON
+        from . import signals  # noqa: F401
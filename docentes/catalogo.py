@@ -0,0 +1,132 @@
+"""
+Respuestas cacheadas del catálogo JSON de asignaciones (docentes/urls.py).
+
+El formulario de inscripción consulta estos endpoints cada vez que el
+apoderado cambia el grado o la asignación. Todo el catálogo comparte un
+sello de versión guardado en la caché que renueva cualquier cambio en
+asignaciones, horarios, profesores, aulas o planes. Los cupos cambian con
+cada reserva, así que renuevan solo el sello de los recursos afectados
+(`invalidar_cupos`): el de la asignación, el de su grado y el del listado
+completo. Durante una ola de inscripciones los demás grados siguen
+sirviéndose desde la caché sin recomprimir.
+
+Con el sello se arma un ETag/Last-Modified: si el navegador ya tiene la
+versión vigente recibe un 304 sin tocar la base de datos, y si no, el
+cuerpo se sirve ya serializado y comprimido (gzip/brotli) desde la caché.
+"""
+import gzip
+import hashlib
+import json
+import re
+import time
+
+import brotli
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+CLAVE_VERSION = 'docentes:catalogo:version'
+TTL_CUERPOS = 24 * 3600
+
+_re_gzip = re.compile(r'\bgzip\b')
+_re_br = re.compile(r'\bbr\b')
+
+
+def version():
+    """Sello vigente del catálogo (nanosegundos del último cambio)."""
+    v = cache.get(CLAVE_VERSION)
+    if v is None:
+        # Caché vacía o recién vaciada: cualquier sello nuevo es válido.
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        v = cache.get(CLAVE_VERSION)
+    return v
+
+
+def invalidar():
+    """Renueva el sello al confirmar la transacción en curso."""
+    transaction.on_commit(lambda: cache.set(CLAVE_VERSION, time.time_ns(), None))
+
+
+def _clave_version(recurso):
+    return f'{CLAVE_VERSION}:{hashlib.md5(recurso.encode()).hexdigest()[:16]}'
+
+
+def invalidar_cupos(asignacion_ids, grados=None):
+    """
+    Renueva, al confirmar, el sello de las asignaciones cuyos cupos cambiaron
+    y el de sus grados. Si no se pasan `grados` se leen en el callback (una
+    consulta, fuera de la transacción).
+    """
+    asignacion_ids = [pk for pk in asignacion_ids if pk]
+    if not asignacion_ids:
+        return
+
+    def renovar():
+        nonlocal grados
+        if grados is None:
+            from .models import Asignacion
+            grados = Asignacion.objects.filter(pk__in=asignacion_ids).values_list('grado', flat=True).distinct()
+        recursos = [f'asignacion:{pk}' for pk in asignacion_ids]
+        recursos += [f'grado:{g}' for g in set(grados) if g]
+        recursos.append('grado:')
+        ahora = time.time_ns()
+        cache.set_many({_clave_version(r): ahora for r in recursos}, None)
+
+    transaction.on_commit(renovar)
+
+
+def _comprimir(data):
+    cuerpo = json.dumps(data, cls=DjangoJSONEncoder).encode()
+    return {
+        'identity': cuerpo,
+        'gzip': gzip.compress(cuerpo, compresslevel=9),
+        'br': brotli.compress(cuerpo, quality=11),
+    }
+
+
+def _codificacion(request):
+    aceptadas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if _re_br.search(aceptadas):
+        return 'br'
+    if _re_gzip.search(aceptadas):
+        return 'gzip'
+    return 'identity'
+
+
+def respuesta_json(request, clave, construir):
+    """
+    Responde el recurso `clave` del catálogo. `construir()` devuelve los
+    datos a serializar (o None para 404) y solo se llama cuando la versión
+    vigente aún no está en la caché.
+    """
+    # El sello del recurso es el mayor entre el global y el propio (cupos).
+    v = max(version(), cache.get(_clave_version(clave)) or 0)
+    # El grado puede traer espacios o "°": en cabeceras y claves va su hash.
+    clave = hashlib.md5(clave.encode()).hexdigest()[:16]
+    etag = f'"{v:x}-{clave}"'
+    last_modified = v // 10**9
+
+    respuesta = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if respuesta is None:
+        clave_cuerpos = f'docentes:catalogo:{v}:{clave}'
+        cuerpos = cache.get(clave_cuerpos)
+        if cuerpos is None:
+            data = construir()
+            if data is None:
+                raise Http404
+            cuerpos = _comprimir(data)
+            cache.set(clave_cuerpos, cuerpos, TTL_CUERPOS)
+        codificacion = _codificacion(request)
+        respuesta = HttpResponse(cuerpos[codificacion], content_type='application/json')
+        if codificacion != 'identity':
+            respuesta.headers['Content-Encoding'] = codificacion
+
+    respuesta.headers['ETag'] = etag
+    respuesta.headers['Last-Modified'] = http_date(last_modified)
+    # El navegador puede guardar la respuesta pero debe revalidarla siempre.
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    patch_vary_headers(respuesta, ('Accept-Encoding',))
+    return respuesta
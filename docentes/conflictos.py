@@ -0,0 +1,143 @@
+"""
+Detección de cruces de horario entre asignaciones.
+
+La restricción `uniq_aula_horario` solo impide repetir el mismo par
+(aula, horario). Aquí se detectan los solapamientos reales: dos
+asignaciones que usan la misma aula, o comparten un profesor, el mismo día
+en franjas que se cruzan (y en periodos fecha_inicio–fecha_fin que también
+se cruzan; sin fechas se asume todo el ciclo).
+
+Se arma un índice de bloques por (recurso, id, día) y cada lista se recorre
+con un barrido ordenado por hora de inicio, manteniendo en un heap los
+bloques aún abiertos: O(n log n + k) para n bloques y k cruces, en lugar de
+comparar todos contra todos.
+"""
+import heapq
+from collections import defaultdict, namedtuple
+
+from django.db.models import Q
+
+from .models import Asignacion, Horario
+
+# recurso: 'aula' o 'profesor'; a < b son ids de Asignacion.
+Conflicto = namedtuple('Conflicto', 'recurso recurso_id dia a b')
+
+Bloque = namedtuple('Bloque', 'asignacion_id inicio fin fecha_inicio fecha_fin')
+
+# Id para la asignación que se valida antes de existir (formulario de alta).
+NUEVA = 0
+
+
+def _fechas_se_cruzan(x, y):
+    return (
+        (x.fecha_inicio is None or y.fecha_fin is None or x.fecha_inicio <= y.fecha_fin)
+        and (y.fecha_inicio is None or x.fecha_fin is None or y.fecha_inicio <= x.fecha_fin)
+    )
+
+
+def barrer(bloques):
+    """Pares de bloques que se solapan (un bloque que termina a las 9 no cruza con uno que empieza a las 9)."""
+    abiertos = []  # heap de (fin, orden, bloque)
+    for orden, bloque in enumerate(sorted(bloques, key=lambda b: (b.inicio, b.fin))):
+        while abiertos and abiertos[0][0] <= bloque.inicio:
+            heapq.heappop(abiertos)
+        for _, _, otro in abiertos:
+            if _fechas_se_cruzan(otro, bloque):
+                yield otro, bloque
+        heapq.heappush(abiertos, (bloque.fin, orden, bloque))
+
+
+def construir_indice(filas):
+    """
+    filas: [(asignacion_id, aula_id, profesor_ids, dias, inicio, fin, fecha_inicio, fecha_fin)].
+    Devuelve {(recurso, recurso_id, dia): [Bloque]}.
+    """
+    indice = defaultdict(list)
+    for asignacion_id, aula_id, profesor_ids, dias, inicio, fin, fecha_inicio, fecha_fin in filas:
+        bloque = Bloque(asignacion_id, inicio, fin, fecha_inicio, fecha_fin)
+        for dia in dias:
+            if aula_id is not None:
+                indice[('aula', aula_id, dia)].append(bloque)
+            for profesor_id in profesor_ids:
+                indice[('profesor', profesor_id, dia)].append(bloque)
+    return indice
+
+
+def _conflictos(indice, solo=None):
+    encontrados = []
+    for (recurso, recurso_id, dia), bloques in indice.items():
+        if len(bloques) < 2:
+            continue
+        for x, y in barrer(bloques):
+            if solo is not None and solo not in (x.asignacion_id, y.asignacion_id):
+                continue
+            a, b = sorted((x.asignacion_id, y.asignacion_id))
+            encontrados.append(Conflicto(recurso, recurso_id, dia, a, b))
+    encontrados.sort()
+    return encontrados
+
+
+def _usa_recursos(aula_id, profesor_ids):
+    q = Q(aula_id=aula_id) if aula_id is not None else Q(pk__in=[])
+    if profesor_ids:
+        q |= Q(profesores__in=profesor_ids)
+    return q
+
+
+def _filas(asignaciones):
+    """Filas para construir_indice con 3 consultas (asignaciones, días, profesores)."""
+    base = list(
+        asignaciones
+        .exclude(horario=None)
+        .values_list('id', 'aula_id', 'horario_id', 'horario__hora_inicio', 'horario__hora_fin',
+                     'fecha_inicio', 'fecha_fin')
+    )
+    dias = defaultdict(list)
+    for horario_id, codigo in (
+        Horario.dias.through.objects
+        .filter(horario_id__in={f[2] for f in base})
+        .values_list('horario_id', 'dia__codigo')
+    ):
+        dias[horario_id].append(codigo)
+    profesores = defaultdict(list)
+    for asignacion_id, profesor_id in (
+        Asignacion.profesores.through.objects
+        .filter(asignacion_id__in=[f[0] for f in base])
+        .values_list('asignacion_id', 'profesor_id')
+    ):
+        profesores[asignacion_id].append(profesor_id)
+    return [
+        (pk, aula_id, profesores[pk], dias[horario_id], inicio, fin, fecha_inicio, fecha_fin)
+        for pk, aula_id, horario_id, inicio, fin, fecha_inicio, fecha_fin in base
+    ]
+
+
+def detectar_conflictos(asignaciones=None):
+    """Todos los cruces entre las asignaciones dadas (por defecto, todas)."""
+    if asignaciones is None:
+        asignaciones = Asignacion.objects.all()
+    return _conflictos(construir_indice(_filas(asignaciones)))
+
+
+def conflictos_de(asignacion_id, aula_id, horario, profesor_ids, fecha_inicio=None, fecha_fin=None):
+    """
+    Cruces que tendría una asignación con los datos dados (para validar un
+    formulario antes de guardar). `asignacion_id` es None si aún no existe.
+    """
+    if horario is None:
+        return []
+    dias = list(horario.dias.values_list('codigo', flat=True))
+    profesor_ids = list(profesor_ids)
+    propia = asignacion_id or NUEVA
+    # Solo las que comparten aula o profesor y algún día con la candidata.
+    otras = (
+        Asignacion.objects
+        .filter(horario__dias__codigo__in=dias)
+        .filter(_usa_recursos(aula_id, profesor_ids))
+        .exclude(pk=propia)
+        .distinct()
+    )
+    filas = _filas(otras)
+    filas.append((propia, aula_id, profesor_ids, dias, horario.hora_inicio, horario.hora_fin, fecha_inicio, fecha_fin))
+    return _conflictos(construir_indice(filas), solo=propia)
+
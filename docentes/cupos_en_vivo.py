@@ -0,0 +1,180 @@
+"""
+Stream en vivo de cupos por asignación (Server-Sent Events).
+
+Un trigger de Postgres (migraciones 0011 y 0014) publica en el canal
+`cupos` cada cambio de `ocupados`/`retenidos`/`cupo_maximo`. En cada proceso ASGI un único hilo hace
+LISTEN sobre ese canal y reparte los eventos entre los clientes conectados
+(cada uno guarda solo el último cambio pendiente por asignación), así que miles de pestañas abiertas cuestan una sola
+conexión de escucha por proceso y ninguna consulta por evento.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections
+
+from .models import Asignacion
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'cupos'
+LATIDO = 15  # s; comentario SSE para que proxies y navegador no corten la conexión
+REINTENTO_MS = 3000
+
+
+class _Pendientes:
+    """
+    Cambios aún no enviados a un cliente, a lo sumo uno por asignación: un
+    aviso nuevo de la misma asignación reemplaza al que esperaba. Así un
+    cliente atrasado recibe el último valor de cada grupo sin que la cola
+    crezca ni se descarten avisos de otros grupos.
+    Solo se usa desde el loop del cliente.
+    """
+
+    def __init__(self):
+        self._eventos = {}
+        self._hay = asyncio.Event()
+
+    def poner(self, evento):
+        self._eventos[evento['id']] = evento
+        self._hay.set()
+
+    async def tomar(self, timeout):
+        """Espera hasta `timeout` s y devuelve todos los pendientes (asyncio.TimeoutError si no hubo)."""
+        await asyncio.wait_for(self._hay.wait(), timeout)
+        eventos = list(self._eventos.values())
+        self._eventos.clear()
+        self._hay.clear()
+        return eventos
+
+
+class _Difusor:
+    """Reparte las notificaciones de Postgres entre los suscriptores asyncio."""
+
+    def __init__(self):
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def suscribir(self):
+        entrada = (asyncio.get_running_loop(), _Pendientes())
+        with self._lock:
+            self._suscriptores.add(entrada)
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._escuchar, name='cupos-listen', daemon=True)
+                self._hilo.start()
+        return entrada
+
+    def cancelar(self, entrada):
+        with self._lock:
+            self._suscriptores.discard(entrada)
+
+    def publicar(self, evento):
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for loop, pendientes in suscriptores:
+            try:
+                loop.call_soon_threadsafe(pendientes.poner, evento)
+            except RuntimeError:
+                # El loop del cliente ya se cerró.
+                self.cancelar((loop, pendientes))
+
+    def _escuchar(self):
+        while True:
+            conexion = connections.create_connection('default')
+            try:
+                conexion.ensure_connection()
+                conexion.set_autocommit(True)
+                with conexion.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CANAL}")
+                pg = conexion.connection
+                while True:
+                    if select.select([pg], [], [], LATIDO) == ([], [], []):
+                        continue
+                    pg.poll()
+                    while pg.notifies:
+                        aviso = pg.notifies.pop(0)
+                        try:
+                            self.publicar(json.loads(aviso.payload))
+                        except ValueError:
+                            logger.warning("Aviso de cupos inválido: %r", aviso.payload)
+            except Exception:
+                logger.exception("Se perdió la escucha de cupos; reintentando")
+                time.sleep(REINTENTO_MS / 1000)
+            finally:
+                conexion.close()
+
+
+difusor = _Difusor()
+
+
+def _evento(nombre, data):
+    return f"event: {nombre}\ndata: {json.dumps(data)}\n\n"
+
+
+def _cupos(fila):
+    retenidos = fila.get('retenidos', 0)
+    return {
+        'id': fila['id'],
+        'ocupados': fila['ocupados'],
+        'retenidos': retenidos,
+        'cupo_maximo': fila['cupo_maximo'],
+        'disponibles': max(fila['cupo_maximo'] - fila['ocupados'] - retenidos, 0),
+    }
+
+
+def _filtro(grado, ids):
+    def coincide(evento):
+        if ids:
+            return evento['id'] in ids
+        return not grado or evento.get('grado') == grado
+    return coincide
+
+
+def _filas(grado, ids):
+    try:
+        qs = Asignacion.objects.all()
+        if ids:
+            qs = qs.filter(pk__in=ids)
+        elif grado:
+            qs = qs.filter(grado=grado)
+        return [_cupos(f) for f in qs.values('id', 'ocupados', 'retenidos', 'cupo_maximo')]
+    finally:
+        # El stream dura minutos y Django solo cierra la conexión al terminar
+        # la respuesta: sin esto cada pestaña abierta retendría una conexión.
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+async def foto(grado='', ids=()):
+    """Evento `snapshot` con los cupos actuales de las asignaciones pedidas."""
+    filas = await sync_to_async(_filas)(grado, ids)
+    return f"retry: {REINTENTO_MS}\n" + _evento('snapshot', filas)
+
+
+async def eventos(grado='', ids=()):
+    """
+    Generador SSE: primero el snapshot y luego un evento `cupos` por cada
+    cambio de las asignaciones pedidas (por `ids` o, si no, por `grado`).
+    """
+    entrada = difusor.suscribir()
+    _, pendientes = entrada
+    coincide = _filtro(grado, set(ids))
+    try:
+        # La suscripción va antes del snapshot para no perder cambios intermedios.
+        yield await foto(grado, ids)
+        while True:
+            try:
+                cambios = await pendientes.tomar(LATIDO)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            for evento in cambios:
+                if coincide(evento):
+                    yield _evento('cupos', _cupos(evento))
+    finally:
+        difusor.cancelar(entrada)
@@ -0,0 +1,68 @@
+"""
+Etiquetas guardadas de Horario y Asignacion.
+
+El admin llama a `__str__` por cada <option> de los selectores; armar el
+texto desde profesores y días costaba una o dos consultas por opción. Las
+etiquetas se guardan en la columna `etiqueta` y se recalculan en bloque
+(docentes/signals.py) cuando cambia cualquier dato que muestran: horas y
+días del horario, profesores, plan, aula u horario de la asignación.
+Los recálculos escriben con UPDATE directos, así que no vuelven a disparar
+señales.
+"""
+from collections import defaultdict
+
+from .models import Asignacion, Horario
+
+
+def texto_horario(codigos, hora_inicio, hora_fin):
+    return f"{','.join(codigos)} {hora_inicio}–{hora_fin}"
+
+
+def texto_asignacion(profesores, plan, horario, aula):
+    profs = ', '.join(str(p) for p in profesores)
+    return f"{profs} → {getattr(plan, 'nombre', 'Plan?')} ({horario or 'sin horario'} / {aula or 'sin aula'})"
+
+
+def _guardar(modelo, objetos, nuevas):
+    cambiados = []
+    for obj in objetos:
+        if obj.etiqueta != nuevas[obj.pk]:
+            obj.etiqueta = nuevas[obj.pk]
+            cambiados.append(obj)
+    modelo.objects.bulk_update(cambiados, ['etiqueta'], batch_size=500)
+    return cambiados
+
+
+def refrescar_horarios(horario_ids):
+    """Recalcula la etiqueta de los horarios dados y la de sus asignaciones."""
+    horarios = list(Horario.objects.filter(pk__in=list(horario_ids)).only('id', 'hora_inicio', 'hora_fin', 'etiqueta'))
+    if not horarios:
+        return
+    codigos = defaultdict(list)
+    for horario_id, codigo in (
+        Horario.dias.through.objects
+        .filter(horario_id__in=[h.pk for h in horarios])
+        .order_by('dia_id')
+        .values_list('horario_id', 'dia__codigo')
+    ):
+        codigos[horario_id].append(codigo)
+    nuevas = {h.pk: texto_horario(codigos[h.pk], h.hora_inicio, h.hora_fin) for h in horarios}
+    cambiados = _guardar(Horario, horarios, nuevas)
+    if cambiados:
+        refrescar_asignaciones(horario_id__in=[h.pk for h in cambiados])
+
+
+def refrescar_asignaciones(**filtro):
+    """Recalcula la etiqueta de las asignaciones que cumplen `filtro` (o de todas)."""
+    asignaciones = list(
+        Asignacion.objects
+        .filter(**filtro)
+        .select_related('plan', 'aula', 'horario')
+        .prefetch_related('profesores')
+        .only('id', 'etiqueta', 'plan__nombre', 'aula__nombre', 'horario__etiqueta')
+    )
+    nuevas = {
+        a.pk: texto_asignacion(a.profesores.all(), a.plan, a.horario, a.aula)
+        for a in asignaciones
+    }
+    _guardar(Asignacion, asignaciones, nuevas)
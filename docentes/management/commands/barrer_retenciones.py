@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from docentes.services import barrer_retenciones
+
+
+class Command(BaseCommand):
+    help = (
+        "Libera los cupos retenidos cuyo plazo venció (registros abandonados). "
+        "Pensado para cron, p. ej. cada minuto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help="Retenciones por transacción (por defecto 500).",
+        )
+
+    def handle(self, *args, **options):
+        liberadas = barrer_retenciones(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f"{liberadas} retención(es) vencida(s) liberada(s)."))
@@ -0,0 +1,134 @@
+import datetime
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from docentes.models import Asignacion, Aula, Horario
+from docentes.services import reservar_cupo
+from estudiantes.models import Estudiante, Inscripcion, Matricula
+from planes.models import Plan
+
+PREFIJO = "BENCH-RESERVAS"
+
+
+def _reserva_legado(matricula_id, asignacion_id):
+    """Camino anterior: bloqueo de fila + COUNT + add() (solo para comparar)."""
+    asignacion = Asignacion.objects.select_for_update().get(pk=asignacion_id)
+    if asignacion.matriculas.count() >= asignacion.cupo_maximo:
+        return False
+    Matricula.objects.get(pk=matricula_id).asignaciones.add(asignacion)
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de contención: N compradores concurrentes compiten por los "
+        "cupos de una misma asignación. Reporta reservas/segundo y verifica "
+        "que no haya sobreventa. Usa la base de datos configurada (Postgres)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compradores', type=int, default=60)
+        parser.add_argument('--cupos', type=int, default=25)
+        parser.add_argument('--rondas', type=int, default=3)
+        parser.add_argument(
+            '--legado',
+            action='store_true',
+            help="Usa el camino anterior (select_for_update + COUNT) para comparar.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Este benchmark requiere PostgreSQL.")
+        compradores = options['compradores']
+        cupos = options['cupos']
+        reservar = _reserva_legado if options['legado'] else reservar_cupo
+
+        asignacion, matriculas = self._preparar(compradores, cupos)
+        try:
+            tasas = []
+            sobreventa = False
+            for ronda in range(1, options['rondas'] + 1):
+                self._reiniciar(asignacion)
+                ok, errores, duracion = self._ronda(reservar, asignacion.pk, matriculas)
+                asignacion.refresh_from_db()
+                filas = asignacion.matriculas.count()
+                tasa = compradores / duracion if duracion else 0
+                tasas.append(tasa)
+                problema = ok > cupos or filas > cupos or asignacion.ocupados != filas
+                sobreventa = sobreventa or problema
+                self.stdout.write(
+                    f"Ronda {ronda}: {compradores} compradores, {ok} reservas, "
+                    f"{errores} errores, ocupados={asignacion.ocupados}, filas={filas}/{cupos}, "
+                    f"{duracion * 1000:.1f} ms, {tasa:.0f} reservas/s"
+                )
+            self.stdout.write(f"Promedio: {sum(tasas) / len(tasas):.0f} reservas/s")
+            if sobreventa:
+                raise CommandError("Sobreventa detectada: los cupos no coinciden.")
+            self.stdout.write(self.style.SUCCESS("Sin sobreventa."))
+        finally:
+            self._limpiar(asignacion)
+
+    def _ronda(self, reservar, asignacion_id, matriculas):
+        resultados = []
+        lock = threading.Lock()
+
+        def comprador(matricula_id):
+            try:
+                # conexión abierta antes de la barrera: se mide solo la reserva
+                connection.ensure_connection()
+                barrera.wait()
+                try:
+                    with transaction.atomic():
+                        ok = reservar(matricula_id, asignacion_id)
+                except Exception:
+                    ok = None
+                with lock:
+                    resultados.append(ok)
+            finally:
+                connection.close()
+
+        marcas = []
+        barrera = threading.Barrier(len(matriculas), action=lambda: marcas.append(time.perf_counter()))
+        hilos = [threading.Thread(target=comprador, args=(m,)) for m in matriculas]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        duracion = time.perf_counter() - marcas[0]
+        ok = sum(1 for r in resultados if r)
+        errores = sum(1 for r in resultados if r is None)
+        return ok, errores, duracion
+
+    def _preparar(self, compradores, cupos):
+        with transaction.atomic():
+            plan = Plan.objects.create(nombre=PREFIJO, nivel='primaria', activo=False)
+            aula = Aula.objects.create(nombre=f"{PREFIJO}-{int(time.time())}", capacidad=cupos)
+            horario = Horario.objects.create(hora_inicio=datetime.time(7), hora_fin=datetime.time(8))
+            asignacion = Asignacion.objects.create(
+                plan=plan, aula=aula, horario=horario, cupo_maximo=cupos,
+            )
+            matriculas = []
+            for i in range(compradores):
+                est = Estudiante.objects.create(
+                    nombres=f"{PREFIJO} {i}", apellidos=PREFIJO, edad=10,
+                    grado='1° Prim', colegio=PREFIJO,
+                )
+                ins = Inscripcion.objects.create(estudiante=est, plan=plan)
+                matriculas.append(Matricula.objects.create(inscripcion=ins, estudiante=est).pk)
+        return asignacion, matriculas
+
+    def _reiniciar(self, asignacion):
+        Asignacion.matriculas.through.objects.filter(asignacion=asignacion).delete()
+        Asignacion.objects.filter(pk=asignacion.pk).update(ocupados=0)
+
+    def _limpiar(self, asignacion):
+        with transaction.atomic():
+            self._reiniciar(asignacion)
+            Estudiante.objects.filter(apellidos=PREFIJO, colegio=PREFIJO).delete()
+            asignacion.delete()
+            Aula.objects.filter(pk=asignacion.aula_id).delete()
+            Horario.objects.filter(pk=asignacion.horario_id).delete()
+            Plan.objects.filter(pk=asignacion.plan_id).delete()
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from docentes.conflictos import detectar_conflictos
+from docentes.models import Asignacion, Aula, Dia, Profesor
+
+
+class Command(BaseCommand):
+    help = (
+        "Reporta las asignaciones que se cruzan en horario: misma aula o mismo "
+        "profesor, el mismo día, en franjas (y periodos) que se solapan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--plan',
+            type=int,
+            action='append',
+            dest='planes',
+            help="Limita a las asignaciones de este plan (se puede repetir). Por defecto, todas.",
+        )
+        parser.add_argument(
+            '--estricto',
+            action='store_true',
+            help="Termina con error si hay cruces (para CI o cron).",
+        )
+
+    def handle(self, *args, **options):
+        asignaciones = Asignacion.objects.all()
+        if options['planes']:
+            asignaciones = asignaciones.filter(plan_id__in=options['planes'])
+        conflictos = detectar_conflictos(asignaciones)
+
+        if conflictos:
+            ids = {c.a for c in conflictos} | {c.b for c in conflictos}
+            etiquetas = dict(Asignacion.objects.filter(pk__in=ids).values_list('id', 'etiqueta'))
+            aulas = dict(Aula.objects.values_list('id', 'nombre'))
+            profesores = {p.pk: str(p) for p in Profesor.objects.all()}
+            dias = dict(Dia.DIAS)
+            for c in conflictos:
+                recurso = f"Aula {aulas.get(c.recurso_id, c.recurso_id)}" if c.recurso == 'aula' \
+                    else f"Profesor {profesores.get(c.recurso_id, c.recurso_id)}"
+                self.stdout.write(self.style.WARNING(
+                    f"{recurso} ({dias.get(c.dia, c.dia)}): "
+                    f"#{c.a} {etiquetas.get(c.a, '')}  ×  #{c.b} {etiquetas.get(c.b, '')}"
+                ))
+            resumen = f"{len(conflictos)} cruce(s) de horario."
+            if options['estricto']:
+                raise CommandError(resumen)
+            self.stdout.write(self.style.ERROR(resumen))
+        else:
+            self.stdout.write(self.style.SUCCESS("Sin cruces de horario."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from docentes.services import reequilibrar_grupos
+
+
+class Command(BaseCommand):
+    help = (
+        "Redistribuye los alumnos que exceden el cupo de su grupo (p. ej. tras "
+        "bajar cupo_maximo) hacia otros grupos del mismo plan y grado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--plan',
+            type=int,
+            action='append',
+            dest='planes',
+            help="Limita a este plan (se puede repetir). Por defecto, todos.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Solo muestra los movimientos, sin aplicarlos.",
+        )
+
+    def handle(self, *args, **options):
+        aplicar = not options['dry_run']
+        movimientos, sin_cupo = reequilibrar_grupos(options['planes'], aplicar=aplicar)
+
+        for matricula_id, desde, hacia in movimientos:
+            self.stdout.write(f"Matrícula {matricula_id}: asignación {desde} → {hacia}")
+        if sin_cupo:
+            self.stdout.write(self.style.WARNING(
+                f"{len(sin_cupo)} matrícula(s) exceden el cupo y no caben en otro grupo: "
+                + ", ".join(str(m) for m in sin_cupo)
+            ))
+        verbo = "movidas" if aplicar else "a mover (sin cambios)"
+        self.stdout.write(self.style.SUCCESS(f"{len(movimientos)} matrícula(s) {verbo}."))
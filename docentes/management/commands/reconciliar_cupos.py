@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from docentes.services import reconciliar_ocupados
+
+
+class Command(BaseCommand):
+    help = "Recalcula Asignacion.ocupados a partir de las matrículas registradas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Solo reporta las asignaciones desfasadas, sin corregirlas.",
+        )
+
+    def handle(self, *args, **options):
+        aplicar = not options['dry_run']
+        with transaction.atomic():
+            desfasadas = reconciliar_ocupados(aplicar=aplicar)
+
+        if not desfasadas:
+            self.stdout.write(self.style.SUCCESS("Todos los contadores están al día."))
+            return
+
+        for asignacion_id, guardado, real in desfasadas:
+            self.stdout.write(f"Asignación {asignacion_id}: {guardado} → {real}")
+        verbo = "corregidas" if aplicar else "desfasadas (sin cambios)"
+        self.stdout.write(self.style.SUCCESS(f"{len(desfasadas)} asignaciones {verbo}."))
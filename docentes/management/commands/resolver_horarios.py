@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from docentes.models import Asignacion, Aula, Horario
+from docentes.solver import LIMITE_NODOS, TIEMPO_MAX, aplicar_propuesta, resolver_horarios
+
+
+class Command(BaseCommand):
+    help = (
+        "Asigna aula y horario a las asignaciones que no los tienen, sin cruces "
+        "de aula ni de profesor y respetando la capacidad de las aulas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--asignacion',
+            type=int,
+            action='append',
+            dest='asignaciones',
+            help="Replanifica esta asignación desde cero (se puede repetir). Por defecto, las que no tienen aula u horario.",
+        )
+        parser.add_argument('--horario', type=int, action='append', dest='horarios',
+                            help="Solo propone este horario (se puede repetir).")
+        parser.add_argument('--aula', type=int, action='append', dest='aulas',
+                            help="Solo propone esta aula (se puede repetir).")
+        parser.add_argument('--limite', type=int, default=LIMITE_NODOS,
+                            help=f"Nodos de búsqueda antes de pasar al reparto voraz (por defecto {LIMITE_NODOS}).")
+        parser.add_argument('--segundos', type=float, default=TIEMPO_MAX,
+                            help=f"Tiempo máximo de búsqueda antes del reparto voraz (por defecto {TIEMPO_MAX}).")
+        parser.add_argument('--dry-run', action='store_true', help="Solo muestra la propuesta, sin aplicarla.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        resultado = resolver_horarios(
+            options['asignaciones'], options['horarios'], options['aulas'], options['limite'], options['segundos'],
+        )
+        segundos = time.perf_counter() - inicio
+
+        etiquetas = dict(Asignacion.objects.filter(pk__in=resultado.propuesta).values_list('id', 'etiqueta'))
+        horarios = dict(Horario.objects.values_list('id', 'etiqueta'))
+        aulas = dict(Aula.objects.values_list('id', 'nombre'))
+        for pk, (horario_id, aula_id) in sorted(resultado.propuesta.items()):
+            self.stdout.write(f"#{pk} {etiquetas.get(pk, '')}: {horarios[horario_id]} / {aulas[aula_id]}")
+        if resultado.sin_solucion:
+            self.stdout.write(self.style.WARNING(
+                f"{len(resultado.sin_solucion)} asignación(es) sin aula/horario compatible: "
+                + ", ".join(str(pk) for pk in resultado.sin_solucion)
+            ))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(resultado.propuesta)} asignación(es) a actualizar (sin cambios), en {segundos:.2f} s."
+            ))
+            return
+        # Las pedidas con --asignacion se replanifican aunque ya tengan aula y horario.
+        n = aplicar_propuesta(resultado.propuesta, solo_pendientes=not options['asignaciones'])
+        self.stdout.write(self.style.SUCCESS(f"{n} asignación(es) actualizadas en {segundos:.2f} s."))
+        if n < len(resultado.propuesta):
+            self.stdout.write(self.style.WARNING(
+                f"{len(resultado.propuesta) - n} asignación(es) cambiaron mientras se resolvía y no se aplicaron."
+            ))
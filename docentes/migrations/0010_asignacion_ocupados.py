@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:49
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_ocupados(apps, schema_editor):
+    Asignacion = apps.get_model('docentes', 'Asignacion')
+    Matricula = apps.get_model('estudiantes', 'Matricula')
+    through = Matricula.asignaciones.through
+    conteos = (
+        through.objects
+        .values('asignacion_id')
+        .annotate(n=Count('id'))
+        .values_list('asignacion_id', 'n')
+    )
+    for asignacion_id, n in conteos:
+        Asignacion.objects.filter(pk=asignacion_id).update(ocupados=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0009_alter_asignacion_precio'),
+        ('estudiantes', '0015_alter_estudiante_options_alter_inscripcion_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asignacion',
+            name='ocupados',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(poblar_ocupados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# Cada cambio de cupos de una asignación (incluidos los UPDATE directos de
+# docentes.services) se publica en el canal "cupos" al confirmarse la
+# transacción; lo consume docentes.cupos_en_vivo para el stream SSE.
+CREAR = """
+CREATE OR REPLACE FUNCTION docentes_notificar_cupos() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('cupos', json_build_object(
+        'id', NEW.id,
+        'grado', NEW.grado,
+        'ocupados', NEW.ocupados,
+        'cupo_maximo', NEW.cupo_maximo
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER docentes_asignacion_notificar_cupos
+AFTER UPDATE OF ocupados, cupo_maximo ON docentes_asignacion
+FOR EACH ROW
+WHEN (OLD.ocupados IS DISTINCT FROM NEW.ocupados OR OLD.cupo_maximo IS DISTINCT FROM NEW.cupo_maximo)
+EXECUTE FUNCTION docentes_notificar_cupos();
+"""
+
+BORRAR = """
+DROP TRIGGER IF EXISTS docentes_asignacion_notificar_cupos ON docentes_asignacion;
+DROP FUNCTION IF EXISTS docentes_notificar_cupos();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0010_asignacion_ocupados'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREAR, BORRAR),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:11
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def poblar_etiquetas(apps, schema_editor):
+    # Mismo formato que docentes.etiquetas (los modelos históricos no tienen __str__).
+    Horario = apps.get_model('docentes', 'Horario')
+    Asignacion = apps.get_model('docentes', 'Asignacion')
+
+    codigos = defaultdict(list)
+    for horario_id, codigo in Horario.dias.through.objects.order_by('dia_id').values_list('horario_id', 'dia__codigo'):
+        codigos[horario_id].append(codigo)
+    horarios = list(Horario.objects.all())
+    for h in horarios:
+        h.etiqueta = f"{','.join(codigos[h.pk])} {h.hora_inicio}–{h.hora_fin}"
+    Horario.objects.bulk_update(horarios, ['etiqueta'], batch_size=500)
+
+    asignaciones = list(Asignacion.objects.select_related('plan', 'aula', 'horario').prefetch_related('profesores'))
+    for a in asignaciones:
+        profs = ', '.join(f"{p.apellidos}, {p.nombres}" for p in a.profesores.all())
+        plan = a.plan.nombre if a.plan else 'Plan?'
+        a.etiqueta = f"{profs} → {plan} ({a.horario.etiqueta} / {a.aula.nombre})"
+    Asignacion.objects.bulk_update(asignaciones, ['etiqueta'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0011_asignacion_notificar_cupos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asignacion',
+            name='etiqueta',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='horario',
+            name='etiqueta',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(poblar_etiquetas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0012_etiquetas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='asignacion',
+            name='aula',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='docentes.aula'),
+        ),
+        migrations.AlterField(
+            model_name='asignacion',
+            name='horario',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='docentes.horario'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# El trigger de cupos en vivo (0011) también publica y vigila `retenidos`.
+CREAR = """
+CREATE OR REPLACE FUNCTION docentes_notificar_cupos() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('cupos', json_build_object(
+        'id', NEW.id,
+        'grado', NEW.grado,
+        'ocupados', NEW.ocupados,
+        'retenidos', NEW.retenidos,
+        'cupo_maximo', NEW.cupo_maximo
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS docentes_asignacion_notificar_cupos ON docentes_asignacion;
+CREATE TRIGGER docentes_asignacion_notificar_cupos
+AFTER UPDATE OF ocupados, retenidos, cupo_maximo ON docentes_asignacion
+FOR EACH ROW
+WHEN (OLD.ocupados IS DISTINCT FROM NEW.ocupados
+      OR OLD.retenidos IS DISTINCT FROM NEW.retenidos
+      OR OLD.cupo_maximo IS DISTINCT FROM NEW.cupo_maximo)
+EXECUTE FUNCTION docentes_notificar_cupos();
+"""
+
+RESTAURAR = """
+CREATE OR REPLACE FUNCTION docentes_notificar_cupos() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('cupos', json_build_object(
+        'id', NEW.id,
+        'grado', NEW.grado,
+        'ocupados', NEW.ocupados,
+        'cupo_maximo', NEW.cupo_maximo
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS docentes_asignacion_notificar_cupos ON docentes_asignacion;
+CREATE TRIGGER docentes_asignacion_notificar_cupos
+AFTER UPDATE OF ocupados, cupo_maximo ON docentes_asignacion
+FOR EACH ROW
+WHEN (OLD.ocupados IS DISTINCT FROM NEW.ocupados OR OLD.cupo_maximo IS DISTINCT FROM NEW.cupo_maximo)
+EXECUTE FUNCTION docentes_notificar_cupos();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0013_asignacion_aula_horario_opcionales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asignacion',
+            name='retenidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='RetencionCupo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('expira', models.DateTimeField(db_index=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('asignacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retenciones', to='docentes.asignacion')),
+            ],
+            options={
+                'verbose_name': 'Retención de cupo',
+                'verbose_name_plural': 'Retenciones de cupo',
+            },
+        ),
+        migrations.RunSQL(CREAR, RESTAURAR),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0014_retenciones_cupo'),
+        ('estudiantes', '0016_matricula_fecha_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EsperaCupo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encolada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('asignacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='docentes.asignacion')),
+                ('matricula', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='estudiantes.matricula')),
+            ],
+            options={
+                'verbose_name': 'Espera de cupo',
+                'verbose_name_plural': 'Esperas de cupo',
+                'indexes': [models.Index(fields=['asignacion', 'encolada', 'id'], name='espera_cola_idx')],
+                'constraints': [models.UniqueConstraint(fields=('asignacion', 'matricula'), name='uniq_espera_asignacion_matricula')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 class Curso(models.Model):
     nombre = models.CharField(max_length=100)
     # Eliminamos el campo `nivel` para simplificar el modelo.
@@ -45,10 +46,15 @@ class Horario(models.Model):
     # Los días ahora se modelan con una relación ManyToMany a Dia
     # Esto permite horarios que se repiten varios días (ej: lun/mie/vie 16:00-19:00)
     dias = models.ManyToManyField('docentes.Dia', related_name='horarios')
+    # Texto de __str__ guardado para los selectores del admin; lo mantiene
+    # al día docentes.etiquetas (ver docentes/signals.py).
+    etiqueta = models.CharField(max_length=100, blank=True, editable=False)
 
     def __str__(self):
-        dias_list = ','.join([d.codigo for d in self.dias.all()])
-        return f"{dias_list} {self.hora_inicio}–{self.hora_fin}"
+        if self.etiqueta:
+            return self.etiqueta
+        from .etiquetas import texto_horario
+        return texto_horario([], self.hora_inicio, self.hora_fin)
     class Meta:
         verbose_name = "Horario"
         verbose_name_plural = "Horarios"
@@ -77,12 +83,21 @@ class Asignacion(models.Model):
     # Temporalmente permitimos NULL para poder introducir la columna y
     # rellenarla con una migración de datos antes de exigir NOT NULL.
     plan = models.ForeignKey('planes.Plan', on_delete=models.PROTECT, related_name='asignaciones', null=True, blank=True)
-    aula = models.ForeignKey('docentes.Aula', on_delete=models.PROTECT)
-    horario = models.ForeignKey('docentes.Horario', on_delete=models.PROTECT)
+    # Vacíos mientras el grupo no tiene aula/horario: los asigna a mano el
+    # admin o en bloque el solver (docentes.solver).
+    aula = models.ForeignKey('docentes.Aula', on_delete=models.PROTECT, null=True, blank=True)
+    horario = models.ForeignKey('docentes.Horario', on_delete=models.PROTECT, null=True, blank=True)
     fecha_inicio = models.DateField(null=True, blank=True)
     fecha_fin = models.DateField(null=True, blank=True)
     # Capacidad por grupo/asignación
     cupo_maximo = models.PositiveIntegerField(default=30)
+    # Contador desnormalizado de matrículas del grupo. Se actualiza en la misma
+    # transacción que agrega/quita filas de `Matricula.asignaciones` (ver
+    # `estudiantes.signals`) y se recalcula con `manage.py reconciliar_cupos`.
+    ocupados = models.PositiveIntegerField(default=0, editable=False)
+    # Cupos apartados temporalmente por apoderados que están a mitad del
+    # registro (RetencionCupo). Cuentan contra cupo_maximo junto a `ocupados`.
+    retenidos = models.PositiveIntegerField(default=0, editable=False)
     precio = models.DecimalField(
             "Precio",
             max_digits=7,
@@ -91,9 +106,19 @@ class Asignacion(models.Model):
             validators=[MinValueValidator(0)],
             help_text="Costo en soles de esta asignación (por alumno).",
         )
+    # Texto de __str__ guardado (profesores → plan (horario / aula)); ver docentes.etiquetas.
+    etiqueta = models.TextField(blank=True, editable=False)
+
     def __str__(self):
-        profs = ', '.join(str(p) for p in self.profesores.all())
-        return f"{profs} → {getattr(self.plan, 'nombre', 'Plan?')} ({self.horario} / {self.aula})"
+        if self.etiqueta:
+            return self.etiqueta
+        from .etiquetas import texto_asignacion
+        profesores = self.profesores.all() if self.pk else ()
+        return texto_asignacion(profesores, self.plan, self.horario, self.aula)
+
+    @property
+    def disponibles(self):
+        return max(self.cupo_maximo - self.ocupados - self.retenidos, 0)
 
     class Meta:
         verbose_name = "Asignación"
@@ -117,4 +142,49 @@ class Dia(models.Model):
         return self.get_codigo_display()
     class Meta:
         verbose_name = "Día"
-        verbose_name_plural = "Días"
\ No newline at end of file
+        verbose_name_plural = "Días"
+
+
+class RetencionCupo(models.Model):
+    """
+    Cupo apartado por unos minutos desde que el apoderado elige la
+    asignación (primer paso del registro) hasta que registra el pago, donde
+    se convierte en la reserva real. Las vencidas las libera
+    `docentes.services.barrer_retenciones`.
+    """
+    asignacion = models.ForeignKey('docentes.Asignacion', on_delete=models.CASCADE, related_name='retenciones')
+    # Token guardado en la sesión del apoderado: una retención por registro.
+    clave = models.CharField(max_length=64, unique=True)
+    expira = models.DateTimeField(db_index=True)
+    creada = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Retención de {self.asignacion_id} hasta {self.expira:%H:%M}"
+
+    class Meta:
+        verbose_name = "Retención de cupo"
+        verbose_name_plural = "Retenciones de cupo"
+
+
+class EsperaCupo(models.Model):
+    """
+    Lista de espera de una asignación llena: la matrícula queda encolada
+    en orden de llegada y, cuando se libera un cupo, la primera de la cola
+    lo recibe en la misma transacción (`docentes.services.promover_espera`).
+    """
+    asignacion = models.ForeignKey('docentes.Asignacion', on_delete=models.CASCADE, related_name='esperas')
+    matricula = models.ForeignKey('estudiantes.Matricula', on_delete=models.CASCADE, related_name='esperas')
+    encolada = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Matrícula {self.matricula_id} en espera de {self.asignacion_id}"
+
+    class Meta:
+        verbose_name = "Espera de cupo"
+        verbose_name_plural = "Esperas de cupo"
+        constraints = [
+            models.UniqueConstraint(fields=['asignacion', 'matricula'], name='uniq_espera_asignacion_matricula'),
+        ]
+        indexes = [
+            models.Index(fields=['asignacion', 'encolada', 'id'], name='espera_cola_idx'),
+        ]
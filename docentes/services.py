@@ -0,0 +1,473 @@
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import catalogo
+from .models import Asignacion, EsperaCupo, RetencionCupo
+from .tareas import aviso_cupo_asignado
+
+RETENCION_MINUTOS = 15
+
+
+def ajustar_ocupados(deltas):
+    """
+    Aplica variaciones al contador `Asignacion.ocupados`.
+    `deltas` es un dict {asignacion_id: +n/-n}. Se agrupan por valor para
+    emitir un UPDATE por cada delta distinto (normalmente uno solo).
+    """
+    por_delta = defaultdict(list)
+    for asignacion_id, delta in deltas.items():
+        if asignacion_id and delta:
+            por_delta[delta].append(asignacion_id)
+    for delta, ids in por_delta.items():
+        Asignacion.objects.filter(pk__in=ids).update(
+            ocupados=Greatest(F('ocupados') + delta, Value(0))
+        )
+    if por_delta:
+        catalogo.invalidar_cupos([pk for ids in por_delta.values() for pk in ids])
+    liberadas = [pk for pk, delta in deltas.items() if pk and delta and delta < 0]
+    if liberadas:
+        promover_espera(liberadas)
+
+
+def _conteo_real():
+    through = Asignacion.matriculas.through
+    return Coalesce(
+        Subquery(
+            through.objects
+            .filter(asignacion_id=OuterRef('pk'))
+            .values('asignacion_id')
+            .annotate(n=Count('id'))
+            .values('n')
+        ),
+        Value(0),
+    )
+
+
+def reconciliar_ocupados(aplicar=True):
+    """
+    Recalcula `ocupados` desde la tabla intermedia de matrículas.
+    Devuelve una lista de (asignacion_id, ocupados_guardado, ocupados_real)
+    con las asignaciones que estaban desfasadas.
+    """
+    desfasadas = list(
+        Asignacion.objects
+        .annotate(real=_conteo_real())
+        .exclude(ocupados=F('real'))
+        .order_by('id')
+        .values_list('id', 'ocupados', 'real')
+    )
+    if aplicar and desfasadas:
+        ids = [d[0] for d in desfasadas]
+        Asignacion.objects.filter(pk__in=ids).update(ocupados=_conteo_real())
+        catalogo.invalidar_cupos(ids)
+    return desfasadas
+
+
+_SQL_RESERVAR = """
+WITH soltada AS (
+    DELETE FROM {retencion}
+     WHERE clave = %(clave)s AND asignacion_id = %(asignacion)s
+ RETURNING id
+),
+previa AS (
+    SELECT a.id,
+           (SELECT count(*) FROM soltada) AS soltadas,
+           a.ocupados + a.retenidos - (SELECT count(*) FROM soltada) < a.cupo_maximo
+           AND NOT EXISTS (
+               SELECT 1 FROM {through}
+                WHERE matricula_id = %(matricula)s AND asignacion_id = %(asignacion)s
+           ) AS libre
+      FROM {asignacion} a
+     WHERE a.id = %(asignacion)s
+       FOR UPDATE
+),
+reserva AS (
+    UPDATE {asignacion} a
+       SET ocupados = a.ocupados + CASE WHEN p.libre THEN 1 ELSE 0 END,
+           retenidos = GREATEST(a.retenidos - p.soltadas, 0)
+      FROM previa p
+     WHERE a.id = p.id AND (p.libre OR p.soltadas > 0)
+ RETURNING a.id, a.grado, p.libre
+)
+INSERT INTO {through} (matricula_id, asignacion_id)
+SELECT %(matricula)s, id FROM reserva WHERE libre
+RETURNING (SELECT grado FROM reserva)
+"""
+
+
+def reclamar_cupo(matricula_id, asignacion_id, retencion=None):
+    """
+    Toma un cupo de la asignación para la matrícula con una sola sentencia:
+    suelta la retención `retencion` (si la hay), bloquea la fila de la
+    asignación, comprueba `ocupados + retenidos < cupo_maximo` y, si hay
+    lugar, suma el cupo e inserta la fila intermedia. No hay COUNT ni
+    consultas previas, y la fila queda bloqueada solo hasta el commit.
+
+    No abre bloque atómico propio: si la matrícula puede tener ya el cupo
+    (reintentos concurrentes) use `reservar_cupo`. Devuelve True si tomó el
+    cupo en esta llamada.
+    """
+    through = Asignacion.matriculas.through
+    sql = _SQL_RESERVAR.format(
+        asignacion=connection.ops.quote_name(Asignacion._meta.db_table),
+        through=connection.ops.quote_name(through._meta.db_table),
+        retencion=connection.ops.quote_name(RetencionCupo._meta.db_table),
+    )
+    params = {'asignacion': asignacion_id, 'matricula': matricula_id, 'clave': retencion or ''}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        fila = cursor.fetchone()
+    if fila is None:
+        return False
+    # La sentencia devuelve el grado: el catálogo se invalida sin otra consulta.
+    catalogo.invalidar_cupos([asignacion_id], fila)
+    return True
+
+
+def reservar_cupo(matricula_id, asignacion_id, retencion=None):
+    """
+    Reserva un cupo de la asignación para la matrícula (ver `reclamar_cupo`).
+    Con `retencion` (la clave guardada en la sesión) el cupo apartado para
+    esa clave se convierte en la reserva dentro de la misma sentencia.
+
+    Es idempotente: si la matrícula ya tiene el cupo devuelve True sin volver
+    a contarlo. Devuelve False si la asignación no existe o está llena.
+    """
+    try:
+        with transaction.atomic():
+            if reclamar_cupo(matricula_id, asignacion_id, retencion):
+                return True
+    except IntegrityError:
+        # Otra transacción reservó el mismo par (matrícula, asignación).
+        pass
+    # Sin fila: o ya estaba reservado (idempotente) o no quedan cupos.
+    through = Asignacion.matriculas.through
+    return through.objects.filter(matricula_id=matricula_id, asignacion_id=asignacion_id).exists()
+
+
+def liberar_cupos(matricula_ids):
+    """
+    Quita todas las asignaciones de las matrículas dadas y descuenta sus
+    cupos en bloque (DELETE ... RETURNING + un UPDATE por delta).
+    Devuelve {asignacion_id: cupos_liberados}.
+    """
+    matricula_ids = list(matricula_ids)
+    if not matricula_ids:
+        return {}
+    through = Asignacion.matriculas.through
+    tabla = connection.ops.quote_name(through._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {tabla} WHERE matricula_id = ANY(%s) RETURNING asignacion_id",
+                [matricula_ids],
+            )
+            liberados = defaultdict(int)
+            for (asignacion_id,) in cursor.fetchall():
+                liberados[asignacion_id] += 1
+        ajustar_ocupados({pk: -n for pk, n in liberados.items()})
+    return dict(liberados)
+
+
+# --- Retenciones de cupo --------------------------------------------------
+#
+# Mientras el apoderado completa el registro su cupo queda apartado unos
+# minutos: `retenidos` cuenta contra cupo_maximo igual que `ocupados`, así
+# que quien llega tarde a los últimos cupos se entera en el primer paso y
+# no después de subir comprobantes.
+
+def _liberar_retenciones(qs, promover=True):
+    """
+    Borra las retenciones del queryset y descuenta `retenidos`; con
+    `promover` el cupo pasa a la lista de espera. Devuelve cuántas liberó.
+    """
+    tabla = connection.ops.quote_name(RetencionCupo._meta.db_table)
+    sql, params = qs.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {tabla} WHERE id IN ({sql}) RETURNING asignacion_id", params)
+        liberadas = defaultdict(int)
+        for (asignacion_id,) in cursor.fetchall():
+            liberadas[asignacion_id] += 1
+    por_delta = defaultdict(list)
+    for asignacion_id, n in liberadas.items():
+        por_delta[n].append(asignacion_id)
+    for n, ids in por_delta.items():
+        Asignacion.objects.filter(pk__in=ids).update(retenidos=Greatest(F('retenidos') - n, Value(0)))
+    catalogo.invalidar_cupos(list(liberadas))
+    if promover and liberadas:
+        promover_espera(liberadas)
+    return sum(liberadas.values())
+
+
+def _tomar_retencion(asignacion_id):
+    tomado = Asignacion.objects.filter(
+        pk=asignacion_id, cupo_maximo__gt=F('ocupados') + F('retenidos'),
+    ).update(retenidos=F('retenidos') + 1)
+    if tomado:
+        catalogo.invalidar_cupos([asignacion_id])
+    return tomado
+
+
+@transaction.atomic
+def retener_cupo(asignacion_id, clave, minutos=RETENCION_MINUTOS):
+    """
+    Aparta un cupo de la asignación para `clave` durante `minutos`. Si la
+    clave ya retenía esta asignación solo renueva el vencimiento; si retenía
+    otra, la suelta una vez tomado el cupo nuevo. Devuelve False si no quedan
+    cupos libres; en ese caso la retención anterior se conserva.
+    """
+    expira = timezone.now() + datetime.timedelta(minutes=minutos)
+    actual = RetencionCupo.objects.select_for_update().filter(clave=clave).first()
+    if actual is not None and actual.asignacion_id == asignacion_id:
+        RetencionCupo.objects.filter(pk=actual.pk).update(expira=expira)
+        return True
+
+    tomado = _tomar_retencion(asignacion_id)
+    if not tomado:
+        # Puede que lo ocupen retenciones vencidas que el barrido aún no soltó.
+        vencidas = RetencionCupo.objects.filter(asignacion_id=asignacion_id, expira__lte=timezone.now())
+        if _liberar_retenciones(vencidas):
+            tomado = _tomar_retencion(asignacion_id)
+    if not tomado:
+        return False
+    if actual is not None:
+        _liberar_retenciones(RetencionCupo.objects.filter(pk=actual.pk))
+    RetencionCupo.objects.create(asignacion_id=asignacion_id, clave=clave, expira=expira)
+    return True
+
+
+def soltar_retencion(clave):
+    """Libera la retención de `clave` (si la hay), p. ej. al abandonar el registro."""
+    with transaction.atomic():
+        return _liberar_retenciones(RetencionCupo.objects.filter(clave=clave))
+
+
+def barrer_retenciones(lote=500):
+    """
+    Libera las retenciones vencidas en lotes de `lote` filas (una transacción
+    corta por lote, usando el índice de `expira`). SKIP LOCKED evita esperar
+    a las que se están convirtiendo en reserva en ese momento.
+    Devuelve el total liberado.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                RetencionCupo.objects
+                .filter(expira__lte=timezone.now())
+                .order_by('expira')
+                .select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:lote]
+            )
+            if not ids:
+                return total
+            total += _liberar_retenciones(RetencionCupo.objects.filter(pk__in=ids))
+        if len(ids) < lote:
+            return total
+
+
+# --- Lista de espera ------------------------------------------------------
+#
+# Cuando la asignación está llena la matrícula se encola en EsperaCupo en
+# lugar de perder la inscripción. Todo camino que libera cupos (quitar
+# asignaciones, borrar matrículas, soltar retenciones) termina en
+# ajustar_ocupados o _liberar_retenciones, que llaman a promover_espera
+# dentro de la misma transacción: el cupo pasa a la cabeza de la cola antes
+# de que nadie más lo vea libre, y el aviso sale por la cola de tareas solo
+# si esa transacción se confirma.
+
+def encolar_espera(matricula_id, asignacion_id):
+    """
+    Pone la matrícula en la lista de espera de la asignación (idempotente).
+    Devuelve su puesto en la cola, empezando en 1.
+    """
+    entrada, _ = EsperaCupo.objects.get_or_create(matricula_id=matricula_id, asignacion_id=asignacion_id)
+    return EsperaCupo.objects.filter(asignacion_id=asignacion_id).filter(
+        Q(encolada__lt=entrada.encolada) | Q(encolada=entrada.encolada, id__lte=entrada.pk)
+    ).count()
+
+
+@transaction.atomic
+def promover_espera(asignacion_ids):
+    """
+    Entrega los cupos libres de las asignaciones dadas a sus listas de espera,
+    en orden de llegada, y encola el aviso para cada matrícula promovida.
+    Con las colas vacías cuesta una sola consulta. Devuelve
+    [(matricula_id, asignacion_id)] promovidas.
+    """
+    con_cola = sorted(set(
+        EsperaCupo.objects.filter(asignacion_id__in=list(asignacion_ids))
+        .values_list('asignacion_id', flat=True).distinct()
+    ))
+    through = Asignacion.matriculas.through
+    promovidas = []
+    for asignacion_id in con_cola:
+        while True:
+            # SKIP LOCKED: otra transacción ya está promoviendo esa entrada.
+            entrada = (
+                EsperaCupo.objects
+                .filter(asignacion_id=asignacion_id)
+                .select_for_update(skip_locked=True)
+                .order_by('encolada', 'id')
+                .first()
+            )
+            if entrada is None:
+                break
+            if through.objects.filter(matricula_id=entrada.matricula_id, asignacion_id=asignacion_id).exists():
+                # Ya tiene el cupo (p. ej. se lo asignaron a mano): sale de la cola.
+                entrada.delete()
+                continue
+            if not reservar_cupo(entrada.matricula_id, asignacion_id):
+                break
+            entrada.delete()
+            promovidas.append((entrada.matricula_id, asignacion_id))
+            aviso_cupo_asignado.encolar(matricula_id=entrada.matricula_id, asignacion_id=asignacion_id)
+    return promovidas
+
+
+# --- Asignación automática de grupos -------------------------------------
+#
+# Un "grupo" es una Asignacion del plan de la inscripción cuyo grado (si lo
+# tiene) coincide con el del estudiante. El asignador trabaja por lotes:
+# bloquea los grupos candidatos en orden de id (orden fijo, sin deadlocks
+# entre asignadores concurrentes), reparte en memoria hacia el grupo menos
+# lleno y escribe todas las filas intermedias con un solo bulk_create.
+
+def _bloquear_grupos(plan_ids):
+    return list(
+        Asignacion.objects
+        .filter(plan_id__in=plan_ids)
+        .select_for_update()
+        .order_by('id')
+        .only('id', 'plan_id', 'grado', 'ocupados', 'retenidos', 'cupo_maximo')
+    )
+
+
+def _repartir(pendientes, grupos):
+    """
+    pendientes: [(matricula_id, plan_id, grado, asignacion_preferida_id, actuales)].
+    Asigna cada matrícula a la preferida si tiene cupo o, si no, al grupo
+    compatible con menor ocupación relativa, saltando los grupos de
+    `actuales` (ids en los que ya está). Modifica `ocupados` en memoria.
+    Devuelve ({matricula_id: asignacion_id}, [matricula_id sin cupo]).
+    """
+    por_plan = defaultdict(list)
+    for g in grupos:
+        por_plan[g.plan_id].append(g)
+    asignadas, sin_cupo = {}, []
+    for matricula_id, plan_id, grado, preferida, actuales in pendientes:
+        libres = [
+            g for g in por_plan.get(plan_id, ())
+            if (not g.grado or g.grado == grado) and g.pk not in actuales
+            and g.ocupados + g.retenidos < g.cupo_maximo
+        ]
+        if not libres:
+            sin_cupo.append(matricula_id)
+            continue
+        elegida = next((g for g in libres if g.pk == preferida), None) or min(
+            libres, key=lambda g: (g.ocupados / g.cupo_maximo, g.ocupados, g.pk)
+        )
+        elegida.ocupados += 1
+        asignadas[matricula_id] = elegida.pk
+    return asignadas, sin_cupo
+
+
+def _escribir_grupos(asignadas, grupos, inscripcion_por_matricula):
+    from estudiantes.models import Inscripcion
+    from pagos import recaudo
+
+    through = Asignacion.matriculas.through
+    through.objects.bulk_create(
+        [through(matricula_id=m, asignacion_id=a) for m, a in asignadas.items()],
+        batch_size=1000,
+    )
+    # Los grupos están bloqueados: `ocupados` en memoria es el valor exacto.
+    Asignacion.objects.bulk_update(grupos, ['ocupados'], batch_size=1000)
+    Inscripcion.objects.bulk_update(
+        [Inscripcion(pk=inscripcion_por_matricula[m], asignacion_id=a) for m, a in asignadas.items()],
+        ['asignacion'],
+        batch_size=1000,
+    )
+    # Los pagos ya aprobados siguen a su inscripción en el recaudo por asignación.
+    recaudo.reasignar(inscripcion_por_matricula[m] for m in asignadas)
+    catalogo.invalidar_cupos([g.pk for g in grupos], [g.grado for g in grupos])
+
+
+@transaction.atomic
+def asignar_grupos(matricula_ids):
+    """
+    Asigna un grupo a cada matrícula dada que aún no tenga ninguno.
+    Devuelve ({matricula_id: asignacion_id}, [matricula_id sin cupo]).
+    """
+    from estudiantes.models import Matricula
+
+    through = Asignacion.matriculas.through
+    filas = list(
+        Matricula.objects
+        .filter(pk__in=matricula_ids)
+        .exclude(Exists(through.objects.filter(matricula_id=OuterRef('pk'))))
+        .order_by('pk')
+        .values_list('pk', 'inscripcion_id', 'inscripcion__plan_id', 'estudiante__grado', 'inscripcion__asignacion_id')
+    )
+    if not filas:
+        return {}, []
+    grupos = _bloquear_grupos({f[2] for f in filas})
+    asignadas, sin_cupo = _repartir([(f[0], f[2], f[3], f[4], ()) for f in filas], grupos)
+    if asignadas:
+        _escribir_grupos(asignadas, grupos, {f[0]: f[1] for f in filas})
+    return asignadas, sin_cupo
+
+
+@transaction.atomic
+def reequilibrar_grupos(plan_ids=None, aplicar=True):
+    """
+    Tras bajar `cupo_maximo` (o si `ocupados` quedó desfasado), mueve los
+    alumnos que exceden la capacidad de cada grupo (los últimos en entrar) a
+    otros grupos compatibles con cupo, usando el mismo reparto que
+    `asignar_grupos`. Los que no caben en ningún lado se quedan donde están.
+    Devuelve una lista de (matricula_id, desde, hacia) y los que no se movieron.
+    """
+    qs = Asignacion.objects.exclude(plan_id=None)
+    if plan_ids:
+        qs = qs.filter(plan_id__in=plan_ids)
+    grupos = _bloquear_grupos(qs.values('plan_id'))
+    if not grupos:
+        return [], []
+    por_id = {g.pk: g for g in grupos}
+
+    through = Asignacion.matriculas.through
+    miembros = defaultdict(list)
+    # Grupos en los que ya está cada matrícula: moverla a uno de ellos
+    # duplicaría la fila intermedia.
+    actuales = defaultdict(set)
+    for fila in (
+        through.objects
+        .filter(asignacion_id__in=por_id)
+        .order_by('asignacion_id', 'id')
+        .values_list('id', 'asignacion_id', 'matricula_id', 'matricula__inscripcion_id', 'matricula__estudiante__grado')
+    ):
+        miembros[fila[1]].append(fila)
+        actuales[fila[2]].add(fila[1])
+
+    excedentes, origen = [], {}
+    for g in grupos:
+        filas = miembros.get(g.pk, [])
+        g.ocupados = min(len(filas), g.cupo_maximo)
+        for through_id, _, matricula_id, inscripcion_id, grado in filas[g.cupo_maximo:]:
+            excedentes.append((matricula_id, g.plan_id, grado, None, actuales[matricula_id]))
+            origen[matricula_id] = (through_id, g, inscripcion_id)
+
+    asignadas, sin_cupo = _repartir(excedentes, grupos)
+    for matricula_id in sin_cupo:
+        origen[matricula_id][1].ocupados += 1
+    movimientos = [(m, origen[m][1].pk, a) for m, a in asignadas.items()]
+
+    if aplicar:
+        through.objects.filter(pk__in=[origen[m][0] for m in asignadas]).delete()
+        _escribir_grupos(asignadas, grupos, {m: origen[m][2] for m in asignadas})
+    return movimientos, sin_cupo
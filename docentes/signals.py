@@ -0,0 +1,101 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from planes.models import Plan
+from . import catalogo, etiquetas
+from .models import Asignacion, Aula, Dia, Horario, Profesor
+
+# Cambios que alteran el JSON del catálogo de asignaciones. Los cupos
+# (`ocupados`) se actualizan con UPDATE directos y renuevan solo el sello de
+# sus grados desde docentes.services (catalogo.invalidar_cupos).
+_MODELOS_CATALOGO = (Asignacion, Aula, Dia, Horario, Profesor, Plan)
+
+
+def _invalidar_catalogo(sender, **kwargs):
+    catalogo.invalidar()
+
+
+for _modelo in _MODELOS_CATALOGO:
+    post_save.connect(_invalidar_catalogo, sender=_modelo, dispatch_uid=f'catalogo_save_{_modelo._meta.label}')
+    post_delete.connect(_invalidar_catalogo, sender=_modelo, dispatch_uid=f'catalogo_delete_{_modelo._meta.label}')
+
+
+@receiver(m2m_changed, sender=Asignacion.profesores.through)
+@receiver(m2m_changed, sender=Horario.dias.through)
+def catalogo_m2m_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        catalogo.invalidar()
+
+
+# --- Etiquetas guardadas (docentes.etiquetas) ------------------------------
+#
+# Las relaciones M2M se pueden editar desde cualquiera de los dos lados: con
+# `reverse` la instancia es el Dia/Profesor y `pk_set` trae los horarios o
+# asignaciones afectados. En `clear` desde ese lado `pk_set` llega vacío, así
+# que los afectados se anotan en pre_clear.
+
+_CAMPOS_ETIQUETA_HORARIO = {'hora_inicio', 'hora_fin'}
+_CAMPOS_ETIQUETA_ASIGNACION = {'plan', 'plan_id', 'aula', 'aula_id', 'horario', 'horario_id'}
+
+
+def _toca(update_fields, campos):
+    return update_fields is None or bool(campos & set(update_fields))
+
+
+@receiver(post_save, sender=Horario)
+def horario_etiqueta(sender, instance, update_fields=None, **kwargs):
+    if _toca(update_fields, _CAMPOS_ETIQUETA_HORARIO):
+        etiquetas.refrescar_horarios([instance.pk])
+
+
+@receiver(post_save, sender=Asignacion)
+def asignacion_etiqueta(sender, instance, update_fields=None, **kwargs):
+    if _toca(update_fields, _CAMPOS_ETIQUETA_ASIGNACION):
+        etiquetas.refrescar_asignaciones(pk=instance.pk)
+
+
+@receiver(post_save, sender=Dia)
+def dia_etiqueta(sender, instance, **kwargs):
+    etiquetas.refrescar_horarios(instance.horarios.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Profesor)
+def profesor_etiqueta(sender, instance, **kwargs):
+    etiquetas.refrescar_asignaciones(profesores=instance.pk)
+
+
+@receiver(post_save, sender=Plan)
+def plan_etiqueta(sender, instance, **kwargs):
+    etiquetas.refrescar_asignaciones(plan_id=instance.pk)
+
+
+@receiver(post_save, sender=Aula)
+def aula_etiqueta(sender, instance, **kwargs):
+    etiquetas.refrescar_asignaciones(aula_id=instance.pk)
+
+
+def _afectados_m2m(instance, action, reverse, pk_set, relacionados):
+    if not reverse:
+        return [instance.pk]
+    if action == 'pre_clear':
+        instance._etiquetas_afectadas = list(relacionados(instance).values_list('pk', flat=True))
+        return []
+    if action == 'post_clear':
+        return getattr(instance, '_etiquetas_afectadas', [])
+    return list(pk_set or ())
+
+
+@receiver(m2m_changed, sender=Horario.dias.through)
+def horario_dias_etiqueta(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        ids = _afectados_m2m(instance, action, reverse, pk_set, lambda dia: dia.horarios.all())
+        if ids and action != 'pre_clear':
+            etiquetas.refrescar_horarios(ids)
+
+
+@receiver(m2m_changed, sender=Asignacion.profesores.through)
+def asignacion_profesores_etiqueta(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        ids = _afectados_m2m(instance, action, reverse, pk_set, lambda profesor: profesor.asignaciones.all())
+        if ids and action != 'pre_clear':
+            etiquetas.refrescar_asignaciones(pk__in=ids)
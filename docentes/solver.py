@@ -0,0 +1,376 @@
+"""
+Asignación automática de aula y horario a las asignaciones (grupos).
+
+Cada asignación sin aula u horario es una variable cuyo dominio son los
+pares (horario, aula) posibles: aulas con `capacidad >= cupo_maximo` y, si
+la asignación ya tiene fijado uno de los dos, solo los pares que lo
+respetan. Dos variables chocan si usan la misma aula, o comparten un
+profesor, en horarios que se cruzan (algún día en común y franjas que se
+solapan, ver docentes.conflictos) dentro de periodos que también se cruzan.
+Las asignaciones que ya tienen aula y horario son fijas: solo podan los
+dominios.
+
+La búsqueda es backtracking con propagación hacia adelante: se elige la
+variable con menos valores posibles (MRV, desempate por número de
+profesores y cupo) y se prueban primero las aulas más ajustadas a su cupo
+y los horarios menos usados. Al asignar se quitan de los dominios vecinos
+los valores incompatibles y, si alguno queda vacío, se descarta el valor.
+Si la búsqueda agota su presupuesto (nodos o segundos) o el problema no tiene
+solución completa, una pasada voraz con el mismo orden asigna lo que
+pueda y deja el resto en `sin_solucion`.
+"""
+import time
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import catalogo, etiquetas
+from .conflictos import Bloque, _conflictos, _fechas_se_cruzan, _filas, barrer, construir_indice
+from .models import Asignacion, Aula, Horario
+
+LIMITE_NODOS = 50_000
+TIEMPO_MAX = 5  # s de búsqueda exhaustiva antes del reparto voraz
+
+Resultado = namedtuple('Resultado', 'propuesta sin_solucion completo')
+# propuesta: {asignacion_id: (horario_id, aula_id)}
+
+
+def _solapes(horarios):
+    """{horario_id: {horario_id que se cruzan (incluido él mismo)}} vía barrido por día."""
+    por_dia = defaultdict(list)
+    for h in horarios:
+        for codigo in h.codigos:
+            por_dia[codigo].append(Bloque(h.pk, h.hora_inicio, h.hora_fin, None, None))
+    solapes = {h.pk: {h.pk} for h in horarios}
+    for bloques in por_dia.values():
+        for x, y in barrer(bloques):
+            solapes[x.asignacion_id].add(y.asignacion_id)
+            solapes[y.asignacion_id].add(x.asignacion_id)
+    return solapes
+
+
+class _Problema:
+    def __init__(self, variables, fijas, horarios, aulas, horario_ids, aula_ids, limite, segundos):
+        # variables/fijas: {asignacion_id: Asignacion con .profes (set de ids)}.
+        # horarios/aulas son todos (las fijas pueden usar cualquiera);
+        # horario_ids/aula_ids, los permitidos para las variables.
+        self.variables = variables
+        self.solapes = _solapes(horarios)
+        self.capacidad = {a.pk: a.capacidad for a in aulas}
+        self.limite = limite
+        self.segundos = segundos
+        self.nodos = 0
+        self.asignado = {}
+        self.uso_horario = defaultdict(int)
+
+        # Un horario sin días no ocupa ninguna franja: no sirve como propuesta.
+        candidatos_h = [h.pk for h in horarios if h.codigos and h.pk in horario_ids]
+        self.dominios = {}
+        for pk, a in variables.items():
+            hs = [a.horario_id] if a.horario_id else candidatos_h
+            xs = [a.aula_id] if a.aula_id else [
+                x.pk for x in aulas if x.pk in aula_ids and x.capacidad >= a.cupo_maximo
+            ]
+            self.dominios[pk] = {(h, x) for h in hs for x in xs}
+
+        # Vecindad: quién comparte profesor o podría compartir aula.
+        self.por_profesor = defaultdict(set)
+        for pk, a in variables.items():
+            for p in a.profes:
+                self.por_profesor[p].add(pk)
+        self.por_aula = defaultdict(set)
+        for pk, dominio in self.dominios.items():
+            for _, x in dominio:
+                self.por_aula[x].add(pk)
+
+        for a in fijas.values():
+            self._podar(a, a.horario_id, a.aula_id, registrar=None)
+
+    # -- propagación -----------------------------------------------------
+
+    def _podar(self, a, horario_id, aula_id, registrar):
+        """
+        Quita de los dominios pendientes los valores que chocarían con `a`
+        en (horario_id, aula_id). Devuelve False si alguno queda vacío.
+        Con `registrar` (lista) anota lo quitado para poder deshacerlo.
+        """
+        cruzan = self.solapes.get(horario_id, {horario_id})
+        ok = True
+        por_profesor = set()
+        for p in a.profes:
+            por_profesor |= self.por_profesor[p]
+        for pk in por_profesor:
+            if pk == a.pk or pk in self.asignado or not _fechas_se_cruzan(a, self.variables[pk]):
+                continue
+            dominio = self.dominios[pk]
+            quitar = {v for v in dominio if v[0] in cruzan}
+            if quitar:
+                dominio -= quitar
+                if registrar is not None:
+                    registrar.append((pk, quitar))
+                ok = ok and bool(dominio)
+        for pk in self.por_aula.get(aula_id, ()):
+            if pk == a.pk or pk in self.asignado:
+                continue
+            dominio = self.dominios[pk]
+            if _fechas_se_cruzan(a, self.variables[pk]):
+                quitar = {(h, aula_id) for h in cruzan} & dominio
+            else:
+                # Periodos distintos pueden compartir aula, pero no el mismo
+                # par exacto (uniq_aula_horario).
+                quitar = {(horario_id, aula_id)} & dominio
+            if quitar:
+                dominio -= quitar
+                if registrar is not None:
+                    registrar.append((pk, quitar))
+                ok = ok and bool(dominio)
+        return ok
+
+    def _asignar(self, pk, valor):
+        podas = []
+        self.asignado[pk] = valor
+        self.uso_horario[valor[0]] += 1
+        ok = self._podar(self.variables[pk], valor[0], valor[1], podas)
+        return podas, ok
+
+    def _deshacer(self, pk, podas):
+        valor = self.asignado.pop(pk)
+        self.uso_horario[valor[0]] -= 1
+        for otro, quitados in podas:
+            self.dominios[otro] |= quitados
+
+    # -- heurísticas -----------------------------------------------------
+
+    def _elegir(self, pendientes):
+        return min(
+            pendientes,
+            key=lambda pk: (len(self.dominios[pk]), -len(self.variables[pk].profes),
+                            -self.variables[pk].cupo_maximo, pk),
+        )
+
+    def _ordenar(self, pk):
+        cupo = self.variables[pk].cupo_maximo
+        return sorted(
+            self.dominios[pk],
+            key=lambda v: (self.capacidad[v[1]] - cupo, self.uso_horario[v[0]], v),
+        )
+
+    # -- búsqueda --------------------------------------------------------
+
+    def buscar(self):
+        """Backtracking con forward checking. True si encontró solución completa."""
+        pendientes = {pk for pk in self.variables if self.dominios[pk]}
+        if len(pendientes) < len(self.variables):
+            return False
+        fin = time.monotonic() + self.segundos
+        pila = []  # [pk, valores restantes, podas del valor actual]
+        while pendientes:
+            pk = self._elegir(pendientes)
+            pendientes.discard(pk)
+            pila.append([pk, iter(self._ordenar(pk)), None])
+            while pila:
+                marco = pila[-1]
+                if marco[2] is not None:
+                    self._deshacer(marco[0], marco[2])
+                    marco[2] = None
+                for valor in marco[1]:
+                    self.nodos += 1
+                    if self.nodos > self.limite or (self.nodos % 256 == 0 and time.monotonic() > fin):
+                        self._desenrollar(pila)
+                        return False
+                    podas, ok = self._asignar(marco[0], valor)
+                    if ok:
+                        marco[2] = podas
+                        break
+                    self._deshacer(marco[0], podas)
+                else:
+                    pila.pop()
+                    pendientes.add(marco[0])
+                    continue
+                break
+            else:
+                return False
+        return True
+
+    def _desenrollar(self, pila):
+        for pk, _, podas in reversed(pila):
+            if podas is not None:
+                self._deshacer(pk, podas)
+
+    def voraz(self):
+        """Asigna en orden MRV el primer valor que no deje a nadie sin opciones (o cualquiera)."""
+        sin_solucion = []
+        pendientes = set(self.variables)
+        while pendientes:
+            pk = self._elegir(pendientes)
+            pendientes.discard(pk)
+            elegido = None
+            for valor in self._ordenar(pk):
+                podas, ok = self._asignar(pk, valor)
+                if ok:
+                    elegido = valor
+                    break
+                self._deshacer(pk, podas)
+            if elegido is None and self.dominios[pk]:
+                # Todas las opciones dejan a otro sin lugar: se acepta la mejor.
+                self._asignar(pk, self._ordenar(pk)[0])
+            elif elegido is None:
+                sin_solucion.append(pk)
+        return sin_solucion
+
+
+def resolver_horarios(asignacion_ids=None, horario_ids=None, aula_ids=None,
+                      limite=LIMITE_NODOS, segundos=TIEMPO_MAX):
+    """
+    Propone aula y horario para las asignaciones que no tienen alguno de
+    los dos (o solo para `asignacion_ids`), usando los horarios y aulas
+    dados (por defecto, todos). No escribe nada; ver `aplicar_propuesta`.
+    """
+    qs = Asignacion.objects.prefetch_related('profesores').only(
+        'id', 'aula_id', 'horario_id', 'cupo_maximo', 'fecha_inicio', 'fecha_fin'
+    )
+    todas = list(qs)
+    for a in todas:
+        a.profes = {p.pk for p in a.profesores.all()}
+    if asignacion_ids is None:
+        variables = {a.pk: a for a in todas if a.aula_id is None or a.horario_id is None}
+    else:
+        # Pedidas explícitamente: se replanifican desde cero.
+        ids = set(asignacion_ids)
+        variables = {a.pk: a for a in todas if a.pk in ids}
+        for a in variables.values():
+            a.aula_id = a.horario_id = None
+    fijas = {a.pk: a for a in todas if a.pk not in variables and a.aula_id and a.horario_id}
+    if not variables:
+        return Resultado({}, [], True)
+
+    horarios = list(Horario.objects.all())
+    codigos = defaultdict(list)
+    for horario_id, codigo in Horario.dias.through.objects.values_list('horario_id', 'dia__codigo'):
+        codigos[horario_id].append(codigo)
+    for h in horarios:
+        h.codigos = codigos[h.pk]
+    aulas = list(Aula.objects.order_by('capacidad', 'id'))
+
+    problema = _Problema(
+        variables, fijas, horarios, aulas,
+        set(horario_ids) if horario_ids is not None else {h.pk for h in horarios},
+        set(aula_ids) if aula_ids is not None else {x.pk for x in aulas},
+        limite, segundos,
+    )
+
+    if problema.buscar():
+        return Resultado(dict(problema.asignado), [], True)
+    sin_solucion = problema.voraz()
+    return Resultado(dict(problema.asignado), sorted(sin_solucion), False)
+
+
+@transaction.atomic
+def aplicar_propuesta(propuesta, solo_pendientes=True):
+    """
+    Escribe la propuesta con un bulk_update y refresca etiquetas y catálogo.
+
+    La propuesta puede venir de una vista previa ya vieja: las filas se
+    bloquean y solo se escriben los pares que siguen valiendo. Con
+    `solo_pendientes` se descartan las asignaciones que ya tienen aula y
+    horario, o cuyo valor fijo cambió. Siempre se descartan las que ahora se
+    cruzarían con otra asignación (un solo barrido sobre las que comparten
+    aula o profesor con las candidatas) o repetirían un par (aula, horario)
+    que sigue en uso (uniq_aula_horario). Devuelve cuántas escribió.
+    """
+    if not propuesta:
+        return 0
+    filas = (
+        Asignacion.objects
+        .select_for_update()
+        .filter(pk__in=propuesta)
+        .prefetch_related('profesores')
+        .order_by('pk')
+    )
+    horarios = Horario.objects.in_bulk({h for h, _ in propuesta.values()})
+    aulas = set(Aula.objects.filter(pk__in={x for _, x in propuesta.values()}).values_list('pk', flat=True))
+    candidatas = {}
+    for a in filas:
+        horario_id, aula_id = propuesta[a.pk]
+        if horario_id not in horarios or aula_id not in aulas:
+            continue
+        if solo_pendientes and (
+            (a.horario_id and a.aula_id)
+            or a.horario_id not in (None, horario_id)
+            or a.aula_id not in (None, aula_id)
+        ):
+            continue
+        candidatas[a.pk] = a
+    if not candidatas:
+        return 0
+
+    # Un índice con las candidatas ya ubicadas y las demás asignaciones que
+    # comparten aula o profesor con ellas; los cruces entre candidatas no
+    # cuentan: el solver ya los evitó.
+    dias = defaultdict(list)
+    for horario_id, codigo in (
+        Horario.dias.through.objects
+        .filter(horario_id__in={propuesta[pk][0] for pk in candidatas})
+        .values_list('horario_id', 'dia__codigo')
+    ):
+        dias[horario_id].append(codigo)
+    profesores = {pk: [p.pk for p in a.profesores.all()] for pk, a in candidatas.items()}
+    otras = (
+        Asignacion.objects
+        .filter(Q(aula_id__in={propuesta[pk][1] for pk in candidatas})
+                | Q(profesores__in={p for ids in profesores.values() for p in ids}))
+        .exclude(pk__in=candidatas)
+        .distinct()
+    )
+    indice_filas = _filas(otras)
+    for pk, a in candidatas.items():
+        horario_id, aula_id = propuesta[pk]
+        h = horarios[horario_id]
+        indice_filas.append(
+            (pk, aula_id, profesores[pk], dias[horario_id], h.hora_inicio, h.hora_fin, a.fecha_inicio, a.fecha_fin)
+        )
+    cruzadas = set()
+    for c in _conflictos(construir_indice(indice_filas)):
+        if c.a not in candidatas or c.b not in candidatas:
+            cruzadas.update({c.a, c.b} & candidatas.keys())
+    validas = [a for pk, a in candidatas.items() if pk not in cruzadas]
+
+    actual = {a.pk: (a.aula_id, a.horario_id) for a in validas}
+    destino = {a.pk: (propuesta[a.pk][1], propuesta[a.pk][0]) for a in validas}
+    usados = set(
+        Asignacion.objects
+        .filter(aula_id__in={x for x, _ in destino.values()}, horario_id__in={h for _, h in destino.values()})
+        .exclude(pk__in=actual)
+        .values_list('aula_id', 'horario_id')
+    )
+    mueven = set()
+    for pk in actual:
+        if destino[pk] not in usados:
+            usados.add(destino[pk])
+            mueven.add(pk)
+    # El par de una válida que no se mueve sigue ocupado: quien lo pedía
+    # tampoco se mueve, y así hasta que no caiga ninguna más.
+    while True:
+        quietas = {actual[pk] for pk in actual.keys() - mueven}
+        caen = {pk for pk in mueven if destino[pk] in quietas}
+        if not caen:
+            break
+        mueven -= caen
+    if not mueven:
+        return 0
+
+    # Intercambios: uniq_aula_horario se comprueba fila por fila, así que
+    # quien deja un par que otra toma lo suelta antes del bulk_update.
+    destinos = {destino[pk] for pk in mueven}
+    liberar = [pk for pk in mueven if actual[pk] != destino[pk] and actual[pk] in destinos]
+    if liberar:
+        Asignacion.objects.filter(pk__in=liberar).update(aula=None)
+    cambios = [a for a in validas if a.pk in mueven]
+    for a in cambios:
+        a.aula_id, a.horario_id = destino[a.pk]
+    Asignacion.objects.bulk_update(cambios, ['horario', 'aula'], batch_size=500)
+    # bulk_update no emite señales.
+    etiquetas.refrescar_asignaciones(pk__in=[a.pk for a in cambios])
+    catalogo.invalidar()
+    return len(cambios)
@@ -0,0 +1,37 @@
+"""Tareas en segundo plano de docentes (las ejecuta `manage.py runworker`)."""
+from django.conf import settings
+from django.core.mail import send_mail
+
+from tareas.services import tarea
+from .models import Asignacion
+
+
+@tarea
+def aviso_cupo_asignado(matricula_id, asignacion_id):
+    """Avisa al apoderado que su matrícula salió de la lista de espera."""
+    asignacion = Asignacion.objects.filter(pk=asignacion_id).first()
+    matricula = (
+        asignacion.matriculas.select_related('estudiante__apoderado').filter(pk=matricula_id).first()
+        if asignacion else None
+    )
+    if matricula is None:
+        # Se deshizo antes de que corriera el worker.
+        return
+    est = matricula.estudiante
+    correo = getattr(est.apoderado, 'correo', None)
+    if not correo:
+        return
+    cuerpo = (
+        f"Hola {est.apoderado.nombres},\n\n"
+        f"Se liberó un cupo y {est.nombres} {est.apellidos} ya tiene reservado su lugar en:\n"
+        f"{asignacion}\n\n"
+        "Tu pago sigue pendiente de confirmación por administración.\n\n"
+        "CEAMA"
+    )
+    send_mail(
+        "CEAMA – Cupo asignado desde la lista de espera",
+        cuerpo,
+        getattr(settings, "DEFAULT_FROM_EMAIL", None),
+        [correo],
+        fail_silently=False,
+    )
@@ -1,3 +1,460 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import date, time
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from unittest import mock
+
+from estudiantes.models import Estudiante, Inscripcion, Matricula
+from pagos.models import Pago, RecaudoDiario
+from planes.models import Plan
+from tareas.models import Tarea
+from usuarios.models import Usuario
+from . import cupos_en_vivo
+from .admin import AsignacionAdminForm
+from .conflictos import NUEVA, Bloque, Conflicto, barrer, conflictos_de, construir_indice
+from .models import Asignacion, Aula, Dia, Horario, Profesor
+from .services import (
+    encolar_espera, liberar_cupos, reclamar_cupo, reequilibrar_grupos, reservar_cupo, retener_cupo,
+)
+from .solver import aplicar_propuesta
+from .tareas import aviso_cupo_asignado
+
+
+def crear_matriculas(plan, n, grado="1° Prim"):
+    matriculas = []
+    for i in range(n):
+        est = Estudiante.objects.create(nombres=f"N{i}", apellidos="A", edad=10, grado=grado, colegio="C")
+        ins = Inscripcion.objects.create(estudiante=est, plan=plan)
+        matriculas.append(Matricula.objects.create(inscripcion=ins, estudiante=est))
+    return matriculas
+
+
+class RetencionCupoTests(TestCase):
+    """Las retenciones cuentan contra el cupo y no se pierden al cambiar de grupo."""
+
+    def test_cambiar_a_un_grupo_lleno_conserva_la_retencion(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        actual = Asignacion.objects.create(plan=plan, cupo_maximo=1)
+        lleno = Asignacion.objects.create(plan=plan, cupo_maximo=1, ocupados=1)
+        self.assertTrue(retener_cupo(actual.pk, "clave"))
+        self.assertFalse(retener_cupo(lleno.pk, "clave"))
+        actual.refresh_from_db()
+        self.assertEqual(actual.retenidos, 1)
+        self.assertEqual(actual.retenciones.get().clave, "clave")
+
+
+class EsperaCupoTests(TestCase):
+    """El cupo liberado pasa a la cabeza de la lista de espera."""
+
+    def test_liberar_promueve_en_orden_de_llegada(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        asignacion = Asignacion.objects.create(plan=plan, cupo_maximo=1)
+        primero, segundo, tercero = crear_matriculas(plan, 3)
+        self.assertTrue(reservar_cupo(primero.pk, asignacion.pk))
+        self.assertFalse(reservar_cupo(segundo.pk, asignacion.pk))
+        self.assertEqual(encolar_espera(segundo.pk, asignacion.pk), 1)
+        self.assertEqual(encolar_espera(tercero.pk, asignacion.pk), 2)
+
+        liberar_cupos([primero.pk])
+        asignacion.refresh_from_db()
+        self.assertEqual(asignacion.ocupados, 1)
+        self.assertTrue(asignacion.matriculas.filter(pk=segundo.pk).exists())
+        self.assertEqual(list(asignacion.esperas.values_list("matricula", flat=True)), [tercero.pk])
+        self.assertTrue(Tarea.objects.filter(nombre=aviso_cupo_asignado.nombre_tarea).exists())
+
+
+class ReservarCupoTests(TestCase):
+    """La reserva toma el cupo en una sola sentencia y nunca lo cuenta dos veces."""
+
+    def setUp(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        self.asignacion = Asignacion.objects.create(plan=plan, cupo_maximo=1)
+        self.matriculas = crear_matriculas(plan, 2)
+
+    def cupos(self):
+        self.asignacion.refresh_from_db()
+        return self.asignacion.ocupados, self.asignacion.retenidos, self.asignacion.matriculas.count()
+
+    def test_ultimo_cupo(self):
+        primera, segunda = self.matriculas
+        self.assertTrue(reservar_cupo(primera.pk, self.asignacion.pk))
+        self.assertFalse(reservar_cupo(segunda.pk, self.asignacion.pk))
+        self.assertFalse(reservar_cupo(segunda.pk, 0))
+        self.assertEqual(self.cupos(), (1, 0, 1))
+
+    def test_matricula_repetida(self):
+        Asignacion.objects.filter(pk=self.asignacion.pk).update(cupo_maximo=5)
+        matricula = self.matriculas[0]
+        self.assertTrue(reclamar_cupo(matricula.pk, self.asignacion.pk))
+        self.assertFalse(reclamar_cupo(matricula.pk, self.asignacion.pk))
+        self.assertTrue(reservar_cupo(matricula.pk, self.asignacion.pk))
+        self.assertEqual(self.cupos(), (1, 0, 1))
+
+    def test_retencion_pasa_a_reserva(self):
+        primera, segunda = self.matriculas
+        self.assertTrue(retener_cupo(self.asignacion.pk, "clave"))
+        self.assertFalse(reservar_cupo(segunda.pk, self.asignacion.pk))
+        self.assertTrue(reservar_cupo(primera.pk, self.asignacion.pk, retencion="clave"))
+        self.assertEqual(self.cupos(), (1, 0, 1))
+        self.assertFalse(self.asignacion.retenciones.exists())
+
+
+class ReservaConcurrenteTests(TransactionTestCase):
+    """Con compradores simultáneos el contador nunca supera el cupo."""
+
+    def en_paralelo(self, matricula_ids, asignacion_id):
+        barrera = threading.Barrier(len(matricula_ids))
+        resultados = []
+
+        def comprar(matricula_id):
+            try:
+                barrera.wait()
+                resultados.append(reservar_cupo(matricula_id, asignacion_id))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar, args=(pk,)) for pk in matricula_ids]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return sorted(resultados)
+
+    def test_ultimo_cupo_se_reserva_una_vez(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        asignacion = Asignacion.objects.create(plan=plan, cupo_maximo=1)
+        matriculas = crear_matriculas(plan, 6)
+        self.assertEqual(self.en_paralelo([m.pk for m in matriculas], asignacion.pk), [False] * 5 + [True])
+        asignacion.refresh_from_db()
+        self.assertEqual((asignacion.ocupados, asignacion.matriculas.count()), (1, 1))
+
+    def test_misma_matricula_en_paralelo(self):
+        # El segundo INSERT del mismo par choca con la restricción única y
+        # reservar_cupo lo trata como reserva ya hecha.
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        asignacion = Asignacion.objects.create(plan=plan, cupo_maximo=5)
+        matricula = crear_matriculas(plan, 1)[0]
+        self.assertEqual(self.en_paralelo([matricula.pk] * 4, asignacion.pk), [True] * 4)
+        asignacion.refresh_from_db()
+        self.assertEqual((asignacion.ocupados, asignacion.matriculas.count()), (1, 1))
+
+
+class ConflictosTests(TestCase):
+    """Cruces por aula o profesor: mismo día, franjas y periodos que se solapan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        lunes, martes = Dia.objects.create(codigo="lun"), Dia.objects.create(codigo="mar")
+        cls.ocho, cls.nueve, cls.ocho_y_media = (
+            Horario.objects.create(hora_inicio=inicio, hora_fin=fin) for inicio, fin in
+            ((time(8), time(9)), (time(9), time(10)), (time(8, 30), time(9, 30)))
+        )
+        cls.ocho.dias.add(lunes)
+        cls.nueve.dias.add(lunes)
+        cls.ocho_y_media.dias.add(lunes, martes)
+        cls.aula, cls.otra_aula = Aula.objects.create(nombre="A1"), Aula.objects.create(nombre="A2")
+        cls.profesor = Profesor.objects.create(nombres="Ana", apellidos="Ruiz")
+        cls.existente = Asignacion.objects.create(aula=cls.aula, horario=cls.ocho)
+        cls.existente.profesores.add(cls.profesor)
+
+    def test_barrer(self):
+        bloques = [Bloque(1, time(8), time(9), None, None), Bloque(2, time(9), time(10), None, None)]
+        self.assertEqual(list(barrer(bloques)), [])
+        bloques.append(Bloque(3, time(8, 30), time(9, 30), None, None))
+        pares = {tuple(sorted((x.asignacion_id, y.asignacion_id))) for x, y in barrer(bloques)}
+        self.assertEqual(pares, {(1, 3), (2, 3)})
+
+        enero = Bloque(1, time(8), time(10), date(2026, 1, 1), date(2026, 1, 31))
+        febrero = Bloque(2, time(8), time(10), date(2026, 2, 1), date(2026, 2, 28))
+        self.assertEqual(list(barrer([enero, febrero])), [])
+        self.assertEqual(len(list(barrer([enero, febrero._replace(fecha_inicio=None)]))), 1)
+
+    def test_construir_indice(self):
+        indice = construir_indice([
+            (1, 7, [3, 4], ["lun", "mar"], time(8), time(9), None, None),
+            (2, None, [3], ["lun"], time(8), time(9), None, None),
+        ])
+        self.assertEqual(set(indice), {
+            ("aula", 7, "lun"), ("aula", 7, "mar"),
+            ("profesor", 3, "lun"), ("profesor", 3, "mar"),
+            ("profesor", 4, "lun"), ("profesor", 4, "mar"),
+        })
+        self.assertEqual([b.asignacion_id for b in indice[("profesor", 3, "lun")]], [1, 2])
+        self.assertEqual([b.asignacion_id for b in indice[("aula", 7, "lun")]], [1])
+
+    def test_conflictos_de_una_asignacion_nueva(self):
+        pk = self.existente.pk
+        self.assertEqual(
+            conflictos_de(None, self.aula.pk, self.ocho_y_media, []),
+            [Conflicto("aula", self.aula.pk, "lun", NUEVA, pk)],
+        )
+        self.assertEqual(
+            conflictos_de(None, self.otra_aula.pk, self.ocho_y_media, [self.profesor.pk]),
+            [Conflicto("profesor", self.profesor.pk, "lun", NUEVA, pk)],
+        )
+        self.assertEqual(conflictos_de(None, self.aula.pk, self.nueve, [self.profesor.pk]), [])
+        # Al editarla no se cruza consigo misma.
+        self.assertEqual(conflictos_de(pk, self.aula.pk, self.ocho_y_media, [self.profesor.pk]), [])
+
+    def test_formulario_del_admin_rechaza_cruces(self):
+        datos = {"profesores": [self.profesor.pk], "aula": self.otra_aula.pk, "cupo_maximo": 10, "precio": 0}
+        form = AsignacionAdminForm(data={**datos, "horario": self.ocho_y_media.pk})
+        self.assertFalse(form.is_valid())
+        self.assertIn("Se cruza con", form.non_field_errors()[0])
+        self.assertTrue(AsignacionAdminForm(data={**datos, "horario": self.nueve.pk}).is_valid())
+
+    def test_check_horarios_estricto(self):
+        salida = StringIO()
+        call_command("check_horarios", "--estricto", stdout=salida)
+        self.assertIn("Sin cruces", salida.getvalue())
+
+        Asignacion.objects.create(aula=self.aula, horario=self.ocho_y_media)
+        call_command("check_horarios", stdout=salida)
+        self.assertIn("1 cruce(s)", salida.getvalue())
+        with self.assertRaises(CommandError) as cm:
+            call_command("check_horarios", "--estricto", stdout=salida)
+        self.assertEqual(cm.exception.returncode, 1)
+
+
+class EtiquetasTests(TestCase):
+    """Las etiquetas guardadas siguen a los datos que muestran, editados desde cualquier lado."""
+
+    def setUp(self):
+        self.lunes, self.martes = Dia.objects.create(codigo="lun"), Dia.objects.create(codigo="mar")
+        self.horario = Horario.objects.create(hora_inicio=time(16), hora_fin=time(18))
+        self.plan = Plan.objects.create(nombre="Álgebra", nivel="primaria")
+        self.aula = Aula.objects.create(nombre="A1")
+        self.profesor = Profesor.objects.create(nombres="Ana", apellidos="Ruiz")
+        self.asignacion = Asignacion.objects.create(plan=self.plan, aula=self.aula, horario=self.horario)
+
+    def etiqueta(self):
+        self.asignacion.refresh_from_db()
+        return self.asignacion.etiqueta
+
+    def test_dias_y_profesores(self):
+        self.horario.dias.add(self.lunes, self.martes)
+        self.asignacion.profesores.add(self.profesor)
+        self.assertEqual(self.etiqueta(), "Ruiz, Ana → Álgebra (lun,mar 16:00:00–18:00:00 / A1)")
+
+        self.martes.horarios.remove(self.horario)
+        otro = Profesor.objects.create(nombres="Luis", apellidos="Paz")
+        otro.asignaciones.add(self.asignacion)
+        self.assertEqual(self.etiqueta(), "Ruiz, Ana, Paz, Luis → Álgebra (lun 16:00:00–18:00:00 / A1)")
+
+        self.lunes.horarios.clear()
+        self.profesor.asignaciones.clear()
+        self.assertEqual(self.etiqueta(), "Paz, Luis → Álgebra ( 16:00:00–18:00:00 / A1)")
+        self.asignacion.profesores.clear()
+        self.assertEqual(self.etiqueta(), " → Álgebra ( 16:00:00–18:00:00 / A1)")
+
+    def test_renombrar_plan_aula_y_profesor(self):
+        self.asignacion.profesores.add(self.profesor)
+        self.plan.nombre = "Geometría"
+        self.plan.save()
+        self.aula.nombre = "B2"
+        self.aula.save()
+        self.profesor.apellidos = "Ruiz Díaz"
+        self.profesor.save()
+        self.assertEqual(self.etiqueta(), "Ruiz Díaz, Ana → Geometría ( 16:00:00–18:00:00 / B2)")
+
+
+class AplicarPropuestaTests(TestCase):
+    """La propuesta de la vista previa se aplica tal cual y solo donde sigue siendo válida."""
+
+    @classmethod
+    def setUpTestData(cls):
+        lunes = Dia.objects.create(codigo="LU")
+        cls.horario = Horario.objects.create(hora_inicio="08:00", hora_fin="10:00")
+        cls.horario.dias.add(lunes)
+        cls.aula, cls.otra_aula = Aula.objects.create(nombre="A1"), Aula.objects.create(nombre="A2")
+        cls.admin_user = Usuario.objects.create_superuser("admin", "admin@example.com", "x")
+
+    def setUp(self):
+        self.primera = Asignacion.objects.create(cupo_maximo=10)
+        self.segunda = Asignacion.objects.create(cupo_maximo=10)
+        self.propuesta = {
+            self.primera.pk: (self.horario.pk, self.aula.pk),
+            self.segunda.pk: (self.horario.pk, self.otra_aula.pk),
+        }
+
+    def test_descarta_lo_que_cambio_desde_la_vista_previa(self):
+        # Desde la vista previa alguien ocupó el aula propuesta y completó la segunda.
+        Asignacion.objects.create(cupo_maximo=10, aula=self.aula, horario=self.horario)
+        Asignacion.objects.filter(pk=self.segunda.pk).update(aula=self.otra_aula, horario=self.horario)
+        self.assertEqual(aplicar_propuesta(self.propuesta), 0)
+        self.primera.refresh_from_db()
+        self.assertIsNone(self.primera.aula_id)
+
+    def test_intercambio_de_aulas(self):
+        Asignacion.objects.filter(pk=self.primera.pk).update(aula=self.aula, horario=self.horario)
+        Asignacion.objects.filter(pk=self.segunda.pk).update(aula=self.otra_aula, horario=self.horario)
+        cruzada = {self.primera.pk: (self.horario.pk, self.otra_aula.pk), self.segunda.pk: (self.horario.pk, self.aula.pk)}
+        self.assertEqual(aplicar_propuesta(cruzada, solo_pendientes=False), 2)
+        self.assertEqual(
+            dict(Asignacion.objects.filter(pk__in=cruzada).values_list("pk", "aula")),
+            {self.primera.pk: self.otra_aula.pk, self.segunda.pk: self.aula.pk},
+        )
+
+    def test_no_toma_el_par_de_una_que_se_queda(self):
+        tercera_aula = Aula.objects.create(nombre="A3")
+        tercera = Asignacion.objects.create(cupo_maximo=10)
+        Asignacion.objects.filter(pk=self.segunda.pk).update(aula=self.otra_aula, horario=self.horario)
+        # La segunda pierde A3 ante la primera y se queda con A2, que pedía la tercera.
+        propuesta = {
+            self.primera.pk: (self.horario.pk, tercera_aula.pk),
+            self.segunda.pk: (self.horario.pk, tercera_aula.pk),
+            tercera.pk: (self.horario.pk, self.otra_aula.pk),
+        }
+        self.assertEqual(aplicar_propuesta(propuesta, solo_pendientes=False), 1)
+        self.assertEqual(
+            dict(Asignacion.objects.filter(pk__in=propuesta).values_list("pk", "aula")),
+            {self.primera.pk: tercera_aula.pk, self.segunda.pk: self.otra_aula.pk, tercera.pk: None},
+        )
+
+    def test_consultas_no_dependen_de_las_candidatas(self):
+        def aplicar(n):
+            Asignacion.objects.update(aula=None, horario=None)
+            aulas = [Aula.objects.create(nombre=f"B{Aula.objects.count()}") for _ in range(n)]
+            grupos = [Asignacion.objects.create(cupo_maximo=10) for _ in range(n)]
+            for grupo in grupos:
+                grupo.profesores.add(Profesor.objects.create(nombres="P", apellidos=str(grupo.pk)))
+            propuesta = {g.pk: (self.horario.pk, aula.pk) for g, aula in zip(grupos, aulas)}
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(aplicar_propuesta(propuesta), n)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(aplicar(2), aplicar(6))
+
+    def test_post_aplica_la_propuesta_firmada(self):
+        self.client.force_login(self.admin_user)
+        url = reverse("admin:docentes_asignacion_resolver_horarios")
+        firmada = self.client.get(url, HTTP_HOST="localhost").context["propuesta"]
+        with mock.patch("docentes.admin.resolver_horarios") as resolver:
+            response = self.client.post(url, {"propuesta": firmada}, HTTP_HOST="localhost")
+            alterada = self.client.post(url, {"propuesta": firmada + "x"}, HTTP_HOST="localhost")
+        resolver.assert_not_called()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(alterada["Location"], url)
+        self.assertEqual(Asignacion.objects.filter(aula__isnull=False, horario__isnull=False).count(), 2)
+
+
+class ReequilibrarGruposTests(TestCase):
+    """El reparto de excedentes no usa grupos en los que la matrícula ya está."""
+
+    def test_no_mueve_a_un_grupo_propio(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        lleno, propio, otro = (Asignacion.objects.create(plan=plan, cupo_maximo=c) for c in (1, 5, 2))
+        matriculas = crear_matriculas(plan, 3)
+        matriculas[0].asignaciones.add(lleno)
+        matriculas[1].asignaciones.add(lleno, propio)
+        matriculas[2].asignaciones.add(otro)
+
+        # `propio` es el menos lleno, pero la matrícula 1 ya está en él.
+        movimientos, sin_cupo = reequilibrar_grupos([plan.pk])
+        self.assertEqual(movimientos, [(matriculas[1].pk, lleno.pk, otro.pk)])
+        self.assertEqual(sin_cupo, [])
+        self.assertEqual(set(matriculas[1].asignaciones.values_list("pk", flat=True)), {propio.pk, otro.pk})
+
+    def test_mueve_el_recaudo_con_la_inscripcion(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        lleno, libre = (Asignacion.objects.create(plan=plan, cupo_maximo=c) for c in (1, 5))
+        matriculas = crear_matriculas(plan, 2)
+        for m in matriculas:
+            Inscripcion.objects.filter(pk=m.inscripcion_id).update(asignacion=lleno)
+            m.asignaciones.add(lleno)
+            Pago.objects.create(inscripcion_id=m.inscripcion_id, monto=30, metodo="yape", estado="completado")
+
+        movimientos, _ = reequilibrar_grupos([plan.pk])
+        self.assertEqual(movimientos, [(matriculas[1].pk, lleno.pk, libre.pk)])
+        por_asignacion = dict(
+            RecaudoDiario.objects.values_list("asignacion_id").annotate(Sum("total")).values_list("asignacion_id", "total__sum")
+        )
+        self.assertEqual(por_asignacion, {lleno.pk: 30, libre.pk: 30})
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CatalogoCuposTests(TestCase):
+    """Una reserva renueva solo el catálogo de su grado, no el de los demás."""
+
+    def setUp(self):
+        cache.clear()
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        self.primero = Asignacion.objects.create(plan=plan, grado="1° Prim", cupo_maximo=5)
+        Asignacion.objects.create(plan=plan, grado="2° Prim", cupo_maximo=5)
+        self.matricula = crear_matriculas(plan, 1)[0]
+        self.url = reverse("asignaciones_by_grado_json")
+
+    def etag(self, grado):
+        return self.client.get(self.url, {"grado": grado}, HTTP_HOST="localhost")["ETag"]
+
+    def test_reserva_no_invalida_otros_grados(self):
+        antes = {g: self.etag(g) for g in ("1° Prim", "2° Prim", "")}
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            self.assertTrue(reclamar_cupo(self.matricula.pk, self.primero.pk))
+        self.assertNotEqual(self.etag("1° Prim"), antes["1° Prim"])
+        self.assertNotEqual(self.etag(""), antes[""])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.etag("2° Prim"), antes["2° Prim"])
+
+    def test_detalle_descuenta_retenciones(self):
+        url = reverse("asignacion_detail_json", args=[self.primero.pk])
+        self.assertEqual(self.client.get(url, HTTP_HOST="localhost").json()["disponibles"], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(retener_cupo(self.primero.pk, "clave"))
+        data = self.client.get(url, HTTP_HOST="localhost").json()
+        self.assertEqual((data["ocupados"], data["retenidos"], data["disponibles"]), (0, 1, 4))
+
+
+class CuposStreamPendientesTests(TestCase):
+    """Un cliente atrasado recibe el último valor de cada asignación, sin perder ninguna."""
+
+    def test_cambios_se_agrupan_por_asignacion(self):
+        def aviso(pk, ocupados):
+            return {"id": pk, "ocupados": ocupados, "retenidos": 0, "cupo_maximo": 500}
+
+        async def leer():
+            stream = cupos_en_vivo.eventos(ids=[1, 2])
+            try:
+                await stream.__anext__()
+                cupos_en_vivo.difusor.publicar(aviso(2, 7))
+                for i in range(300):
+                    cupos_en_vivo.difusor.publicar(aviso(1, i))
+                return [await stream.__anext__() for _ in range(2)]
+            finally:
+                await stream.aclose()
+
+        with mock.patch.object(cupos_en_vivo.difusor, "_escuchar", lambda: None), \
+                mock.patch.object(cupos_en_vivo, "foto", mock.AsyncMock(return_value="")):
+            recibidos = async_to_sync(leer)()
+        datos = [json.loads(e.split("data: ", 1)[1]) for e in recibidos]
+        self.assertEqual([(d["id"], d["ocupados"]) for d in datos], [(2, 7), (1, 299)])
+
+
+class CuposStreamConexionTests(TransactionTestCase):
+    """El stream de cupos no retiene la conexión a la base tras el snapshot."""
+
+    def test_snapshot_cierra_la_conexion(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        asignacion = Asignacion.objects.create(plan=plan, grado="1° Prim", cupo_maximo=3)
+
+        async def primer_evento():
+            stream = cupos_en_vivo.eventos(ids=[asignacion.pk])
+            try:
+                return await stream.__anext__()
+            finally:
+                await stream.aclose()
+
+        # Sin hilo LISTEN: la prueba no debe dejar conexiones vivas.
+        with mock.patch.object(cupos_en_vivo.difusor, "_escuchar", lambda: None):
+            evento = async_to_sync(primer_evento)()
+        self.assertIn('"cupo_maximo": 3', evento)
+        self.assertIsNone(connection.connection)
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import asignacion_detail, asignaciones_by_grado
+from .views import asignacion_detail, asignaciones_by_grado, cupos_stream
 
 urlpatterns = [
     path('asignacion/<int:pk>/json/', asignacion_detail, name='asignacion_detail_json'),
     path('asignaciones/json/', asignaciones_by_grado, name='asignaciones_by_grado_json'),
+    path('cupos/stream/', cupos_stream, name='cupos_stream'),
 ]
@@ -1,7 +1,9 @@
 from django.shortcuts import render, get_object_or_404
 
-from django.http import JsonResponse
-from django.db.models import Count
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from . import catalogo, cupos_en_vivo
 from .models import Asignacion
 
 
@@ -13,67 +15,89 @@ def fmt_time(t):
         return str(t)
 
 
-def asignacion_detail(request, pk):
-	asignacion = get_object_or_404(Asignacion.objects.select_related('plan', 'aula', 'horario').prefetch_related('profesores'), pk=pk)
-	# contar matrículas actuales
-	ocupados = asignacion.matriculas.count()
-
-	# formato horario: lista de días y rango horario en formato legible
-	dias_list = [d.get_codigo_display() for d in asignacion.horario.dias.all()] if asignacion.horario else []
-	hora_inicio = fmt_time(asignacion.horario.hora_inicio) if asignacion.horario else None
-	hora_fin = fmt_time(asignacion.horario.hora_fin) if asignacion.horario else None
-
-	data = {
-		'id': asignacion.id,
-		'plan': str(asignacion.plan) if asignacion.plan else None,
-		'profesores': [str(p) for p in asignacion.profesores.all()],
-		'profesor': ' / '.join(str(p) for p in asignacion.profesores.all()),
-		'aula': str(asignacion.aula),
-		'horario': {
-			'dias': dias_list,
-			'hora_inicio': hora_inicio,
-			'hora_fin': hora_fin,
-			'hora_range': (f"{hora_inicio} – {hora_fin}" if hora_inicio and hora_fin else None),
-			'dias_text': ', '.join(dias_list) if dias_list else None,
-		} if asignacion.horario else None,
-		'fecha_inicio': asignacion.fecha_inicio.isoformat() if asignacion.fecha_inicio else None,
-		'fecha_fin': asignacion.fecha_fin.isoformat() if asignacion.fecha_fin else None,
-		'ocupados': ocupados,
-		'cupo_maximo': getattr(asignacion, 'cupo_maximo', None),
-		'precio': float(asignacion.precio) if hasattr(asignacion, 'precio') and asignacion.precio else 0,
+def _asignaciones():
+	return (
+		Asignacion.objects
+		.select_related('plan', 'aula', 'horario')
+		.prefetch_related('profesores', 'horario__dias')
+	)
+
+
+def _horario(a):
+	if not a.horario:
+		return None
+	dias_list = [d.get_codigo_display() for d in a.horario.dias.all()]
+	hora_inicio = fmt_time(a.horario.hora_inicio)
+	hora_fin = fmt_time(a.horario.hora_fin)
+	return {
+		'dias': dias_list,
+		'dias_text': ', '.join(dias_list) if dias_list else None,
+		'hora_inicio': hora_inicio,
+		'hora_fin': hora_fin,
+		'hora_range': (f"{hora_inicio} – {hora_fin}" if hora_inicio and hora_fin else None),
 	}
-	return JsonResponse(data)
+
+
+def _datos_asignacion(a):
+	profesores = [str(p) for p in a.profesores.all()]
+	return {
+		'id': a.id,
+		'plan': str(a.plan) if a.plan else None,
+		'profesores': profesores,
+		'profesor': ' / '.join(profesores),
+		'aula': str(a.aula) if a.aula else None,
+		'horario': _horario(a),
+		'ocupados': a.ocupados,
+		'retenidos': a.retenidos,
+		'disponibles': a.disponibles,
+		'cupo_maximo': a.cupo_maximo,
+	}
+
+
+def asignacion_detail(request, pk):
+	"""JSON de una asignación; sin consultas si la versión del catálogo ya está en caché (ver catalogo.py)."""
+	def construir():
+		asignacion = _asignaciones().filter(pk=pk).first()
+		if asignacion is None:
+			return None
+		return {
+			**_datos_asignacion(asignacion),
+			'fecha_inicio': asignacion.fecha_inicio.isoformat() if asignacion.fecha_inicio else None,
+			'fecha_fin': asignacion.fecha_fin.isoformat() if asignacion.fecha_fin else None,
+			'precio': float(asignacion.precio) if asignacion.precio else 0,
+		}
+
+	return catalogo.respuesta_json(request, f'asignacion:{pk}', construir)
 
 
 def asignaciones_by_grado(request):
 	"""Devuelve JSON con las asignaciones filtradas por grado (query param ?grado=...)."""
-	grado = request.GET.get('grado')
-	qs = Asignacion.objects.select_related('plan', 'aula', 'horario').prefetch_related('profesores')
-	if grado:
-		qs = qs.filter(grado=grado)
-	asigns = qs.annotate(ocupados=Count('matriculas'))
-
-	lista = []
-	for a in asigns:
-		ocupados = getattr(a, 'ocupados', a.matriculas.count() if hasattr(a, 'matriculas') else 0)
-		dias_list = [d.get_codigo_display() for d in a.horario.dias.all()] if a.horario else []
-		hora_inicio = fmt_time(a.horario.hora_inicio) if a.horario else None
-		hora_fin = fmt_time(a.horario.hora_fin) if a.horario else None
-		lista.append({
-			'id': a.id,
-			'plan': str(a.plan) if a.plan else None,
-			'profesores': [str(p) for p in a.profesores.all()],
-			'profesor': ' / '.join(str(p) for p in a.profesores.all()),
-			'aula': str(a.aula),
-			'horario': {
-				'dias': dias_list,
-				'dias_text': ', '.join(dias_list) if dias_list else None,
-				'hora_inicio': hora_inicio,
-				'hora_fin': hora_fin,
-				'hora_range': (f"{hora_inicio} – {hora_fin}" if hora_inicio and hora_fin else None),
-			} if a.horario else None,
-			'ocupados': ocupados,
-			'cupo_maximo': getattr(a, 'cupo_maximo', None),
-		})
-
-	return JsonResponse(lista, safe=False)
+	grado = request.GET.get('grado') or ''
+
+	def construir():
+		qs = _asignaciones()
+		if grado:
+			qs = qs.filter(grado=grado)
+		return [_datos_asignacion(a) for a in qs]
+
+	return catalogo.respuesta_json(request, f'grado:{grado}', construir)
+
+
+async def cupos_stream(request):
+	"""
+	Server-Sent Events con los cupos de las asignaciones de un grado
+	(?grado=...) o de una lista (?ids=1,2). Requiere servir la app por ASGI;
+	por WSGI responde solo el snapshot y el navegador reconecta cada
+	pocos segundos (EventSource), como un sondeo.
+	"""
+	grado = request.GET.get('grado') or ''
+	ids = [int(x) for x in request.GET.get('ids', '').split(',') if x.strip().isdigit()]
+	if isinstance(request, ASGIRequest):
+		contenido = cupos_en_vivo.eventos(grado, ids)
+	else:
+		contenido = [await cupos_en_vivo.foto(grado, ids)]
+	response = StreamingHttpResponse(contenido, content_type='text/event-stream')
+	response.headers['Cache-Control'] = 'no-cache'
+	# nginx/easypanel: no acumular el stream en el proxy
+	response.headers['X-Accel-Buffering'] = 'no'
+	return response
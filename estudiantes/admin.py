@@ -1,7 +1,6 @@
 from django.contrib import admin
 from django.contrib.admin import SimpleListFilter
-from django.http import HttpResponse 
-import csv 
+from basejango.exportacion import ExportacionAdminMixin
 from .models import Estudiante, Inscripcion, Matricula
 from docentes.models import Asignacion
 
@@ -12,14 +11,35 @@ class MatriculaInline(admin.StackedInline):
     readonly_fields = ('fecha_creada',)
     verbose_name_plural = "Matrículas asociadas"
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Inscripcion.__str__ muestra al estudiante: traerlo en la misma consulta.
+        if db_field.name == 'inscripcion':
+            kwargs['queryset'] = Inscripcion.objects.select_related('estudiante')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 @admin.register(Estudiante)
-class EstudianteAdmin(admin.ModelAdmin):
+class EstudianteAdmin(ExportacionAdminMixin, admin.ModelAdmin):
     list_display = ('apellidos', 'nombres', 'grado', 'edad', 'colegio', 'apoderado')
     search_fields = ('apellidos', 'nombres', 'colegio', 'apoderado__nombres')
     list_filter = ('grado',)
     ordering = ('apellidos', 'nombres')
     inlines = [MatriculaInline]
+    actions = ['exportar_csv', 'exportar_xlsx']
+    exportacion_nombre = "estudiantes_ceama"
+    exportacion_columnas = [
+        ("Apellidos", lambda e: e.apellidos),
+        ("Nombres", lambda e: e.nombres),
+        ("Edad", lambda e: e.edad),
+        ("Grado", lambda e: e.get_grado_display()),
+        ("Colegio", lambda e: e.colegio),
+        ("Apoderado", lambda e: str(e.apoderado) if e.apoderado else ""),
+        ("Teléfono apoderado", lambda e: e.apoderado.telefono if e.apoderado else ""),
+        ("Correo apoderado", lambda e: (e.apoderado.correo or "") if e.apoderado else ""),
+    ]
+
+    def exportacion_queryset(self, queryset):
+        return queryset.select_related('apoderado')
 
 
 @admin.register(Inscripcion)
@@ -55,8 +75,8 @@ class AsignacionFilter(SimpleListFilter):
     parameter_name = 'asignacion'
 
     def lookups(self, request, model_admin):
-        asigns = Asignacion.objects.all().order_by('plan__nombre')
-        return [(str(a.id), str(a)) for a in asigns]
+        asigns = Asignacion.objects.order_by('plan__nombre').values_list('id', 'etiqueta')
+        return [(str(pk), etiqueta) for pk, etiqueta in asigns]
 
     def queryset(self, request, queryset):
         val = self.value()
@@ -65,46 +85,29 @@ class AsignacionFilter(SimpleListFilter):
         return queryset
 
 @admin.register(Matricula)
-class MatriculaAdmin(admin.ModelAdmin):
+class MatriculaAdmin(ExportacionAdminMixin, admin.ModelAdmin):
     list_display = ('estudiante', 'estado', 'monto_referencial', 'cursos_del_plan', 'fecha_creada')
+    # `inscripcion` para leer plan_id sin consulta por fila (ver cursos_del_plan).
+    list_select_related = ('estudiante', 'inscripcion')
     list_filter = (AsignacionFilter, 'estado',)
     search_fields = ('inscripcion__estudiante__apellidos', 'inscripcion__estudiante__nombres')
     ordering = ('-fecha_creada',)
     filter_horizontal = ('asignaciones',)
     inlines = [AsignacionInline]
-    actions = ['exportar_matriculas_csv']
-    def exportar_matriculas_csv(self, request, queryset):
-        """
-        Exporta a CSV las matrículas seleccionadas (respeta filtros del admin).
-        """
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="matriculas_ceama.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            "Nombre del estudiante",
-            "Estado de matrícula",
-            "Monto referencial",
-            "Fecha de creación",
-            "Asignaciones (curso / docente / aula / horario)",
-        ])
-
-        for m in queryset:
-            est = m.estudiante
-            nombre_estudiante = f"{est.apellidos}, {est.nombres}"
-            monto = f"{m.monto_referencial:.2f}" if m.monto_referencial is not None else ""
-            fecha = m.fecha_creada.strftime("%Y-%m-%d %H:%M") if m.fecha_creada else ""
-            asignaciones_texto = "; ".join(str(a) for a in m.asignaciones.all())
+    actions = ['exportar_csv', 'exportar_xlsx']
+    exportacion_nombre = "matriculas_ceama"
+    exportacion_columnas = [
+        ("Nombre del estudiante", lambda m: f"{m.estudiante.apellidos}, {m.estudiante.nombres}"),
+        ("Estado de matrícula", lambda m: m.estado),
+        ("Monto referencial", lambda m: m.monto_referencial),
+        ("Fecha de creación", lambda m: m.fecha_creada),
+        ("Asignaciones (curso / docente / aula / horario)", lambda m: "; ".join(str(a) for a in m.asignaciones.all())),
+    ]
 
-            writer.writerow([
-                nombre_estudiante,
-                m.estado,
-                monto,
-                fecha,
-                asignaciones_texto,
-            ])
-        return response
-    exportar_matriculas_csv.short_description = "Exportar listado a CSV"
+    def exportacion_queryset(self, queryset):
+        # Asignacion.__str__ usa la etiqueta guardada: basta con prefetchear
+        # las asignaciones para que el costo sea por bloque y no por fila.
+        return queryset.select_related('estudiante').prefetch_related('asignaciones')
     def cursos_del_plan(self, obj):
         cursos = obj.cursos_plan
         if not cursos:
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from estudiantes.services import expirar_provisionales
+
+
+class Command(BaseCommand):
+    help = (
+        "Revierte las inscripciones provisionales cuyo pago nadie revisó: libera "
+        "sus cupos y borra matrícula, inscripción, estudiante y apoderado huérfanos. "
+        "Pensado para cron, p. ej. cada hora."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            default=72,
+            help="Antigüedad mínima sin pagos nuevos (por defecto 72).",
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=200,
+            help="Inscripciones por transacción (por defecto 200).",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Solo cuenta las inscripciones que se revertirían.",
+        )
+
+    def handle(self, *args, **options):
+        resumen = expirar_provisionales(options['horas'], options['lote'], aplicar=not options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"{resumen['inscripciones']} inscripción(es) provisional(es) vencida(s).")
+            return
+        for asignacion_id, liberados in sorted(resumen['cupos'].items()):
+            self.stdout.write(f"  asignación {asignacion_id}: {liberados} cupo(s) liberado(s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['inscripciones']} inscripción(es), {resumen['matriculas']} matrícula(s), "
+            f"{resumen['estudiantes']} estudiante(s) y {resumen['apoderados']} apoderado(s) eliminados; "
+            f"{sum(resumen['cupos'].values())} cupo(s) liberado(s)."
+        ))
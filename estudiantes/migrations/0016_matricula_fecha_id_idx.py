@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0011_asignacion_notificar_cupos'),
+        ('estudiantes', '0015_alter_estudiante_options_alter_inscripcion_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='matricula',
+            index=models.Index(fields=['-fecha_creada', '-id'], name='matricula_fecha_id_idx'),
+        ),
+    ]
@@ -3,8 +3,6 @@ from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from apoderados.models import Apoderado
-from docentes.models import Asignacion
-from django.db.models import Count
 
 
 class VerificacionToken(models.Model):
@@ -136,32 +134,20 @@ class Matricula(models.Model):
     class Meta:
         verbose_name = "Matrícula"
         verbose_name_plural = "Matrículas"
+        indexes = [
+            # Paginación keyset del listado (ver views.listado_matriculas).
+            models.Index(fields=['-fecha_creada', '-id'], name='matricula_fecha_id_idx'),
+        ]
     @property
     def cursos_plan(self):
-        if not self.inscripcion or not self.inscripcion.plan:
-            return []
-        return self.inscripcion.plan.cursos_base()
+        from planes.cursos import cursos_de_plan
+        if not self.inscripcion_id:
+            return ()
+        # Por plan_id: no hace falta traer el Plan para consultar el mapa.
+        return cursos_de_plan(self.inscripcion.plan_id)
     def asignar_automaticamente_grupos(self):
+        """Asigna un grupo de su plan si la matrícula está activa y no tiene ninguno."""
         if self.estado != 'activo':
             return
-        cursos = list(self.cursos_plan)
-        if not cursos:
-            return
-        asignaciones_actuales = list(self.asignaciones.all())
-        cursos_ya_asignados = {a.curso_id for a in asignaciones_actuales}
-
-        for curso in cursos:
-            if curso.id in cursos_ya_asignados:
-                continue
-            # elegir una asignacion del curso con cupos disponibles
-            asignacion = (
-                Asignacion.objects
-                .filter(curso=curso)
-                .annotate(num_matriculas=Count('matriculas'))
-                .filter(num_matriculas__lt=models.F('cupo_maximo'))
-                .order_by('num_matriculas', 'id')
-                .first()
-            )
-
-            if asignacion:
-                self.asignaciones.add(asignacion)
\ No newline at end of file
+        from docentes.services import asignar_grupos
+        asignar_grupos([self.pk])
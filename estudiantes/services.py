@@ -0,0 +1,147 @@
+import datetime
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from apoderados.models import Apoderado
+from docentes.models import EsperaCupo
+from docentes.services import liberar_cupos
+from pagos import recaudo, seguimiento
+from pagos.models import Pago
+from pagos.signals import pagos_gestionados
+from .models import Estudiante, Inscripcion, Matricula
+from .signals import cupos_gestionados
+
+
+@transaction.atomic
+def eliminar_inscripciones_provisionales(inscripcion_ids):
+    """
+    Revierte en bloque inscripciones provisionales (pago rechazado o
+    abandonado): libera sus cupos y borra Matrícula e Inscripción (con sus
+    pagos), más los Estudiante/Apoderado que queden sin otras inscripciones.
+    El recaudo y el snapshot de seguimiento se ajustan una vez por lote, con
+    los handlers por fila desactivados: el número de consultas no depende
+    del número de pagos o comprobantes.
+    """
+    filas = list(
+        Inscripcion.objects
+        .filter(pk__in=inscripcion_ids, provisional=True)
+        .values_list('id', 'estudiante_id', 'estudiante__apoderado_id')
+    )
+    resumen = {'inscripciones': 0, 'matriculas': 0, 'estudiantes': 0, 'apoderados': 0, 'cupos': {}}
+    if not filas:
+        return resumen
+
+    ins_ids = [f[0] for f in filas]
+    est_ids = {f[1] for f in filas}
+    apo_ids = {f[2] for f in filas if f[2]}
+    matricula_ids = Matricula.objects.filter(inscripcion_id__in=ins_ids).values_list('id', flat=True)
+
+    # Fuera de la cola antes de liberar: el cupo no debe ir a una matrícula
+    # que se borra en este mismo lote.
+    EsperaCupo.objects.filter(matricula_id__in=matricula_ids).delete()
+    recaudo.sumar_pagos(
+        Pago.objects.filter(inscripcion_id__in=ins_ids, estado__in=recaudo.ESTADOS_RECAUDO).values_list('pk', flat=True),
+        signo=-1,
+    )
+    seguimiento.invalidar(ins_ids)
+    with cupos_gestionados(), pagos_gestionados():
+        resumen['cupos'] = liberar_cupos(matricula_ids)
+        # La cascada arrastra Matrícula, Pago y Comprobante.
+        _, borrados = Inscripcion.objects.filter(pk__in=ins_ids).delete()
+    resumen['inscripciones'] = borrados.get('estudiantes.Inscripcion', 0)
+    resumen['matriculas'] = borrados.get('estudiantes.Matricula', 0)
+
+    _, borrados = Estudiante.objects.filter(pk__in=est_ids).exclude(
+        Exists(Inscripcion.objects.filter(estudiante=OuterRef('pk')))
+    ).delete()
+    resumen['estudiantes'] = borrados.get('estudiantes.Estudiante', 0)
+
+    if apo_ids:
+        _, borrados = Apoderado.objects.filter(pk__in=apo_ids).exclude(
+            Exists(Estudiante.objects.filter(apoderado=OuterRef('pk')))
+        ).delete()
+        resumen['apoderados'] = borrados.get('apoderados.Apoderado', 0)
+    return resumen
+
+
+def _provisionales_vencidas(limite):
+    """
+    Inscripciones provisionales creadas antes de `limite` y sin pagos
+    posteriores (un pago reciente las mantiene vivas). Filtra por el índice
+    de `provisional`. Las que están en lista de espera no ocupan cupo y
+    conservan su turno.
+    """
+    return Inscripcion.objects.filter(provisional=True, fecha__lt=limite).exclude(
+        Exists(Pago.objects.filter(inscripcion=OuterRef('pk'), fecha__gte=limite))
+    ).exclude(
+        Exists(EsperaCupo.objects.filter(matricula__inscripcion=OuterRef('pk')))
+    )
+
+
+def _tomar_lote(limite, desde_id, lote):
+    """
+    Bloquea un lote de inscripciones vencidas con id > `desde_id`, en el
+    mismo orden que transicionar_pagos (primero los pagos, luego la
+    inscripción) y con SKIP LOCKED: las que un admin está revisando en ese
+    momento se saltan y quedan para la próxima pasada.
+    Devuelve (ids bloqueados, último id visto).
+    """
+    ids = list(
+        _provisionales_vencidas(limite)
+        .filter(pk__gt=desde_id)
+        .order_by('pk')
+        .values_list('pk', flat=True)[:lote]
+    )
+    if not ids:
+        return [], None
+    pagos = dict(Pago.objects.filter(inscripcion_id__in=ids).values_list('pk', 'inscripcion_id'))
+    bloqueados = set(
+        Pago.objects
+        .filter(pk__in=list(pagos))
+        .select_for_update(skip_locked=True)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    ocupadas = {ins_id for pago_id, ins_id in pagos.items() if pago_id not in bloqueados}
+    libres = list(
+        _provisionales_vencidas(limite)
+        .filter(pk__in=[pk for pk in ids if pk not in ocupadas])
+        .select_for_update(skip_locked=True)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    return libres, ids[-1]
+
+
+def expirar_provisionales(horas=72, lote=200, aplicar=True):
+    """
+    Revierte las inscripciones provisionales sin movimiento en las últimas
+    `horas` (nadie aprobó ni rechazó su pago): libera sus cupos y borra
+    Matrícula/Inscripción/Estudiante/Apoderado con
+    `eliminar_inscripciones_provisionales`, un lote de `lote` inscripciones
+    por transacción. Con `aplicar=False` solo cuenta las candidatas.
+    Devuelve el resumen acumulado; `cupos` es {asignacion_id: liberados}.
+    """
+    limite = timezone.now() - datetime.timedelta(hours=horas)
+    total = {'inscripciones': 0, 'matriculas': 0, 'estudiantes': 0, 'apoderados': 0, 'cupos': Counter()}
+    if not aplicar:
+        total['inscripciones'] = _provisionales_vencidas(limite).count()
+        return total
+
+    ultimo = 0
+    while True:
+        with transaction.atomic():
+            ids, ultimo = _tomar_lote(limite, ultimo, lote)
+            if ultimo is None:
+                break
+            resumen = eliminar_inscripciones_provisionales(ids) if ids else {}
+        for clave, valor in resumen.items():
+            if clave == 'cupos':
+                total['cupos'].update(valor)
+            else:
+                total[clave] += valor
+    total['cupos'] = dict(total['cupos'])
+    return total
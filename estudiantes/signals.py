@@ -0,0 +1,79 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from docentes.services import ajustar_ocupados
+from .models import Matricula
+
+MatriculaAsignacion = Matricula.asignaciones.through
+
+# Los servicios que ajustan `ocupados` por su cuenta (borrados masivos,
+# bulk_create de filas intermedias) desactivan estos handlers para no
+# contar dos veces ni lanzar una consulta por matrícula.
+_cupos_gestionados = ContextVar('cupos_gestionados', default=False)
+
+
+@contextmanager
+def cupos_gestionados():
+    token = _cupos_gestionados.set(True)
+    try:
+        yield
+    finally:
+        _cupos_gestionados.reset(token)
+
+
+@receiver(m2m_changed, sender=MatriculaAsignacion)
+def matricula_asignaciones_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Mantiene `Asignacion.ocupados` al agregar/quitar asignaciones de una
+    matrícula (en ambos sentidos de la relación). Corre dentro de la misma
+    transacción que modifica la tabla intermedia.
+    """
+    if _cupos_gestionados.get():
+        return
+    if action == 'post_add':
+        if not pk_set:
+            return
+        if reverse:
+            ajustar_ocupados({instance.pk: len(pk_set)})
+        else:
+            ajustar_ocupados({pk: 1 for pk in pk_set})
+        return
+
+    # Para remove/clear Django no filtra los ids inexistentes, así que
+    # contamos las filas reales antes de que se borren.
+    if action in ('pre_remove', 'pre_clear'):
+        if reverse:
+            filas = sender.objects.filter(asignacion_id=instance.pk)
+            if action == 'pre_remove':
+                filas = filas.filter(matricula_id__in=pk_set or ())
+            instance._cupos_liberados = Counter({instance.pk: filas.count()})
+        else:
+            filas = sender.objects.filter(matricula_id=instance.pk)
+            if action == 'pre_remove':
+                filas = filas.filter(asignacion_id__in=pk_set or ())
+            instance._cupos_liberados = Counter(filas.values_list('asignacion_id', flat=True))
+        return
+
+    if action in ('post_remove', 'post_clear'):
+        liberados = getattr(instance, '_cupos_liberados', None)
+        if liberados:
+            ajustar_ocupados({pk: -n for pk, n in liberados.items()})
+        instance._cupos_liberados = None
+
+
+@receiver(pre_delete, sender=Matricula)
+def matricula_pre_delete(sender, instance, **kwargs):
+    """Al borrar una matrícula sus filas intermedias caen en cascada sin m2m_changed."""
+    if _cupos_gestionados.get():
+        return
+    liberados = Counter(
+        MatriculaAsignacion.objects
+        .filter(matricula_id=instance.pk)
+        .values_list('asignacion_id', flat=True)
+    )
+    if liberados:
+        ajustar_ocupados({pk: -n for pk, n in liberados.items()})
@@ -1,3 +1,253 @@
+import csv
+import io
+import zipfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs
+from xml.etree import ElementTree
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apoderados.models import Apoderado
+from basejango.exportacion import _en_asincrono, filas_csv, filas_xlsx
+from docentes.models import Asignacion
+from docentes.services import reconciliar_ocupados
+from pagos.models import Comprobante, Pago
+from planes.models import Plan
+from usuarios.models import Usuario
+from .models import Estudiante, Inscripcion, Matricula
+from .services import expirar_provisionales
+
+
+class ExpirarProvisionalesTests(TestCase):
+    """Las inscripciones provisionales vencidas se borran por lotes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+
+    def _pagos(self, n, provisional=False):
+        ids = []
+        for i in range(n):
+            est = Estudiante.objects.create(
+                nombres=f"Nombre {i}", apellidos="Apellido", edad=10, grado="1° Prim", colegio="C",
+            )
+            ins = Inscripcion.objects.create(estudiante=est, plan=self.plan, provisional=provisional)
+            ids.append(Pago.objects.create(inscripcion=ins, monto=10, metodo="yape", estado_solicitado="completado").pk)
+        return ids
+
+    def test_expirar_provisionales_vencidas(self):
+        viejos = self._pagos(2, provisional=True)
+        Pago.objects.filter(pk__in=viejos).update(fecha=timezone.now() - timedelta(days=5))
+        Inscripcion.objects.filter(pago__in=viejos).update(fecha=timezone.now() - timedelta(days=5))
+        recientes = self._pagos(1, provisional=True)
+        confirmados = self._pagos(1)
+        Inscripcion.objects.filter(pago__in=confirmados).update(fecha=timezone.now() - timedelta(days=5))
+
+        self.assertEqual(expirar_provisionales(horas=72, aplicar=False)["inscripciones"], 2)
+        resumen = expirar_provisionales(horas=72, lote=1)
+        self.assertEqual(resumen["inscripciones"], 2)
+        self.assertEqual(resumen["estudiantes"], 2)
+        self.assertFalse(Pago.objects.filter(pk__in=viejos).exists())
+        self.assertEqual(Pago.objects.filter(pk__in=recientes + confirmados).count(), 2)
+
+    def test_consultas_no_dependen_del_lote(self):
+        def expirar(n):
+            viejos = self._pagos(n, provisional=True)
+            for pago_id in viejos:
+                for j in range(2):
+                    Comprobante.objects.create(pago_id=pago_id, archivo=f"comprobantes/test-{pago_id}-{j}.png")
+            Inscripcion.objects.filter(pago__in=viejos).update(fecha=timezone.now() - timedelta(days=5))
+            Pago.objects.filter(pk__in=viejos).update(fecha=timezone.now() - timedelta(days=5))
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(expirar_provisionales(horas=72)["inscripciones"], n)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(expirar(1), expirar(8))
+
+
+class ContadorOcupadosTests(TestCase):
+    """`Asignacion.ocupados` sigue a la tabla intermedia en ambos sentidos."""
+
+    def setUp(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        self.a, self.b = (Asignacion.objects.create(plan=plan, cupo_maximo=10) for _ in range(2))
+        self.matriculas = []
+        for i in range(3):
+            est = Estudiante.objects.create(nombres=f"N{i}", apellidos="A", edad=10, grado="1° Prim", colegio="C")
+            ins = Inscripcion.objects.create(estudiante=est, plan=plan)
+            self.matriculas.append(Matricula.objects.create(inscripcion=ins, estudiante=est))
+
+    def ocupados(self):
+        return list(Asignacion.objects.filter(pk__in=[self.a.pk, self.b.pk]).order_by("pk").values_list("ocupados", flat=True))
+
+    def test_agregar_quitar_y_limpiar(self):
+        primera, segunda, tercera = self.matriculas
+        primera.asignaciones.add(self.a, self.b)
+        self.a.matriculas.add(segunda, tercera)
+        self.assertEqual(self.ocupados(), [3, 1])
+
+        # Quitar una asignación que la matrícula no tiene no descuenta nada.
+        segunda.asignaciones.remove(self.a, self.b)
+        self.assertEqual(self.ocupados(), [2, 1])
+        self.a.matriculas.remove(tercera)
+        self.assertEqual(self.ocupados(), [1, 1])
+
+        primera.asignaciones.clear()
+        self.assertEqual(self.ocupados(), [0, 0])
+        self.b.matriculas.add(*self.matriculas)
+        self.b.matriculas.clear()
+        self.assertEqual(self.ocupados(), [0, 0])
+
+    def test_borrar_matricula_libera_sus_cupos(self):
+        self.matriculas[0].asignaciones.add(self.a, self.b)
+        self.matriculas[1].asignaciones.add(self.a)
+        self.matriculas[0].delete()
+        self.assertEqual(self.ocupados(), [1, 0])
+
+    def test_reconciliar_repara_el_desfase(self):
+        self.a.matriculas.add(*self.matriculas[:2])
+        Asignacion.objects.filter(pk=self.a.pk).update(ocupados=5)
+        Asignacion.objects.filter(pk=self.b.pk).update(ocupados=1)
+
+        esperado = [(self.a.pk, 5, 2), (self.b.pk, 1, 0)]
+        self.assertEqual(reconciliar_ocupados(aplicar=False), esperado)
+        self.assertEqual(self.ocupados(), [5, 1])
+        self.assertEqual(reconciliar_ocupados(), esperado)
+        self.assertEqual(self.ocupados(), [2, 0])
+
+        Asignacion.objects.filter(pk=self.a.pk).update(ocupados=0)
+        salida = StringIO()
+        call_command("reconciliar_cupos", stdout=salida)
+        self.assertIn(f"Asignación {self.a.pk}: 0 → 2", salida.getvalue())
+        self.assertEqual(self.ocupados(), [2, 0])
+        call_command("reconciliar_cupos", stdout=salida)
+        self.assertIn("al día", salida.getvalue())
+
+
+class ExportacionTests(TestCase):
+    """Los archivos exportados se abren bien y su costo no depende de cuántas filas traen."""
+
+    XLSX = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = Usuario.objects.create_superuser("admin", "admin@example.com", "x")
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        grupos = [Asignacion.objects.create(plan=plan, cupo_maximo=20) for _ in range(2)]
+        for i in range(8):
+            apoderado = Apoderado.objects.create(nombres=f"Apoderado {i}", apellidos="A", telefono=f"99900{i}", dni=f"4000000{i}")
+            est = Estudiante.objects.create(
+                nombres=f"N{i}", apellidos="A", edad=10, grado="1° Prim", colegio="C", apoderado=apoderado,
+            )
+            ins = Inscripcion.objects.create(estudiante=est, plan=plan)
+            Matricula.objects.create(inscripcion=ins, estudiante=est).asignaciones.add(*grupos)
+
+    def test_csv_con_bom_y_comillas(self):
+        contenido = "".join(filas_csv(["Nombre", "Nota"], [["Pérez, Ana", 'dijo "sí"'], [None, date(2026, 3, 1)]]))
+        self.assertTrue(contenido.startswith("\ufeffNombre,Nota\r\n"))
+        self.assertIn('"Pérez, Ana","dijo ""sí"""', contenido)
+        self.assertEqual(
+            list(csv.reader(io.StringIO(contenido.lstrip("\ufeff")))),
+            [["Nombre", "Nota"], ["Pérez, Ana", 'dijo "sí"'], ["", "2026-03-01"]],
+        )
+
+    def test_xlsx_se_abre_y_se_entrega_por_bloques(self):
+        filas = [[i, f"<fila {i}> & \x07"] for i in range(5)]
+        partes = list(filas_xlsx(["N", "Texto"], iter(filas), bloque=2))
+        self.assertGreater(len([p for p in partes if p]), 2)
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(partes))) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertIn("[Content_Types].xml", zf.namelist())
+            hoja = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+        filas_xml = hoja.iter(f"{self.XLSX}row")
+        valores = [[c.findtext(f".//{self.XLSX}v") or c.findtext(f".//{self.XLSX}t") for c in fila] for fila in filas_xml]
+        self.assertEqual(valores[0], ["N", "Texto"])
+        self.assertEqual(valores[1:], [[str(i), f"<fila {i}> & "] for i in range(5)])
+        self.assertEqual(hoja.find(f".//{self.XLSX}row[2]/{self.XLSX}c").get("t"), "n")
+
+    def test_en_asincrono_cierra_el_iterador(self):
+        cerrado = []
+
+        def partes():
+            try:
+                yield from range(5)
+            finally:
+                cerrado.append(True)
+
+        async def leer(hasta):
+            stream = _en_asincrono(partes(), bloque=2)
+            recibidos = []
+            async for parte in stream:
+                recibidos.append(parte)
+                if len(recibidos) == hasta:
+                    break
+            await stream.aclose()
+            return recibidos
+
+        self.assertEqual(async_to_sync(leer)(10), [0, 1, 2, 3, 4])
+        self.assertEqual(async_to_sync(leer)(1), [0])
+        self.assertEqual(cerrado, [True, True])
+
+    def _consultas_exportacion(self, modelo, accion, n):
+        self.client.force_login(self.admin_user)
+        ids = list(modelo.objects.order_by("pk").values_list("pk", flat=True)[:n])
+        url = reverse(f"admin:estudiantes_{modelo._meta.model_name}_changelist")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {"action": accion, "_selected_action": ids}, HTTP_HOST="localhost")
+            contenido = b"".join(response.streaming_content)
+        self.assertTrue(contenido)
+        return len(ctx.captured_queries)
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        for modelo in (Estudiante, Matricula):
+            for accion in ("exportar_csv", "exportar_xlsx"):
+                conteos = [self._consultas_exportacion(modelo, accion, n) for n in (1, 8)]
+                self.assertEqual(conteos[0], conteos[1], f"{modelo.__name__} {accion}: {conteos}")
+
+
+class ListadoMatriculasTests(TestCase):
+    """La paginación keyset no salta ni repite filas con fechas iguales y conserva los filtros."""
+
+    @classmethod
+    def setUpTestData(cls):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        for i in range(9):
+            est = Estudiante.objects.create(nombres=f"N{i}", apellidos="A", edad=10, grado="1° Prim", colegio="C")
+            ins = Inscripcion.objects.create(estudiante=est, plan=plan)
+            Matricula.objects.create(inscripcion=ins, estudiante=est, estado="activo" if i % 3 else "inactivo")
+        # Todas en el mismo instante: el orden lo decide el id.
+        Matricula.objects.update(fecha_creada=timezone.now())
+        cls.activas = list(Matricula.objects.filter(estado="activo").order_by("-id").values_list("pk", flat=True))
+
+    def pagina(self, consulta):
+        response = self.client.get(reverse("estudiantes:listado_matriculas") + consulta, HTTP_HOST="localhost")
+        for enlace in (response.context["siguiente_url"], response.context["anterior_url"]):
+            if enlace:
+                self.assertEqual(parse_qs(enlace[1:])["estado"], ["activo"])
+        return [m.pk for m in response.context["matriculas"]], response.context
+
+    @mock.patch("estudiantes.views.MATRICULAS_POR_PAGINA", 2)
+    def test_avanzar_y_retroceder(self):
+        paginas, consulta = [], "?estado=activo"
+        while consulta:
+            ids, contexto = self.pagina(consulta)
+            paginas.append(ids)
+            consulta = contexto["siguiente_url"]
+        self.assertEqual([pk for ids in paginas for pk in ids], self.activas)
+        self.assertEqual([len(ids) for ids in paginas], [2, 2, 2])
 
-# Create your tests here.
+        vuelta, consulta = [paginas[-1]], contexto["anterior_url"]
+        while consulta:
+            ids, contexto = self.pagina(consulta)
+            vuelta.append(ids)
+            consulta = contexto["anterior_url"]
+        self.assertEqual(vuelta[::-1], paginas)
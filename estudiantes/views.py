@@ -1,12 +1,18 @@
+import uuid
+from datetime import datetime
+from urllib.parse import urlencode
+
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.http import JsonResponse
-from django.db.models import Count
+from django.db.models import Exists, OuterRef, Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
 from apoderados.models import Apoderado
 from django.utils import timezone
 from planes.models import Plan
 from docentes.models import Asignacion
+from docentes.services import retener_cupo, soltar_retencion
 from .models import Estudiante, Inscripcion, Matricula
 
 
@@ -50,6 +56,22 @@ def registrar_estudiante(request):
             except Exception:
                 form_error = 'La edad debe ser un número válido.'
 
+        # Aparta el cupo ya en este paso: si no queda, se avisa aquí y no al
+        # final del registro. La clave de la retención vive en la sesión y se
+        # reutiliza si el apoderado vuelve a enviar el formulario.
+        previo = request.session.get('ceama_inscripcion') or {}
+        retencion = previo.get('retencion') or uuid.uuid4().hex
+        if not form_error and asignacion_id:
+            try:
+                asignacion_id = int(asignacion_id)
+            except ValueError:
+                form_error = 'Selecciona una asignación válida.'
+            else:
+                if not retener_cupo(asignacion_id, retencion):
+                    form_error = 'La asignación seleccionada ya no tiene cupos disponibles.'
+        elif not form_error and previo.get('retencion'):
+            soltar_retencion(previo['retencion'])
+
         if form_error:
             apoderados = Apoderado.objects.all()
             planes = Plan.objects.all()
@@ -59,7 +81,6 @@ def registrar_estudiante(request):
                     .filter(grado=grado)
                         .select_related('plan', 'aula', 'horario')
                         .prefetch_related('profesores')
-                        .annotate(num_matriculas=Count('matriculas'))
                 )
             else:
                 asignaciones = []
@@ -83,7 +104,8 @@ def registrar_estudiante(request):
             'colegio': colegio,
             'edad': int(edad),
             'plan_id': int(plan_id) if plan_id else None,
-            'asignacion_id': int(asignacion_id) if asignacion_id else None,
+            'asignacion_id': asignacion_id or None,
+            'retencion': retencion,
             'created_at': timezone.now().timestamp(),
         }
         request.session['ceama_inscripcion'] = ins_data
@@ -92,17 +114,88 @@ def registrar_estudiante(request):
         return redirect(reverse('registrar_apoderado'))
 
 
+MATRICULAS_POR_PAGINA = 50
+
+
+def _cursor(m):
+    """Posición de una fila en el orden (-fecha_creada, -id), para la URL."""
+    crudo = f"{m.fecha_creada.isoformat()}|{m.pk}"
+    return urlsafe_base64_encode(crudo.encode())
+
+
+def _leer_cursor(valor):
+    try:
+        fecha, pk = urlsafe_base64_decode(valor).decode().split('|')
+        fecha = datetime.fromisoformat(fecha)
+        return fecha, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
 def listado_matriculas(request):
-    """Listado simple de matrículas con sus asignaciones."""
+    """
+    Listado de matrículas con sus asignaciones, paginado por keyset sobre
+    (fecha_creada, id): cada página es un rango del índice, así que su costo
+    no depende de cuántas matrículas haya antes. `despues`/`antes` llevan la
+    última/primera fila de la página actual.
+    """
+    # Asignacion.__str__ usa la etiqueta guardada: no hace falta traer
+    # profesores ni días.
     matriculas = (
         Matricula.objects
         .select_related('estudiante', 'inscripcion')
         .prefetch_related('asignaciones')
-        .order_by('-fecha_creada')
     )
 
+    estado = request.GET.get('estado', '')
+    if estado:
+        matriculas = matriculas.filter(estado=estado)
+    asignacion = request.GET.get('asignacion', '')
+    if asignacion.isdigit():
+        through = Matricula.asignaciones.through
+        matriculas = matriculas.filter(
+            Exists(through.objects.filter(matricula_id=OuterRef('pk'), asignacion_id=asignacion))
+        )
+    else:
+        asignacion = ''
+
+    despues = _leer_cursor(request.GET.get('despues', ''))
+    antes = None if despues else _leer_cursor(request.GET.get('antes', ''))
+    if antes:
+        # Página anterior: se recorre el índice hacia atrás y se invierte.
+        fecha, pk = antes
+        filas = list(
+            matriculas
+            .filter(Q(fecha_creada__gt=fecha) | Q(fecha_creada=fecha, pk__gt=pk))
+            .order_by('fecha_creada', 'id')[:MATRICULAS_POR_PAGINA + 1]
+        )
+        hay_anterior = len(filas) > MATRICULAS_POR_PAGINA
+        filas = filas[:MATRICULAS_POR_PAGINA][::-1]
+        hay_siguiente = True
+    else:
+        if despues:
+            fecha, pk = despues
+            matriculas = matriculas.filter(Q(fecha_creada__lt=fecha) | Q(fecha_creada=fecha, pk__lt=pk))
+        filas = list(matriculas.order_by('-fecha_creada', '-id')[:MATRICULAS_POR_PAGINA + 1])
+        hay_siguiente = len(filas) > MATRICULAS_POR_PAGINA
+        filas = filas[:MATRICULAS_POR_PAGINA]
+        hay_anterior = despues is not None
+
+    filtros = {k: v for k, v in (('estado', estado), ('asignacion', asignacion)) if v}
+    siguiente_url = anterior_url = None
+    if filas and hay_siguiente:
+        siguiente_url = '?' + urlencode({**filtros, 'despues': _cursor(filas[-1])})
+    if filas and hay_anterior:
+        anterior_url = '?' + urlencode({**filtros, 'antes': _cursor(filas[0])})
+
     contexto = {
-        'matriculas': matriculas,
+        'matriculas': filas,
+        'estados': Matricula._meta.get_field('estado').choices,
+        'asignaciones': Asignacion.objects.order_by('plan__nombre', 'id').only('id', 'etiqueta'),
+        'estado': estado,
+        'asignacion': asignacion,
+        'siguiente_url': siguiente_url,
+        'anterior_url': anterior_url,
     }
     return render(request, 'estudiantes/listado_matriculas.html', contexto)
 
@@ -2,27 +2,21 @@ from django.contrib import admin, messages
 from django.urls import reverse, path
 from django.utils.html import format_html
 from django.http import HttpResponseRedirect
-from django.db import transaction
-from django.utils.crypto import get_random_string
 
 from .models import Pago, Comprobante
-from .emails import enviar_correo_pago_aprobado
-from django.db.models import Sum, Count
-from estudiantes.models import Matricula
+from .services import reservar_cupo_de_inscripcion, transicionar_pagos
+from . import recaudo
+from .almacenamiento import validar_comprobante
+from .miniaturas import url_miniatura
 from django import forms
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import UploadedFile
+from basejango.exportacion import ExportacionAdminMixin
 
 # Same file-validation rules used by the public upload flow
-MAX_MB = 5
 MAX_FILES = 3
-ALLOWED_CT = {
-    "application/pdf",
-    "image/jpeg",
-    "image/png",
-    "image/webp",
-    "image/gif",
-}
 
 
 class ComprobanteForm(forms.ModelForm):
@@ -37,12 +31,7 @@ class ComprobanteForm(forms.ModelForm):
         # Only validate when the object is an uploaded file (new upload).
         # Existing FileField instances (attached files) are not UploadedFile and should be accepted as-is.
         if isinstance(f, UploadedFile):
-            ct = getattr(f, 'content_type', None)
-            size = getattr(f, 'size', None)
-            if ct not in ALLOWED_CT:
-                raise ValidationError('Solo PDF o imágenes (JPG/PNG/WEBP/GIF).')
-            if size is not None and size > MAX_MB * 1024 * 1024:
-                raise ValidationError(f'Cada archivo debe pesar ≤ {MAX_MB} MB.')
+            validar_comprobante(f)
         return f
 
 
@@ -87,15 +76,13 @@ class ComprobanteInline(admin.TabularInline):
         if not obj.archivo:
             return "—"
         url = obj.archivo.url
-        name = obj.archivo.name.split("/")[-1].lower()
-        if name.endswith((".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")):
-            return format_html(
-                '<a href="{0}" target="_blank">'
-                '<img src="{0}" style="max-height:90px;border-radius:6px;vertical-align:middle" />'
-                "</a><br><small>{1}</small>",
-                url, name
-            )
-        return format_html('<a href="{}" target="_blank">Abrir archivo</a>', url)
+        etiqueta = obj.tipo or obj.archivo.name.split("/")[-1].lower()
+        return format_html(
+            '<a href="{0}" target="_blank">'
+            '<img src="{1}" loading="lazy" style="max-height:90px;border-radius:6px;vertical-align:middle" />'
+            "</a><br><small>{2}</small>",
+            url, obj.miniatura_url, etiqueta
+        )
 
     @admin.display(description="Acciones")
     def acciones(self, obj):
@@ -113,7 +100,7 @@ class ComprobanteInline(admin.TabularInline):
 
 
 @admin.register(Pago)
-class PagoAdmin(admin.ModelAdmin):
+class PagoAdmin(ExportacionAdminMixin, admin.ModelAdmin):
     list_display = ("id", "estudiante_nombre", "plan_text", "estado_badge",
                     "comprobantes_cell", "abrir_cell", "acciones_cell")
     list_display_links = ("id", "estudiante_nombre")
@@ -125,7 +112,38 @@ class PagoAdmin(admin.ModelAdmin):
     # show a combobox of filtered Inscripcion choices (not raw id popup)
     raw_id_fields = ()
     inlines = [ComprobanteInline]
-    actions = ["validar_pago", "marcar_parcial", "rechazar_pago"]
+    actions = ["validar_pago", "marcar_parcial", "rechazar_pago", "exportar_csv", "exportar_xlsx"]
+    list_select_related = ("inscripcion__estudiante", "inscripcion__plan")
+    exportacion_nombre = "pagos_ceama"
+    exportacion_columnas = [
+        ("ID", lambda p: p.pk),
+        ("Estudiante", lambda p: str(p.inscripcion.estudiante)),
+        ("Plan", lambda p: p.inscripcion.plan.nombre if p.inscripcion.plan else ""),
+        ("Monto", lambda p: p.monto),
+        ("Método", lambda p: p.get_metodo_display()),
+        ("Estado", lambda p: p.get_estado_display()),
+        ("Estado solicitado", lambda p: p.get_estado_solicitado_display()),
+        ("Fecha", lambda p: p.fecha),
+        ("Comprobantes", lambda p: p.num_comprobantes),
+    ]
+
+    def exportacion_queryset(self, queryset):
+        # `num_comprobantes` ya viene anotado por get_queryset.
+        return queryset.select_related("inscripcion__estudiante", "inscripcion__plan")
+
+    def get_queryset(self, request):
+        # Comprobante count and first thumbnail as annotations so each
+        # changelist row renders without extra queries.
+        qs = super().get_queryset(request)
+        comprobantes = Comprobante.objects.filter(pago=OuterRef("pk"))
+        return qs.annotate(
+            num_comprobantes=Coalesce(
+                Subquery(comprobantes.values("pago").annotate(n=Count("id")).values("n")),
+                0,
+            ),
+            primera_miniatura=Subquery(comprobantes.order_by("id").values("miniatura")[:1]),
+            primer_tipo=Subquery(comprobantes.order_by("id").values("tipo")[:1]),
+        )
 
     @admin.display(description="Apoderado")
     def apoderado_info(self, obj):
@@ -192,47 +210,29 @@ class PagoAdmin(admin.ModelAdmin):
     def _redirect_changelist(self, request):
         return HttpResponseRedirect(reverse("admin:pagos_pago_changelist"))
 
-    def _sync_inscripcion(self, pago):
-        ins = pago.inscripcion
-
-        if not getattr(ins, "pk", None):
-            return
-
-        # Compute effective payment state from Pago records (source of truth)
-        pagos_qs = ins.pago_set.all()
-        if pagos_qs.filter(estado='completado').exists():
-            estado_effectivo = 'total'
-        elif pagos_qs.filter(estado='parcial').exists():
-            estado_effectivo = 'parcial'
-        else:
-            estado_effectivo = 'pendiente'
-
-        total_pagado = (
-            pagos_qs.filter(estado__in=["parcial", "completado"]) .aggregate(total=Sum("monto")).get("total") or 0
-        )
-
-        estudiante = getattr(ins, "estudiante", None)
-        if not estudiante or not estudiante.pk:
-            return
-
-        matricula, created = Matricula.objects.get_or_create(
-            inscripcion=ins,
-            estudiante_id=estudiante.pk,
-            defaults={
-                "estado": "activo" if estado_effectivo in ["total", "parcial"] else "inactivo",
-                "monto_referencial": total_pagado,
-            },
-        )
-
-        if not created:
-            matricula.estado = "activo" if estado_effectivo in ["total", "parcial"] else "inactivo"
-            matricula.monto_referencial = total_pagado
-            matricula.save(update_fields=["estado", "monto_referencial"])
-        try:
-            matricula.asignar_automaticamente_grupos()
-        except Exception:
-            pass
-
+    def save_model(self, request, obj, form, change):
+        # El estado real solo cambia a través del motor de transiciones:
+        # aquí se guardan los demás campos y la transición va en save_related.
+        destino = obj.estado
+        obj.estado = form.initial.get("estado", "pendiente") if change else "pendiente"
+        obj._estado_destino = destino
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        obj = form.instance
+        destino = getattr(obj, "_estado_destino", obj.estado)
+        puesto = reservar_cupo_de_inscripcion(obj.inscripcion) if not change else 0
+        if puesto:
+            self.message_user(
+                request,
+                f"La asignación no tiene cupos: la inscripción quedó en lista de espera (puesto {puesto}) "
+                "y el pago sigue pendiente.",
+                level=messages.WARNING,
+            )
+            destino = "pendiente"
+        if destino != obj.estado:
+            transicionar_pagos([obj.pk], destino)
 
     def aprobar_view(self, request, pk):
         pago = Pago.objects.select_related("inscripcion__estudiante__apoderado").filter(pk=pk).first()
@@ -240,18 +240,13 @@ class PagoAdmin(admin.ModelAdmin):
             self.message_user(request, "Pago no encontrado.", level=messages.ERROR)
             return self._redirect_changelist(request)
 
-        pago.estado = pago.estado_solicitado or "completado"
-        pago.save(update_fields=["estado"])
-        self._sync_inscripcion(pago)
-
-        ins = pago.inscripcion
-        if not getattr(ins, "access_code", ""):
-            ins.access_code = get_random_string(10).upper()
-            ins.save(update_fields=["access_code"])
+        resumen = transicionar_pagos([pago.pk])
+        if not resumen["aplicados"]:
+            self.message_user(request, f"El pago ya estaba {pago.get_estado_display().lower()}.", level=messages.INFO)
+            return self._redirect_changelist(request)
 
-        apo = getattr(ins.estudiante, "apoderado", None)
-        correo = self._apo_email(apo)
-        if not correo:
+        apo = getattr(pago.inscripcion.estudiante, "apoderado", None)
+        if not self._apo_email(apo):
             self.message_user(
                 request,
                 "Pago aprobado. No se envió correo porque el estudiante no tiene apoderado con email.",
@@ -259,24 +254,11 @@ class PagoAdmin(admin.ModelAdmin):
             )
             return self._redirect_changelist(request)
 
-        ok = False
-        try:
-            ok = enviar_correo_pago_aprobado(pago, raise_errors=False)
-        except Exception as e:
-            self.message_user(
-                request, f"Pago aprobado, pero falló el envío de correo: {e}", level=messages.ERROR
-            )
-            return self._redirect_changelist(request)
-
-        if ok:
-            self.message_user(request, "Pago aprobado. Código generado/enviado.", level=messages.SUCCESS)
-        else:
-            self.message_user(
-                request,
-                "Pago aprobado, pero no se pudo enviar el correo (revisa configuración SMTP).",
-                level=messages.ERROR,
-            )
-
+        self.message_user(
+            request,
+            "Pago aprobado. Código generado; el correo se enviará en segundo plano.",
+            level=messages.SUCCESS,
+        )
         return self._redirect_changelist(request)
 
     def changelist_view(self, request, extra_context=None):
@@ -284,40 +266,24 @@ class PagoAdmin(admin.ModelAdmin):
         if extra_context is None:
             extra_context = {}
         extra_context['gestion_dinero_url'] = reverse('admin:pagos_gestion_dinero')
-        # quick summary: total recaudado (visible on changelist)
-        pagos_qs = Pago.objects.filter(estado__in=['parcial', 'completado'])
-        total_recaudo = pagos_qs.aggregate(total=Sum('monto')).get('total') or 0
+        # quick summary: total recaudado (visible on changelist), read from the rollup
+        total_recaudo = recaudo.resumen()['total_recaudo']
         extra_context['gestion_total_recaudo'] = f"S/ {total_recaudo:,.2f}"
         return super().changelist_view(request, extra_context=extra_context)
 
     def gestion_dinero_view(self, request):
-        """Admin dashboard showing aggregates: total recaudado, por asignación y por grado."""
+        """Admin dashboard served from RecaudoDiario: totals by grado/asignación plus a daily or weekly series."""
         from django.shortcuts import render
-        pagos_qs = Pago.objects.filter(estado__in=['parcial', 'completado'])
-
-        total_recaudo = pagos_qs.aggregate(total=Sum('monto')).get('total') or 0
-
-        # Por grado
-        por_grado = (
-            pagos_qs
-            .values('inscripcion__estudiante__grado')
-            .annotate(total=Sum('monto'), count=Count('id'))
-            .order_by('-total')
-        )
-
-        # Por asignación (si la inscripción tiene asignacion)
-        por_asignacion = (
-            pagos_qs
-            .values('inscripcion__asignacion__id', 'inscripcion__asignacion__plan__nombre')
-            .annotate(total=Sum('monto'), count=Count('id'))
-            .order_by('-total')
-        )
+        desde = recaudo.parsear_fecha(request.GET.get('desde'))
+        hasta = recaudo.parsear_fecha(request.GET.get('hasta'))
+        serie = 'semana' if request.GET.get('serie') == 'semana' else 'dia'
 
         context = {
             'title': 'Gestión de dinero',
-            'total_recaudo': total_recaudo,
-            'por_grado': por_grado,
-            'por_asignacion': por_asignacion,
+            **recaudo.resumen(desde=desde, hasta=hasta, serie=serie),
+            'desde': desde,
+            'hasta': hasta,
+            'serie': serie,
             'opts': self.model._meta,
             'app_label': self.model._meta.app_label,
         }
@@ -328,9 +294,10 @@ class PagoAdmin(admin.ModelAdmin):
         if not pago:
             self.message_user(request, "Pago no encontrado.", level=messages.ERROR)
             return self._redirect_changelist(request)
-        pago.estado = "rechazado"
-        pago.save(update_fields=["estado"])
-        self._sync_inscripcion(pago)
+        resumen = transicionar_pagos([pago.pk], "rechazado")
+        if not resumen["aplicados"]:
+            self.message_user(request, "El pago ya estaba rechazado.", level=messages.INFO)
+            return self._redirect_changelist(request)
         self.message_user(request, "Pago rechazado.", level=messages.WARNING)
         return self._redirect_changelist(request)
 
@@ -341,15 +308,7 @@ class PagoAdmin(admin.ModelAdmin):
 
     @admin.display(description="Plan")
     def plan_text(self, obj):
-        # Prefer Matricula.plan if exists, else fallback to inscripcion.plan
-        try:
-            from estudiantes.models import Matricula
-            mat = Matricula.objects.filter(inscripcion=obj.inscripcion).first()
-            if mat and getattr(mat, 'plan', None):
-                return str(mat.plan)
-        except Exception:
-            pass
-        return str(getattr(obj.inscripcion, 'plan', '—'))
+        return str(getattr(obj.inscripcion, 'plan', None) or '—')
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         """Limit the inscripcion choices to inscriptions that are pending or have pending/parcial payments.
@@ -387,19 +346,23 @@ class PagoAdmin(admin.ModelAdmin):
 
     @admin.display(description="Comprobantes")
     def comprobantes_cell(self, obj):
-        qs = obj.comprobantes.all()
-        n = qs.count()
+        n = getattr(obj, "num_comprobantes", None)
+        if n is None:
+            n = obj.comprobantes.count()
         if not n:
             return "—"
-        first = qs.first()
-        if first and first.archivo:
-            open_url = reverse("admin:pagos_pago_change", args=[obj.pk]) + "#inline-group"
-            return format_html(
-                '<a href="{}"><img src="{}" style="height:24px;border-radius:4px;vertical-align:middle;margin-right:6px"/></a>'
-                '<span style="background:#e5e7eb;border-radius:10px;padding:2px 8px;font-weight:600">{}</span>',
-                open_url, first.archivo.url, n
-            )
-        return str(n)
+        open_url = reverse("admin:pagos_pago_change", args=[obj.pk]) + "#inline-group"
+        # Never the original upload here: thumbnail if ready, static icon otherwise.
+        img_url = url_miniatura(
+            getattr(obj, "primera_miniatura", None),
+            getattr(obj, "primer_tipo", ""),
+            Comprobante._meta.get_field("miniatura").storage,
+        )
+        return format_html(
+            '<a href="{}"><img src="{}" loading="lazy" style="height:24px;border-radius:4px;vertical-align:middle;margin-right:6px"/></a>'
+            '<span style="background:#e5e7eb;border-radius:10px;padding:2px 8px;font-weight:600">{}</span>',
+            open_url, img_url, n
+        )
 
     @admin.display(description="Abrir")
     def abrir_cell(self, obj):
@@ -418,32 +381,30 @@ class PagoAdmin(admin.ModelAdmin):
             aprobar, rechazar
         )
 
+    def _informar_transicion(self, request, resumen, texto, level):
+        self.message_user(request, f"{resumen['aplicados']} pago(s) {texto}.", level=level)
+        omitidos = resumen["sin_cambio"] + resumen["invalidos"]
+        if omitidos:
+            self.message_user(
+                request,
+                f"{omitidos} pago(s) omitidos: ya estaban en ese estado o no admiten el cambio.",
+                level=messages.INFO,
+            )
+
     @admin.action(description="Validar pago(s) → COMPLETADO")
     def validar_pago(self, request, queryset):
-        with transaction.atomic():
-            for pago in queryset:
-                pago.estado = pago.estado_solicitado or "completado"
-                pago.save(update_fields=["estado"])
-                self._sync_inscripcion(pago)
-        self.message_user(request, "Pagos validados.", level=messages.SUCCESS)
+        resumen = transicionar_pagos(queryset)
+        self._informar_transicion(request, resumen, "validados", messages.SUCCESS)
 
     @admin.action(description="Marcar pago(s) → PARCIAL")
     def marcar_parcial(self, request, queryset):
-        with transaction.atomic():
-            for pago in queryset:
-                pago.estado = "parcial"
-                pago.save(update_fields=["estado"])
-                self._sync_inscripcion(pago)
-        self.message_user(request, "Pagos marcados como Parcial.", level=messages.INFO)
+        resumen = transicionar_pagos(queryset, "parcial")
+        self._informar_transicion(request, resumen, "marcados como Parcial", messages.INFO)
 
     @admin.action(description="Rechazar pago(s)")
     def rechazar_pago(self, request, queryset):
-        with transaction.atomic():
-            for pago in queryset:
-                pago.estado = "rechazado"
-                pago.save(update_fields=["estado"])
-                self._sync_inscripcion(pago)
-        self.message_user(request, "Pagos rechazados.", level=messages.WARNING)
+        resumen = transicionar_pagos(queryset, "rechazado")
+        self._informar_transicion(request, resumen, "rechazados", messages.WARNING)
 
 @admin.register(Comprobante)
 class ComprobanteAdmin(admin.ModelAdmin):
@@ -0,0 +1,106 @@
+"""
+Almacenamiento de comprobantes direccionado por contenido.
+
+Cada archivo subido se lee por bloques (`File.chunks()`, sin cargarlo entero
+en memoria) para calcular su SHA-256 y se guarda en
+`comprobantes/sha256/<ab>/<hash>.<ext>`. Si el mismo archivo se vuelve a
+subir (reintentos, regularizaciones) el blob ya existe y no se escribe de
+nuevo: los `Comprobante` comparten la misma ruta.
+
+El tipo se decide por los primeros bytes del archivo, no por el
+`content_type` que envía el navegador.
+"""
+import hashlib
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.utils.crypto import get_random_string
+
+MAX_MB = 5
+
+# content type -> extensión con la que se guarda el blob
+TIPOS_PERMITIDOS = {
+    "application/pdf": ".pdf",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+PREFIJO = "comprobantes/sha256/"
+
+
+def detectar_tipo(f):
+    """Content type según los bytes iniciales, o None si no es un tipo permitido."""
+    f.seek(0)
+    cabecera = f.read(16)
+    f.seek(0)
+    if cabecera.startswith(b"%PDF-"):
+        return "application/pdf"
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if cabecera[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def huella(f):
+    """SHA-256 hexadecimal del archivo, leído por bloques."""
+    h = hashlib.sha256()
+    f.seek(0)
+    for bloque in f.chunks():
+        h.update(bloque)
+    f.seek(0)
+    return h.hexdigest()
+
+
+def validar_comprobante(f):
+    """Lanza ValidationError si el archivo no es PDF/imagen o excede el tamaño."""
+    if f.size is not None and f.size > MAX_MB * 1024 * 1024:
+        raise ValidationError(f"Cada archivo debe pesar ≤ {MAX_MB} MB.")
+    if detectar_tipo(f) is None:
+        raise ValidationError("Solo PDF o imágenes (JPG/PNG/WEBP/GIF).")
+
+
+def ruta_comprobante(instance, filename):
+    """`upload_to` de Comprobante.archivo: la ruta depende solo del contenido."""
+    if not instance.sha256:
+        return os.path.join("comprobantes", filename)
+    ext = TIPOS_PERMITIDOS.get(instance.tipo) or os.path.splitext(filename)[1].lower()
+    return f"{PREFIJO}{instance.sha256[:2]}/{instance.sha256}{ext}"
+
+
+class AlmacenamientoDireccionado(FileSystemStorage):
+    """
+    FileSystemStorage que no duplica blobs: bajo `PREFIJO` un nombre
+    existente ya tiene exactamente ese contenido, así que se reutiliza en vez
+    de escribir una copia con sufijo aleatorio.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if name.startswith(PREFIJO):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not name.startswith(PREFIJO):
+            return super()._save(name, content)
+        if self.exists(name):
+            return name
+        # Se escribe con un nombre temporal y se renombra: dos subidas
+        # simultáneas del mismo archivo terminan en el mismo blob sin error.
+        temporal = super()._save(f"{name}.{get_random_string(8)}.tmp", content)
+        os.replace(self.path(temporal), self.path(name))
+        return name
+
+
+def almacenamiento_comprobantes():
+    return _almacenamiento
+
+
+_almacenamiento = AlmacenamientoDireccionado()
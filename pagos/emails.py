@@ -18,17 +18,17 @@ def _get_apo_email(apoderado):
     return None
 
 
-def enviar_correo_codigo(inscripcion):
+def enviar_correo_codigo(inscripcion, correo=None):
     """
-    (Uso opcional) Envía solo el código de acceso con el enlace de seguimiento.
-    La vista de registrar_pago YA NO debería llamarlo, pero lo dejamos por
-    compatibilidad si en algún punto lo necesitas.
+    Envía solo el código de acceso con el enlace de seguimiento. Se ejecuta
+    desde la cola de tareas (ver `pagos.tareas`), por eso deja propagar los
+    errores SMTP: el worker se encarga de reintentar.
     """
-    est = getattr(inscripcion, "estudiante", None)
-    apod = getattr(est, "apoderado", None)
-    correo = getattr(apod, "email", None)
     if not correo:
-        return
+        est = getattr(inscripcion, "estudiante", None)
+        correo = _get_apo_email(getattr(est, "apoderado", None))
+    if not correo:
+        return False
 
     code = getattr(inscripcion, "access_code", "")
     path = reverse("pagos_regularizar_seguimiento", args=[code]) if code else "#"
@@ -41,17 +41,18 @@ def enviar_correo_codigo(inscripcion):
         f"Puedes ver/regularizar pagos aquí:\n{url}\n\n"
         "CEAMA"
     )
-    send_mail(subject, body, getattr(settings, "DEFAULT_FROM_EMAIL", None), [correo], fail_silently=True)
+    send_mail(subject, body, getattr(settings, "DEFAULT_FROM_EMAIL", None), [correo], fail_silently=False)
+    return True
 
 
-def enviar_correo_pago_aprobado(pago, raise_errors=False) -> bool:
-    """Envía el correo de aprobación. Devuelve True si envió, False si no."""
+def _mensaje_pago_aprobado(pago, connection=None):
+    """Arma el correo de aprobación; None si el apoderado no tiene email."""
     ins = pago.inscripcion
     est = ins.estudiante
     apo = getattr(est, "apoderado", None)
     to = _get_apo_email(apo)
     if not to:
-        return False
+        return None
 
     # Garantiza código
     if not getattr(ins, "access_code", ""):
@@ -83,18 +84,26 @@ def enviar_correo_pago_aprobado(pago, raise_errors=False) -> bool:
         f'<p>Puedes ver/regularizar pagos aquí: <a href="{url}">{url}</a></p>'
     )
 
+    msg = EmailMultiAlternatives(
+        sujeto,
+        texto,
+        settings.DEFAULT_FROM_EMAIL,
+        [to],
+        connection=connection,
+    )
+    msg.attach_alternative(html, "text/html")
+    return msg
+
+
+def enviar_correo_pago_aprobado(pago, raise_errors=False) -> bool:
+    """Envía el correo de aprobación. Devuelve True si envió, False si no."""
+    msg = _mensaje_pago_aprobado(pago)
+    if msg is None:
+        return False
     try:
-        msg = EmailMultiAlternatives(
-            sujeto,
-            texto,
-            settings.DEFAULT_FROM_EMAIL,
-            [to],
-        )
-        msg.attach_alternative(html, "text/html")
         msg.send(fail_silently=False)
         return True
     except Exception:
         if raise_errors:
             raise
         return False
-
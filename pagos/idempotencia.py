@@ -0,0 +1,101 @@
+"""
+Claves de idempotencia para los POST públicos que crean pagos
+(registrar_pago y regularizar_seguimiento).
+
+Cada vez que se dibuja el formulario se genera una clave nueva
+(`request.clave_idempotencia`) que viaja en la URL del `action`
+(`?idem=...`), no en el cuerpo. Al recibir el POST:
+
+- si la clave ya tiene respuesta guardada se repite esa redirección con una
+  sola consulta, antes de leer el cuerpo: ni los archivos se procesan;
+- si no, la vista corre en una transacción que primero inserta la clave.
+  Un reenvío simultáneo (doble clic, reintento del móvil) queda esperando
+  en el índice único hasta que la primera petición confirme y entonces
+  devuelve la misma redirección.
+
+Solo se guardan redirecciones (el éxito del POST/redirect/GET). Si la vista
+responde otra cosa (errores del formulario) la clave se descarta y el mismo
+envío puede reintentarse. Las vencidas las borra `manage.py purgar_claves`.
+"""
+import datetime
+import functools
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+PARAMETRO = 'idem'
+DURACION = datetime.timedelta(hours=24)
+
+
+def _clave(request):
+    clave = request.GET.get(PARAMETRO) or request.headers.get('Idempotency-Key') or ''
+    return clave.strip()[:64]
+
+
+def _respuesta_previa(clave, ruta):
+    fila = (
+        ClaveIdempotencia.objects
+        .filter(clave=clave, expira__gt=timezone.now())
+        .exclude(respuesta='')
+        .values_list('ruta', 'respuesta')
+        .first()
+    )
+    if fila is None:
+        return None
+    if fila[0] != ruta:
+        return HttpResponseBadRequest("La clave del formulario pertenece a otra página.")
+    return HttpResponseRedirect(fila[1])
+
+
+def _reservar(clave, ruta):
+    """Inserta la clave; si otra petición la confirmó antes, devuelve su respuesta."""
+    ahora = timezone.now()
+    try:
+        with transaction.atomic():
+            ClaveIdempotencia.objects.create(clave=clave, ruta=ruta, expira=ahora + DURACION)
+        return None
+    except IntegrityError:
+        previa = _respuesta_previa(clave, ruta)
+        if previa is not None:
+            return previa
+    # Quedaba una vencida que aún no se purgó.
+    ClaveIdempotencia.objects.filter(clave=clave, expira__lte=ahora).delete()
+    ClaveIdempotencia.objects.create(clave=clave, ruta=ruta, expira=ahora + DURACION)
+    return None
+
+
+def idempotente(vista):
+    """Decorador para las vistas POST que terminan en una redirección."""
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        # Clave para el formulario que dibuje esta respuesta.
+        request.clave_idempotencia = uuid.uuid4().hex
+        clave = _clave(request) if request.method == 'POST' else ''
+        if not clave:
+            return vista(request, *args, **kwargs)
+
+        previa = _respuesta_previa(clave, request.path)
+        if previa is not None:
+            return previa
+        with transaction.atomic():
+            previa = _reservar(clave, request.path)
+            if previa is not None:
+                return previa
+            respuesta = vista(request, *args, **kwargs)
+            filas = ClaveIdempotencia.objects.filter(clave=clave)
+            if respuesta.status_code in (301, 302, 303) and respuesta.get('Location'):
+                filas.update(respuesta=respuesta['Location'][:500])
+            else:
+                filas.delete()
+        return respuesta
+    return envoltura
+
+
+def purgar_claves():
+    """Borra las claves vencidas. Devuelve cuántas borró."""
+    borradas, _ = ClaveIdempotencia.objects.filter(expira__lte=timezone.now()).delete()
+    return borradas
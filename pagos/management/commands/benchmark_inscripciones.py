@@ -0,0 +1,149 @@
+import math
+import tempfile
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from apoderados.models import Apoderado
+from docentes.models import Asignacion
+from docentes.services import reservar_cupo, retener_cupo
+from estudiantes.models import Estudiante, Inscripcion, Matricula
+from pagos.models import Comprobante, Pago
+from pagos.services import registrar_inscripcion
+from planes.models import Plan
+from tareas.models import Tarea
+
+PREFIJO = "BENCH-INSCRIPCIONES"
+
+# Cabeceras mínimas que acepta detectar_tipo.
+PDF = b"%PDF-1.4\n% benchmark\n"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 64
+
+
+def _inscripcion_legado(apoderado, estudiante, pago, archivos, plan_id, asignacion_id, retencion):
+    """Camino anterior de registrar_pago, fila por fila (solo para comparar)."""
+    with transaction.atomic():
+        apod = Apoderado.objects.filter(dni=apoderado['dni']).first()
+        if apod:
+            for campo in ('nombres', 'apellidos', 'telefono', 'correo', 'direccion'):
+                setattr(apod, campo, apoderado.get(campo) or getattr(apod, campo))
+            apod.save(update_fields=['nombres', 'apellidos', 'telefono', 'correo', 'direccion'])
+        else:
+            apod = Apoderado.objects.create(**apoderado)
+        plan = Plan.objects.filter(pk=plan_id).first() if plan_id else None
+        if not plan and asignacion_id:
+            plan = Asignacion.objects.select_related('plan').get(pk=asignacion_id).plan
+        if not plan:
+            plan = Plan.objects.first()
+        est = Estudiante.objects.create(apoderado=apod, **estudiante)
+        ins = Inscripcion.objects.create(estudiante=est, plan=plan)
+        matricula = Matricula.objects.create(inscripcion=ins, estudiante=est)
+        nuevo = Pago.objects.create(
+            inscripcion=ins, monto=pago['monto'], metodo=pago['metodo'],
+            estado='pendiente', estado_solicitado=pago['estado'],
+        )
+        for f in archivos:
+            Comprobante.objects.create(pago=nuevo, archivo=f)
+        if not reservar_cupo(matricula.pk, asignacion_id, retencion=retencion):
+            raise ValueError('La asignación seleccionada ya no tiene cupos disponibles.')
+        ins.asignacion_id = asignacion_id
+        ins.save(update_fields=['asignacion'])
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark del paso final del registro (sesión → base de datos): crea N "
+        "inscripciones completas con dos comprobantes cada una y reporta "
+        "consultas y latencia (p50/p95) por inscripción. La mitad reutiliza el "
+        "DNI del apoderado anterior. Usa la base de datos configurada (Postgres)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inscripciones', type=int, default=200)
+        parser.add_argument(
+            '--legado',
+            action='store_true',
+            help="Usa el camino anterior (consultas fila por fila) para comparar.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Este benchmark requiere PostgreSQL.")
+        n = options['inscripciones']
+        if n < 1:
+            raise CommandError("--inscripciones debe ser al menos 1.")
+        registrar = _inscripcion_legado if options['legado'] else registrar_inscripcion
+
+        plan, asignacion = self._preparar(n)
+        consultas, latencias = [], []
+        try:
+            with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+                for i in range(n):
+                    dni = f"Z{i - i % 2:07d}"  # pares: apoderado nuevo; impares: el mismo DNI
+                    retencion = f"{PREFIJO}-{i}"
+                    retener_cupo(asignacion.pk, retencion)
+                    datos = dict(
+                        apoderado={
+                            'dni': dni, 'nombres': f"Apoderado {i}", 'apellidos': PREFIJO,
+                            'telefono': f"BENCH{i - i % 2:09d}", 'correo': f"bench{i}@example.com",
+                            'direccion': '',
+                        },
+                        estudiante={
+                            'nombres': f"Estudiante {i}", 'apellidos': PREFIJO, 'edad': 10,
+                            'grado': '1° Prim', 'colegio': PREFIJO,
+                        },
+                        pago={'monto': 50, 'metodo': 'yape', 'estado': 'completado'},
+                        archivos=[
+                            SimpleUploadedFile(f"b{i}.pdf", PDF + str(i).encode()),
+                            SimpleUploadedFile(f"b{i}.png", PNG + str(i).encode()),
+                        ],
+                        plan_id=None,
+                        asignacion_id=asignacion.pk,
+                        retencion=retencion,
+                    )
+                    with CaptureQueriesContext(connection) as capturadas:
+                        inicio = time.perf_counter()
+                        registrar(**datos)
+                        latencias.append(time.perf_counter() - inicio)
+                    consultas.append(len(capturadas))
+
+            asignacion.refresh_from_db()
+            if asignacion.ocupados != n or asignacion.retenidos != 0:
+                raise CommandError(
+                    f"Cupos inconsistentes: ocupados={asignacion.ocupados}, retenidos={asignacion.retenidos}."
+                )
+            latencias.sort()
+            p50 = latencias[math.ceil(0.50 * n) - 1] * 1000
+            p95 = latencias[math.ceil(0.95 * n) - 1] * 1000
+            self.stdout.write(
+                f"{n} inscripciones ({'legado' if options['legado'] else 'registrar_inscripcion'}): "
+                f"{sum(consultas) / n:.1f} consultas/inscripción (máx {max(consultas)}), "
+                f"p50 {p50:.1f} ms, p95 {p95:.1f} ms"
+            )
+        finally:
+            self._limpiar(plan, asignacion)
+
+    def _preparar(self, n):
+        with transaction.atomic():
+            plan = Plan.objects.create(nombre=PREFIJO, nivel='primaria', activo=False)
+            asignacion = Asignacion.objects.create(plan=plan, cupo_maximo=n)
+        return plan, asignacion
+
+    def _limpiar(self, plan, asignacion):
+        with transaction.atomic():
+            # Solo las tareas de los pagos/comprobantes del benchmark: las del
+            # tráfico real que llegó mientras corría se quedan en la cola.
+            pagos = Pago.objects.filter(inscripcion__estudiante__apellidos=PREFIJO, inscripcion__estudiante__colegio=PREFIJO)
+            comprobantes = Comprobante.objects.filter(pago__in=pagos)
+            Tarea.objects.filter(nombre__startswith='pagos.tareas.').filter(
+                Q(argumentos__pago_id__in=list(pagos.values_list('pk', flat=True)))
+                | Q(argumentos__comprobante_id__in=list(comprobantes.values_list('pk', flat=True)))
+            ).delete()
+            Estudiante.objects.filter(apellidos=PREFIJO, colegio=PREFIJO).delete()
+            Apoderado.objects.filter(apellidos=PREFIJO).delete()
+            asignacion.delete()
+            plan.delete()
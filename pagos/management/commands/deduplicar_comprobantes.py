@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from pagos.almacenamiento import PREFIJO, detectar_tipo, huella, ruta_comprobante
+from pagos.models import Comprobante
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve los comprobantes antiguos al almacenamiento direccionado por "
+        "contenido (comprobantes/sha256/) y completa su huella SHA-256."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--borrar-originales',
+            action='store_true',
+            help="Elimina el archivo original una vez copiado al blob compartido.",
+        )
+
+    def handle(self, *args, **options):
+        storage = Comprobante._meta.get_field('archivo').storage
+        migrados = faltantes = 0
+        pendientes = Comprobante.objects.exclude(archivo='').exclude(archivo__isnull=True).filter(sha256='')
+        for c in pendientes.iterator():
+            original = c.archivo.name
+            if not storage.exists(original):
+                faltantes += 1
+                self.stderr.write(f"Comprobante #{c.pk}: no existe {original}")
+                continue
+            with storage.open(original, 'rb') as f:
+                c.tipo = detectar_tipo(f) or ''
+                c.sha256 = huella(f)
+                nuevo = storage.save(ruta_comprobante(c, original.rsplit('/', 1)[-1]), f)
+            Comprobante.objects.filter(pk=c.pk).update(archivo=nuevo, sha256=c.sha256, tipo=c.tipo)
+            if options['borrar_originales'] and not original.startswith(PREFIJO):
+                # Otro comprobante podría seguir apuntando al mismo original.
+                if not Comprobante.objects.filter(archivo=original).exists():
+                    storage.delete(original)
+            migrados += 1
+
+        blobs = Comprobante.objects.exclude(sha256='').values('sha256').distinct().count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Comprobantes migrados: {migrados} (sin archivo: {faltantes}). Blobs distintos: {blobs}."
+        ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from pagos.miniaturas import generar_miniatura
+from pagos.models import Comprobante
+from pagos.tareas import miniatura_comprobante
+
+
+class Command(BaseCommand):
+    help = "Genera las miniaturas WebP de los comprobantes de imagen que aún no tienen."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--encolar',
+            action='store_true',
+            help="En lugar de generarlas aquí, encola una tarea por comprobante para el worker.",
+        )
+        parser.add_argument(
+            '--regenerar',
+            action='store_true',
+            help="Vuelve a generar también las que ya existen.",
+        )
+
+    def handle(self, *args, **options):
+        qs = Comprobante.objects.filter(tipo__startswith='image/').exclude(archivo='')
+        if options['regenerar']:
+            storage = Comprobante._meta.get_field('miniatura').storage
+            for nombre in qs.exclude(miniatura='').values_list('miniatura', flat=True).distinct():
+                storage.delete(nombre)
+            qs.update(miniatura='')
+        qs = qs.filter(miniatura='')
+
+        if options['encolar']:
+            n = 0
+            for pk in qs.values_list('pk', flat=True).iterator():
+                miniatura_comprobante.encolar(comprobante_id=pk)
+                n += 1
+            self.stdout.write(self.style.SUCCESS(f"Tareas encoladas: {n}."))
+            return
+
+        generadas = fallidas = 0
+        vistos = set()
+        for c in qs.order_by('pk').iterator():
+            # Los comprobantes que comparten blob quedan resueltos con el primero.
+            if c.sha256 and c.sha256 in vistos:
+                continue
+            vistos.add(c.sha256)
+            if generar_miniatura(c):
+                generadas += 1
+            else:
+                fallidas += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Miniaturas generadas: {generadas} (no se pudieron generar: {fallidas})."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pagos.idempotencia import purgar_claves
+
+
+class Command(BaseCommand):
+    help = "Borra las claves de idempotencia vencidas de los formularios de pago. Pensado para cron diario."
+
+    def handle(self, *args, **options):
+        n = purgar_claves()
+        self.stdout.write(self.style.SUCCESS(f"{n} clave(s) de idempotencia vencida(s) borrada(s)."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pagos import recaudo
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla RecaudoDiario a partir de los pagos aprobados."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            help="Solo reconstruye desde esta fecha (YYYY-MM-DD). Por defecto, todo.",
+        )
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = recaudo.parsear_fecha(options['desde'])
+            if desde is None:
+                raise CommandError("Fecha inválida, usa el formato YYYY-MM-DD.")
+        n = recaudo.reconstruir(desde=desde)
+        self.stdout.write(self.style.SUCCESS(f"RecaudoDiario reconstruido: {n} grupos."))
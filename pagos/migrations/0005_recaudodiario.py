@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def poblar_recaudo(apps, schema_editor):
+    Pago = apps.get_model('pagos', 'Pago')
+    RecaudoDiario = apps.get_model('pagos', 'RecaudoDiario')
+    grupos = (
+        Pago.objects
+        .filter(estado__in=['parcial', 'completado'])
+        .annotate(
+            dia=TruncDate('fecha'),
+            grado_=F('inscripcion__estudiante__grado'),
+            asignacion_=F('inscripcion__asignacion_id'),
+        )
+        .values('dia', 'grado_', 'asignacion_', 'metodo')
+        .annotate(suma=Sum('monto'), n=Count('id'))
+        .order_by()
+    )
+    RecaudoDiario.objects.bulk_create([
+        RecaudoDiario(
+            fecha=g['dia'], grado=g['grado_'] or '', asignacion_id=g['asignacion_'],
+            metodo=g['metodo'], total=g['suma'], cantidad=g['n'],
+        )
+        for g in grupos
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0010_asignacion_ocupados'),
+        ('estudiantes', '0015_alter_estudiante_options_alter_inscripcion_options_and_more'),
+        ('pagos', '0004_alter_pago_options_pago_estado_solicitado_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecaudoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('grado', models.CharField(blank=True, max_length=10)),
+                ('metodo', models.CharField(max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('asignacion', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='docentes.asignacion')),
+            ],
+            options={
+                'verbose_name': 'Recaudo diario',
+                'verbose_name_plural': 'Recaudo diario',
+                'indexes': [models.Index(fields=['fecha'], name='recaudo_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'grado', 'asignacion', 'metodo'), name='uniq_recaudo_diario')],
+            },
+        ),
+        migrations.RunPython(poblar_recaudo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+import pagos.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0005_recaudodiario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comprobante',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='comprobante',
+            name='tipo',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='comprobante',
+            name='archivo',
+            field=models.FileField(blank=True, max_length=150, null=True, storage=pagos.almacenamiento.almacenamiento_comprobantes, upload_to=pagos.almacenamiento.ruta_comprobante),
+        ),
+    ]
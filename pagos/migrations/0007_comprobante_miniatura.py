@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:59
+
+import pagos.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0006_comprobante_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comprobante',
+            name='miniatura',
+            field=models.FileField(blank=True, editable=False, max_length=150, storage=pagos.almacenamiento.almacenamiento_comprobantes, upload_to=''),
+        ),
+    ]
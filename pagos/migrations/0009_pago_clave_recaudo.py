@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def poblar_clave(apps, schema_editor):
+    """Los pagos ya aprobados quedan en el grupo que les da su inscripción hoy."""
+    Pago = apps.get_model('pagos', 'Pago')
+    Inscripcion = apps.get_model('estudiantes', 'Inscripcion')
+    inscripcion = Inscripcion.objects.filter(pk=OuterRef('inscripcion_id'))
+    Pago.objects.filter(estado__in=('parcial', 'completado')).update(
+        recaudo_grado=Coalesce(Subquery(inscripcion.values('estudiante__grado')[:1]), Value('')),
+        recaudo_asignacion_id=Subquery(inscripcion.values('asignacion_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docentes', '0015_espera_cupo'),
+        ('estudiantes', '0016_matricula_fecha_id_idx'),
+        ('pagos', '0008_claves_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pago',
+            name='recaudo_asignacion',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='docentes.asignacion'),
+        ),
+        migrations.AddField(
+            model_name='pago',
+            name='recaudo_grado',
+            field=models.CharField(blank=True, editable=False, max_length=10),
+        ),
+        migrations.RunPython(poblar_clave, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+"""
+Miniaturas WebP de los comprobantes.
+
+Se generan una sola vez por blob (los comprobantes con el mismo SHA-256
+comparten miniatura) en el worker de tareas y quedan junto al original en
+`comprobantes/sha256/<ab>/<hash>.min.webp`. El campo `Comprobante.miniatura`
+hace de manifiesto: si está vacío la miniatura aún no existe y las vistas
+muestran un ícono en lugar de descargar el archivo original.
+"""
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.templatetags.static import static
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import seguimiento
+from .almacenamiento import PREFIJO
+
+logger = logging.getLogger(__name__)
+
+LADO_MAX = 240  # px; cubre la celda de 24 px y la vista previa de 90 px en pantallas 2x
+CALIDAD = 70
+
+ICONO_PDF = 'pagos/img/comprobante-pdf.svg'
+ICONO_ARCHIVO = 'pagos/img/comprobante.svg'
+
+
+def ruta_miniatura(sha256):
+    return f"{PREFIJO}{sha256[:2]}/{sha256}.min.webp"
+
+
+def generar_miniatura(comprobante):
+    """
+    Crea (o reutiliza) la miniatura del comprobante y la registra en todos
+    los comprobantes que comparten su blob. Devuelve el nombre guardado o
+    '' si el archivo no es una imagen que se pueda reducir (PDF, dañado).
+    """
+    from .models import Comprobante
+
+    if not comprobante.archivo or not comprobante.tipo.startswith('image/'):
+        return ''
+    storage = comprobante.archivo.storage
+    nombre = ruta_miniatura(comprobante.sha256) if comprobante.sha256 else ''
+
+    if not (nombre and storage.exists(nombre)):
+        try:
+            with comprobante.archivo.open('rb') as f, Image.open(f) as img:
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((LADO_MAX, LADO_MAX))
+                if img.mode not in ('RGB', 'RGBA'):
+                    img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+                salida = io.BytesIO()
+                img.save(salida, 'WEBP', quality=CALIDAD, method=4)
+        except (UnidentifiedImageError, OSError):
+            logger.warning("No se pudo generar la miniatura del comprobante #%s", comprobante.pk, exc_info=True)
+            return ''
+        nombre = storage.save(
+            nombre or f"comprobantes/miniaturas/{comprobante.pk}.webp",
+            ContentFile(salida.getvalue()),
+        )
+
+    destino = Comprobante.objects.filter(pk=comprobante.pk)
+    if comprobante.sha256:
+        destino = Comprobante.objects.filter(sha256=comprobante.sha256)
+    destino.update(miniatura=nombre)
+    seguimiento.invalidar_por_pagos(destino.values_list('pago_id', flat=True))
+    comprobante.miniatura.name = nombre
+    return nombre
+
+
+def url_miniatura(miniatura, tipo, storage):
+    """URL a mostrar en listados: la miniatura si existe, si no un ícono estático."""
+    if miniatura:
+        return storage.url(miniatura)
+    if tipo == 'application/pdf':
+        return static(ICONO_PDF)
+    return static(ICONO_ARCHIVO)
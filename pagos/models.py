@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils import timezone
 
+from .almacenamiento import almacenamiento_comprobantes, detectar_tipo, huella, ruta_comprobante
+
 class Pago(models.Model):
     ESTADO_CHOICES = [
         ('pendiente', 'Pendiente'),
@@ -30,17 +32,125 @@ class Pago(models.Model):
         help_text="Lo que el apoderado indicó (parcial o completado). No cambia a menos que lo edites."
     )
 
+    # Grupo de RecaudoDiario en el que se sumó el pago al aprobarse. Las
+    # restas usan este mismo grupo aunque después cambie el grado del
+    # estudiante o la asignación de la inscripción (ver pagos.recaudo).
+    recaudo_grado = models.CharField(max_length=10, blank=True, editable=False)
+    recaudo_asignacion = models.ForeignKey(
+        'docentes.Asignacion',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+    )
+
     def aprobar(self):
         """Usado por el Admin: pasa el estado real a lo que solicitó el apoderado."""
-        self.estado = self.estado_solicitado
-        self.save(update_fields=['estado'])
+        return self._transicionar(None)
 
     def rechazar(self):
-        self.estado = 'rechazado'
-        self.save(update_fields=['estado'])
+        return self._transicionar('rechazado')
+
+    def _transicionar(self, estado):
+        from .services import transicionar_pagos
+        resumen = transicionar_pagos([self.pk], estado)
+        fila = Pago.objects.filter(pk=self.pk).values_list('estado', flat=True).first()
+        if fila:
+            self.estado = fila
+        return resumen
 
 
 class Comprobante(models.Model):
     pago = models.ForeignKey('Pago', on_delete=models.CASCADE, related_name='comprobantes')
-    archivo = models.FileField(upload_to='comprobantes/', null=True, blank=True)
+    archivo = models.FileField(
+        upload_to=ruta_comprobante,
+        storage=almacenamiento_comprobantes,
+        max_length=150,
+        null=True,
+        blank=True,
+    )
+    # Huella y tipo real del archivo; varios comprobantes pueden compartir blob.
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    tipo = models.CharField(max_length=50, blank=True, editable=False)
+    # WebP reducido que genera el worker (`pagos.miniaturas`); vacío mientras no exista.
+    miniatura = models.FileField(
+        storage=almacenamiento_comprobantes,
+        max_length=150,
+        blank=True,
+        editable=False,
+    )
     fecha = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        f = self.archivo
+        if f and not f._committed:
+            self.tipo = detectar_tipo(f.file) or ''
+            self.sha256 = huella(f.file)
+        super().save(*args, **kwargs)
+
+    @property
+    def miniatura_url(self):
+        from .miniaturas import url_miniatura
+        return url_miniatura(self.miniatura.name, self.tipo, self.miniatura.storage)
+
+
+class RecaudoDiario(models.Model):
+    """
+    Agregado incremental de pagos aprobados (parcial/completado) por
+    día × grado × asignación × método. Lo mantiene `pagos.recaudo` cada vez
+    que un pago entra o sale de esos estados; se reconstruye con
+    `manage.py reconstruir_recaudo`.
+    """
+    fecha = models.DateField()
+    grado = models.CharField(max_length=10, blank=True)
+    # Sin FK real: si la asignación se borra el agregado no debe perderse
+    # (la reconstrucción lo mueve al grupo "sin asignación").
+    asignacion = models.ForeignKey(
+        'docentes.Asignacion',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    metodo = models.CharField(max_length=20)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cantidad = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.fecha} {self.grado or '—'} {self.metodo}: S/ {self.total}"
+
+    class Meta:
+        verbose_name = "Recaudo diario"
+        verbose_name_plural = "Recaudo diario"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'grado', 'asignacion', 'metodo'],
+                name='uniq_recaudo_diario',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['fecha'], name='recaudo_fecha_idx'),
+        ]
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de un POST público (ver pagos.idempotencia): si el
+    mismo formulario se reenvía con la misma clave se repite la redirección
+    original sin volver a crear registros ni archivos.
+    """
+    clave = models.CharField(max_length=64, unique=True)
+    ruta = models.CharField(max_length=200)
+    respuesta = models.CharField(max_length=500, blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.clave} → {self.respuesta or '(en curso)'}"
+
+    class Meta:
+        verbose_name = "Clave de idempotencia"
+        verbose_name_plural = "Claves de idempotencia"
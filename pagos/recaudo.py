@@ -0,0 +1,217 @@
+"""
+Mantenimiento incremental de `RecaudoDiario` y consultas del tablero de
+"Gestión de dinero". Los pagos cuentan solo mientras están en
+parcial/completado; cada entrada o salida de esos estados suma o resta su
+monto en el grupo día × grado × asignación × método correspondiente.
+
+El grado y la asignación del grupo se guardan en el pago al entrar
+(`Pago.recaudo_grado`/`recaudo_asignacion`) y las salidas restan de ese
+mismo grupo: editar el grado del estudiante o mover la inscripción de
+grupo no descuadra el agregado. Quien cambia la asignación de
+inscripciones ya aprobadas mueve sus montos con `reasignar`.
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncWeek
+from django.utils import timezone
+
+from .models import Pago, RecaudoDiario
+
+ESTADOS_RECAUDO = ('parcial', 'completado')
+
+_CLAVE = {
+    'dia': TruncDate('fecha'),
+    'grado_': F('recaudo_grado'),
+    'asignacion_': F('recaudo_asignacion_id'),
+}
+
+
+def _agrupar(pagos):
+    """Suma los pagos dados por grupo de RecaudoDiario (una consulta)."""
+    return (
+        pagos
+        .annotate(**_CLAVE)
+        .values('dia', 'grado_', 'asignacion_', 'metodo')
+        .annotate(suma=Sum('monto'), n=Count('id'))
+        .order_by()
+    )
+
+
+def _fijar_clave(pagos):
+    """Guarda en los pagos el grado y la asignación actuales de su inscripción (un UPDATE)."""
+    from estudiantes.models import Inscripcion
+    inscripcion = Inscripcion.objects.filter(pk=OuterRef('inscripcion_id'))
+    return pagos.update(
+        recaudo_grado=Coalesce(Subquery(inscripcion.values('estudiante__grado')[:1]), Value('')),
+        recaudo_asignacion_id=Subquery(inscripcion.values('asignacion_id')[:1]),
+    )
+
+
+def _acumular(fecha, grado, asignacion_id, metodo, total, cantidad):
+    clave = dict(fecha=fecha, grado=grado or '', asignacion_id=asignacion_id, metodo=metodo)
+
+    def actualizar():
+        return RecaudoDiario.objects.filter(**clave).update(
+            total=F('total') + total, cantidad=F('cantidad') + cantidad,
+        )
+
+    if actualizar():
+        return
+    try:
+        with transaction.atomic():
+            RecaudoDiario.objects.create(total=total, cantidad=cantidad, **clave)
+    except IntegrityError:
+        # Otra transacción creó el grupo primero.
+        actualizar()
+
+
+def _sumar(pagos, signo):
+    for g in _agrupar(pagos):
+        _acumular(g['dia'], g['grado_'], g['asignacion_'], g['metodo'], signo * g['suma'], signo * g['n'])
+
+
+def sumar_pagos(pago_ids, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) los pagos indicados en el agregado.
+    Al sumar fija antes el grupo de cada pago; al restar usa el guardado.
+    """
+    pago_ids = list(pago_ids)
+    if not pago_ids:
+        return
+    pagos = Pago.objects.filter(pk__in=pago_ids)
+    if signo > 0:
+        _fijar_clave(pagos)
+    _sumar(pagos, signo)
+
+
+def reasignar(inscripcion_ids):
+    """
+    Mueve los pagos aprobados de las inscripciones dadas al grupo que les
+    corresponde ahora (tras cambiarles la asignación). Devuelve cuántos movió.
+    """
+    from estudiantes.models import Inscripcion
+    actual = Inscripcion.objects.filter(pk=OuterRef('inscripcion_id'))
+    movidos = list(
+        Pago.objects
+        .filter(inscripcion_id__in=list(inscripcion_ids), estado__in=ESTADOS_RECAUDO)
+        .exclude(Exists(actual.filter(
+            estudiante__grado=OuterRef('recaudo_grado'),
+            asignacion_id=OuterRef('recaudo_asignacion_id'),
+        )))
+        .values_list('pk', flat=True)
+    )
+    if movidos:
+        sumar_pagos(movidos, signo=-1)
+        sumar_pagos(movidos)
+    return len(movidos)
+
+
+def retirar_pago(pago):
+    """Descuenta un pago aprobado que se va a borrar."""
+    if pago.estado in ESTADOS_RECAUDO:
+        _acumular(timezone.localdate(pago.fecha), pago.recaudo_grado, pago.recaudo_asignacion_id,
+                  pago.metodo, -pago.monto, -1)
+
+
+def ajustar_pago(pago, estado_anterior=None, monto_anterior=None, metodo_anterior=None):
+    """
+    Refleja el cambio de un pago guardado individualmente (admin, aprobar,
+    rechazar). Los valores `*_anterior` son los que tenía antes de guardar;
+    si era nuevo se pasan como None.
+    """
+    contaba = estado_anterior in ESTADOS_RECAUDO
+    cuenta = pago.estado in ESTADOS_RECAUDO
+    if not contaba and not cuenta:
+        return
+    if contaba and cuenta and monto_anterior == pago.monto and metodo_anterior == pago.metodo:
+        return
+    fecha = timezone.localdate(pago.fecha)
+    if contaba:
+        _acumular(fecha, pago.recaudo_grado, pago.recaudo_asignacion_id, metodo_anterior, -monto_anterior, -1)
+    elif cuenta:
+        # Recién aprobado: el grupo es el de la inscripción en este momento.
+        pago.recaudo_grado, pago.recaudo_asignacion_id = _clave_inscripcion(pago.inscripcion_id)
+        Pago.objects.filter(pk=pago.pk).update(
+            recaudo_grado=pago.recaudo_grado, recaudo_asignacion_id=pago.recaudo_asignacion_id,
+        )
+    if cuenta:
+        _acumular(fecha, pago.recaudo_grado, pago.recaudo_asignacion_id, pago.metodo, pago.monto, 1)
+
+
+def _clave_inscripcion(inscripcion_id):
+    from estudiantes.models import Inscripcion
+    fila = (
+        Inscripcion.objects
+        .filter(pk=inscripcion_id)
+        .values_list('estudiante__grado', 'asignacion_id')
+        .first()
+    )
+    return (fila[0] or '', fila[1]) if fila else ('', None)
+
+
+@transaction.atomic
+def reconstruir(desde=None):
+    """Recalcula el agregado desde los pagos (todo o a partir de `desde`)."""
+    pagos = Pago.objects.filter(estado__in=ESTADOS_RECAUDO)
+    agregados = RecaudoDiario.objects.all()
+    if desde:
+        pagos = pagos.annotate(dia=TruncDate('fecha')).filter(dia__gte=desde)
+        agregados = agregados.filter(fecha__gte=desde)
+    agregados.delete()
+    # Asignaciones borradas: sus pagos pasan al grupo "sin asignación".
+    from docentes.models import Asignacion
+    Pago.objects.filter(recaudo_asignacion__isnull=False).exclude(
+        Exists(Asignacion.objects.filter(pk=OuterRef('recaudo_asignacion_id')))
+    ).update(recaudo_asignacion=None)
+    filas = [
+        RecaudoDiario(
+            fecha=g['dia'], grado=g['grado_'] or '', asignacion_id=g['asignacion_'],
+            metodo=g['metodo'], total=g['suma'], cantidad=g['n'],
+        )
+        for g in _agrupar(pagos)
+    ]
+    RecaudoDiario.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
+
+
+def resumen(desde=None, hasta=None, serie='dia'):
+    """Datos del tablero servidos desde el agregado, no desde Pago."""
+    qs = RecaudoDiario.objects.all()
+    if desde:
+        qs = qs.filter(fecha__gte=desde)
+    if hasta:
+        qs = qs.filter(fecha__lte=hasta)
+
+    total = qs.aggregate(total=Sum('total')).get('total') or 0
+    por_grado = (
+        qs.values('grado')
+        .annotate(total=Sum('total'), count=Sum('cantidad'))
+        .order_by('-total')
+    )
+    por_asignacion = (
+        qs.values('asignacion_id', 'asignacion__plan__nombre')
+        .annotate(total=Sum('total'), count=Sum('cantidad'))
+        .order_by('-total')
+    )
+    periodo = TruncWeek('fecha') if serie == 'semana' else F('fecha')
+    por_periodo = (
+        qs.annotate(periodo=periodo)
+        .values('periodo')
+        .annotate(total=Sum('total'), count=Sum('cantidad'))
+        .order_by('periodo')
+    )
+    return {
+        'total_recaudo': total,
+        'por_grado': por_grado,
+        'por_asignacion': por_asignacion,
+        'por_periodo': por_periodo,
+    }
+
+
+def parsear_fecha(valor):
+    try:
+        return datetime.date.fromisoformat(valor) if valor else None
+    except ValueError:
+        return None
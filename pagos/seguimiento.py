@@ -0,0 +1,93 @@
+"""
+Snapshot cacheado de la página pública de seguimiento (/pagos/seguimiento/<código>/).
+
+Los apoderados recargan esa página mientras esperan la aprobación, así que
+el GET se sirve desde la caché sin tocar la base de datos. El snapshot solo
+guarda datos planos (sin instancias de modelos) y se invalida al confirmar
+cualquier cambio en la inscripción, sus pagos o sus comprobantes.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from estudiantes.models import Inscripcion
+
+TTL = 15 * 60
+
+
+def _clave(code):
+    return f"pagos:seguimiento:{code}"
+
+
+def construir(ins):
+    """Arma el snapshot de una inscripción (3 consultas)."""
+    pagos = []
+    hay_pendiente = False
+    for p in ins.pago_set.prefetch_related("comprobantes").order_by("-id"):
+        hay_pendiente = hay_pendiente or p.estado == "pendiente"
+        pagos.append({
+            "id": p.id,
+            "monto": p.monto,
+            "metodo": p.get_metodo_display(),
+            "estado": p.get_estado_display(),
+            "fecha": p.fecha,
+            "comprobantes": [
+                {"url": c.archivo.url, "miniatura_url": c.miniatura_url}
+                for c in p.comprobantes.all()
+                if c.archivo
+            ],
+        })
+    return {
+        "inscripcion": {
+            "id": ins.id,
+            "estudiante": f"{ins.estudiante.apellidos} {ins.estudiante.nombres}",
+            "plan": str(ins.plan),
+            "estado_pago": ins.estado_pago,
+            "access_code": ins.access_code,
+        },
+        "pagos": pagos,
+        "hay_pendiente": hay_pendiente,
+        "puede_subir": ins.estado_pago != "total" and not hay_pendiente,
+    }
+
+
+def obtener(code):
+    """Snapshot del código de acceso (desde la caché si está), o None si no existe."""
+    snapshot = cache.get(_clave(code))
+    if snapshot is not None:
+        return snapshot
+    ins = (
+        Inscripcion.objects
+        .select_related("estudiante", "plan")
+        .filter(access_code=code)
+        .first()
+    )
+    if ins is None:
+        return None
+    snapshot = construir(ins)
+    cache.set(_clave(code), snapshot, TTL)
+    return snapshot
+
+
+def invalidar_codigos(codes):
+    claves = [_clave(c) for c in codes if c]
+    if claves:
+        # Tras el commit: si se borrara antes, una lectura concurrente podría
+        # volver a guardar el estado anterior.
+        transaction.on_commit(lambda: cache.delete_many(claves))
+
+
+def invalidar(inscripcion_ids):
+    invalidar_codigos(
+        Inscripcion.objects.filter(pk__in=list(inscripcion_ids))
+        .exclude(access_code__isnull=True)
+        .values_list("access_code", flat=True)
+    )
+
+
+def invalidar_por_pagos(pago_ids):
+    invalidar_codigos(
+        Inscripcion.objects.filter(pago__in=list(pago_ids))
+        .exclude(access_code__isnull=True)
+        .values_list("access_code", flat=True)
+        .distinct()
+    )
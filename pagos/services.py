@@ -1,5 +1,24 @@
-from django.db import transaction
+import logging
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, Exists, Q, QuerySet, Sum, Value, When
+from django.utils.crypto import get_random_string
+
+from apoderados.models import Apoderado
+from apoderados.services import normalizar_correo
+from estudiantes.models import Estudiante, Inscripcion, Matricula
+from docentes.models import Asignacion
+from docentes.services import asignar_grupos, encolar_espera, reclamar_cupo, reservar_cupo
+from estudiantes.services import eliminar_inscripciones_provisionales
+from planes.models import Plan
+from . import recaudo, seguimiento
+from .almacenamiento import detectar_tipo, huella
 from .models import Pago, Comprobante
+from .tareas import correo_pago_aprobado, miniatura_comprobante
+
+logger = logging.getLogger(__name__)
 
 def _mapear_estado_inscripcion_desde_pago(estado_pago_real: str) -> str:
     if estado_pago_real == 'completado':
@@ -30,3 +49,372 @@ def registrar_pago_con_comprobantes(inscripcion, pago_data, archivos_list):
     inscripcion.save(update_fields=['estado_pago'])
 
     return pago
+
+
+ESTADOS_APROBADOS = ('parcial', 'completado')
+
+
+def sincronizar_inscripciones(inscripcion_ids):
+    """
+    Recalcula, a partir de sus pagos, el estado de pago de cada inscripción y
+    el estado/monto de su matrícula. Usa una agregación agrupada y escrituras
+    en bloque, así que el número de consultas no depende de cuántas sean.
+    """
+    inscripciones = {
+        ins_id: est_id
+        for ins_id, est_id in Inscripcion.objects.filter(pk__in=inscripcion_ids).values_list('id', 'estudiante_id')
+    }
+    if not inscripciones:
+        return
+
+    resumen = {
+        r['inscripcion_id']: r
+        for r in (
+            Pago.objects
+            .filter(inscripcion_id__in=inscripciones)
+            .values('inscripcion_id')
+            .annotate(
+                completados=Count('id', filter=Q(estado='completado')),
+                parciales=Count('id', filter=Q(estado='parcial')),
+                total=Sum('monto', filter=Q(estado__in=ESTADOS_APROBADOS)),
+            )
+        )
+    }
+
+    por_estado = defaultdict(list)
+    montos = {}
+    for ins_id in inscripciones:
+        r = resumen.get(ins_id, {})
+        if r.get('completados'):
+            estado = 'total'
+        elif r.get('parciales'):
+            estado = 'parcial'
+        else:
+            estado = 'pendiente'
+        por_estado[estado].append(ins_id)
+        montos[ins_id] = r.get('total') or 0
+
+    for estado, ids in por_estado.items():
+        Inscripcion.objects.filter(pk__in=ids).exclude(estado_pago=estado).update(estado_pago=estado)
+    aprobadas = set(por_estado['total']) | set(por_estado['parcial'])
+    if aprobadas:
+        # Un pago aprobado confirma la inscripción provisional.
+        Inscripcion.objects.filter(pk__in=aprobadas, provisional=True).update(provisional=False)
+
+    existentes = list(Matricula.objects.filter(inscripcion_id__in=inscripciones))
+    con_matricula = set()
+    for m in existentes:
+        con_matricula.add(m.inscripcion_id)
+        m.estado = 'activo' if m.inscripcion_id in aprobadas else 'inactivo'
+        m.monto_referencial = montos[m.inscripcion_id]
+    if existentes:
+        Matricula.objects.bulk_update(existentes, ['estado', 'monto_referencial'])
+
+    nuevas = [
+        Matricula(
+            inscripcion_id=ins_id,
+            estudiante_id=est_id,
+            estado='activo' if ins_id in aprobadas else 'inactivo',
+            monto_referencial=montos[ins_id],
+        )
+        for ins_id, est_id in inscripciones.items()
+        if ins_id not in con_matricula
+    ]
+    if nuevas:
+        Matricula.objects.bulk_create(nuevas)
+
+
+def asegurar_codigos_acceso(inscripcion_ids):
+    """Genera access_code para las inscripciones que aún no lo tienen."""
+    sin_codigo = list(
+        Inscripcion.objects.filter(pk__in=inscripcion_ids)
+        .filter(Q(access_code__isnull=True) | Q(access_code=''))
+        .only('id')
+    )
+    for ins in sin_codigo:
+        ins.access_code = get_random_string(10).upper()
+    if sin_codigo:
+        Inscripcion.objects.bulk_update(sin_codigo, ['access_code'])
+
+
+# Estados reales a los que puede pasar un pago desde cada estado. Un pago
+# rechazado no vuelve atrás: su inscripción provisional ya se revirtió.
+TRANSICIONES = {
+    'pendiente': {'parcial', 'completado', 'rechazado'},
+    'parcial': {'completado', 'rechazado'},
+    'completado': {'parcial', 'rechazado'},
+    'rechazado': set(),
+}
+
+
+@contextmanager
+def contar_consultas():
+    """Cuenta las consultas SQL ejecutadas dentro del bloque (sin guardar el SQL)."""
+    contador = {'n': 0}
+
+    def envoltura(execute, sql, params, many, context):
+        contador['n'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(envoltura):
+        yield contador
+
+
+def planificar_transiciones(filas, estado=None):
+    """
+    Decide qué hacer con cada pago sin tocar la base de datos.
+    `filas` son tuplas (id, inscripcion_id, estado, estado_solicitado);
+    `estado=None` aprueba con lo que solicitó el apoderado.
+    Devuelve ({(origen, destino): [(id, inscripcion_id), ...]}, sin_cambio, invalidos).
+    """
+    plan = defaultdict(list)
+    sin_cambio, invalidos = [], []
+    for pk, inscripcion_id, actual, solicitado in filas:
+        destino = estado or solicitado
+        if destino == actual:
+            sin_cambio.append(pk)
+        elif destino not in TRANSICIONES.get(actual, ()):
+            invalidos.append(pk)
+        else:
+            plan[(actual, destino)].append((pk, inscripcion_id))
+    return plan, sin_cambio, invalidos
+
+
+@transaction.atomic
+def transicionar_pagos(pagos, estado=None):
+    """
+    Único punto de entrada para cambiar el estado real de los pagos (admin,
+    acciones masivas, Pago.aprobar/rechazar). Bloquea las filas, planifica
+    las transiciones válidas y aplica el mínimo de escrituras en una sola
+    transacción: un UPDATE por estado destino, el ajuste del agregado de
+    recaudo, la reversión de inscripciones provisionales rechazadas, la
+    sincronización de inscripciones/matrículas y un único correo por lote.
+
+    Es idempotente: los pagos que ya están en el estado destino no se tocan.
+    `pagos` puede ser un queryset o una lista de ids. Devuelve un resumen con
+    lo aplicado y las consultas usadas.
+    """
+    with contar_consultas() as consultas:
+        ids = pagos.values('pk') if isinstance(pagos, QuerySet) else list(pagos)
+        filas = list(
+            Pago.objects
+            .filter(pk__in=ids)
+            .select_for_update()
+            .order_by('pk')
+            .values_list('id', 'inscripcion_id', 'estado', 'estado_solicitado')
+        )
+        plan, sin_cambio, invalidos = planificar_transiciones(filas, estado)
+
+        por_destino = defaultdict(list)
+        entran, salen, recien_aprobados = [], [], []
+        rechazadas, tocadas = set(), set()
+        for (origen, destino), items in plan.items():
+            pks = [pk for pk, _ in items]
+            por_destino[destino].extend(pks)
+            tocadas.update(ins_id for _, ins_id in items)
+            if origen not in ESTADOS_APROBADOS and destino in ESTADOS_APROBADOS:
+                entran.extend(pks)
+                recien_aprobados.extend(items)
+            elif origen in ESTADOS_APROBADOS and destino not in ESTADOS_APROBADOS:
+                salen.extend(pks)
+            if destino == 'rechazado':
+                rechazadas.update(ins_id for _, ins_id in items)
+
+        if tocadas:
+            # Antes de revertir: las inscripciones rechazadas dejan de existir.
+            seguimiento.invalidar(tocadas)
+
+        for destino, pks in por_destino.items():
+            Pago.objects.filter(pk__in=pks).update(estado=destino)
+
+        # update() no dispara señales: el agregado de recaudo se ajusta aquí.
+        recaudo.sumar_pagos(entran)
+        recaudo.sumar_pagos(salen, signo=-1)
+
+        if rechazadas:
+            eliminar_inscripciones_provisionales(rechazadas)
+        if tocadas:
+            sincronizar_inscripciones(tocadas)
+        if recien_aprobados:
+            aprobadas = {ins_id for _, ins_id in recien_aprobados}
+            # Las matrículas recién activadas sin grupo reciben uno de su plan.
+            asignar_grupos(
+                Matricula.objects.filter(inscripcion_id__in=aprobadas, estado='activo').values('pk')
+            )
+            asegurar_codigos_acceso(aprobadas)
+            # Una tarea por pago: un fallo SMTP solo reintenta ese correo.
+            correo_pago_aprobado.encolar_lote([{'pago_id': pk} for pk, _ in recien_aprobados])
+
+    resumen = {
+        'aplicados': sum(len(items) for items in plan.values()),
+        'sin_cambio': len(sin_cambio),
+        'invalidos': len(invalidos),
+        'transiciones': {f"{o}→{d}": len(items) for (o, d), items in plan.items()},
+        'consultas': consultas['n'],
+    }
+    logger.info("Transición de pagos: %s", resumen)
+    return resumen
+
+
+def reservar_cupo_de_inscripcion(inscripcion):
+    """
+    Reserva el cupo de la asignación elegida en la inscripción (si tiene una)
+    para su matrícula. Idempotente. Si ya no hay cupo la matrícula queda en
+    la lista de espera: devuelve su puesto en la cola, o 0 si obtuvo el cupo.
+    """
+    if not inscripcion.asignacion_id:
+        return 0
+    matricula, _ = Matricula.objects.get_or_create(
+        inscripcion=inscripcion,
+        defaults={'estudiante_id': inscripcion.estudiante_id},
+    )
+    if reservar_cupo(matricula.pk, inscripcion.asignacion_id):
+        return 0
+    return encolar_espera(matricula.pk, inscripcion.asignacion_id)
+
+
+# --- Registro completo (de la sesión a la base de datos) ------------------
+#
+# El paso final del registro público crea apoderado, estudiante,
+# inscripción, matrícula, pago y comprobantes. Antes eran una cadena de
+# consultas fila por fila (buscar apoderado, actualizarlo o crearlo, buscar
+# plan, fallback a Plan.first(), cada INSERT, la reserva, el UPDATE de la
+# inscripción y un INSERT por comprobante); `registrar_inscripcion` hace lo
+# mismo con un INSERT ... ON CONFLICT para el apoderado, una consulta para
+# el plan, un bulk_create para los comprobantes y una sola sentencia para el
+# cupo. `manage.py benchmark_inscripciones` mide consultas y latencia.
+
+InscripcionRegistrada = namedtuple('InscripcionRegistrada', 'inscripcion matricula pago puesto')
+# puesto: 0 si tomó el cupo (o no eligió asignación); si no, su lugar en la lista de espera.
+
+_SQL_APODERADO = """
+INSERT INTO {tabla} AS t (dni, nombres, apellidos, telefono, correo, correo_normalizado, direccion)
+VALUES (%(dni)s, %(nombres)s, %(apellidos)s, %(telefono)s, %(correo)s, %(correo_normalizado)s, %(direccion)s)
+ON CONFLICT (dni) DO UPDATE SET
+    nombres = COALESCE(NULLIF(EXCLUDED.nombres, ''), t.nombres),
+    apellidos = COALESCE(NULLIF(EXCLUDED.apellidos, ''), t.apellidos),
+    telefono = COALESCE(NULLIF(EXCLUDED.telefono, ''), t.telefono),
+    correo = COALESCE(NULLIF(EXCLUDED.correo, ''), t.correo),
+    correo_normalizado = CASE WHEN NULLIF(EXCLUDED.correo, '') IS NULL
+                              THEN t.correo_normalizado ELSE EXCLUDED.correo_normalizado END,
+    direccion = COALESCE(NULLIF(EXCLUDED.direccion, ''), t.direccion)
+RETURNING id
+"""
+
+
+def _guardar_apoderado(datos):
+    """
+    Crea el apoderado o, si el DNI ya existe, actualiza los datos de contacto
+    que vengan informados (los vacíos conservan lo guardado). Una consulta.
+    """
+    if not datos.get('dni'):
+        return Apoderado.objects.create(
+            nombres=datos.get('nombres'),
+            apellidos=datos.get('apellidos'),
+            telefono=datos.get('telefono'),
+            correo=datos.get('correo'),
+            direccion=datos.get('direccion') or '',
+        ).pk
+    params = {
+        'dni': datos['dni'],
+        'nombres': datos.get('nombres') or '',
+        'apellidos': datos.get('apellidos') or '',
+        'telefono': datos.get('telefono') or '',
+        'correo': datos.get('correo') or None,
+        'correo_normalizado': normalizar_correo(datos.get('correo')),
+        'direccion': datos.get('direccion') or '',
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_SQL_APODERADO.format(tabla=connection.ops.quote_name(Apoderado._meta.db_table)), params)
+        return cursor.fetchone()[0]
+
+
+def _resolver_plan(plan_id, asignacion_id):
+    """
+    Plan de la inscripción en una consulta: el elegido, si no el de la
+    asignación y si no el primero. Devuelve (plan_id, asignacion_existe).
+    """
+    fila = (
+        Plan.objects
+        .annotate(
+            prioridad=Case(
+                When(pk=plan_id or 0, then=Value(0)),
+                When(asignaciones__pk=asignacion_id or 0, then=Value(1)),
+                default=Value(2),
+            ),
+            asignacion_existe=Exists(Asignacion.objects.filter(pk=asignacion_id or 0)),
+        )
+        .order_by('prioridad', 'pk')
+        .values_list('pk', 'asignacion_existe')
+        .first()
+    )
+    return fila or (None, False)
+
+
+def _crear_comprobantes(pago, archivos):
+    """
+    Inserta los comprobantes con un bulk_create. Calcula tipo y huella como
+    Comprobante.save() y encola las miniaturas que encolaría su post_save.
+    """
+    comprobantes = []
+    for f in archivos:
+        c = Comprobante(pago=pago, archivo=f)
+        c.tipo = detectar_tipo(c.archivo.file) or ''
+        c.sha256 = huella(c.archivo.file)
+        comprobantes.append(c)
+    # El FileField sube cada archivo en su pre_save, también con bulk_create.
+    comprobantes = Comprobante.objects.bulk_create(comprobantes)
+    for c in comprobantes:
+        if c.tipo.startswith('image/'):
+            miniatura_comprobante.encolar(comprobante_id=c.pk)
+    return comprobantes
+
+
+@transaction.atomic
+def registrar_inscripcion(apoderado, estudiante, pago, archivos=(), plan_id=None, asignacion_id=None,
+                          retencion=None):
+    """
+    Guarda un registro completo: apoderado (por DNI), estudiante, inscripción
+    provisional, matrícula, pago pendiente con sus comprobantes y el cupo de
+    la asignación (convirtiendo la retención `retencion`, si la hay). Sin
+    cupo, la matrícula queda en lista de espera.
+
+    `apoderado`, `estudiante` y `pago` son dicts con los datos de los
+    formularios (no lee la sesión), así que sirve igual para el registro
+    público que para uno cargado por administración.
+    Devuelve InscripcionRegistrada.
+    """
+    plan_id, asignacion_existe = _resolver_plan(plan_id, asignacion_id)
+    if asignacion_id and not asignacion_existe:
+        raise ValueError('La asignación seleccionada ya no existe.')
+    apoderado_id = _guardar_apoderado(apoderado)
+
+    est = Estudiante.objects.create(
+        nombres=estudiante.get('nombres'),
+        apellidos=estudiante.get('apellidos'),
+        grado=estudiante.get('grado'),
+        colegio=estudiante.get('colegio'),
+        edad=estudiante.get('edad'),
+        apoderado_id=apoderado_id,
+    )
+    ins = Inscripcion.objects.create(estudiante=est, plan_id=plan_id, asignacion_id=asignacion_id or None)
+    matricula = Matricula.objects.create(inscripcion=ins, estudiante=est)
+
+    # bulk_create no emite post_save, y aquí no hace falta: un pago pendiente
+    # no suma al recaudo y la inscripción nueva aún no tiene código de
+    # seguimiento que invalidar.
+    nuevo, = Pago.objects.bulk_create([Pago(
+        inscripcion=ins,
+        monto=pago['monto'],
+        metodo=pago['metodo'],
+        estado='pendiente',
+        estado_solicitado=pago.get('estado') or 'parcial',
+    )])
+    _crear_comprobantes(nuevo, archivos)
+
+    # El cupo al final: la fila de la asignación queda bloqueada solo entre
+    # esta sentencia y el commit.
+    puesto = 0
+    if asignacion_id and not reclamar_cupo(matricula.pk, asignacion_id, retencion):
+        puesto = encolar_espera(matricula.pk, asignacion_id)
+    return InscripcionRegistrada(ins, matricula, nuevo, puesto)
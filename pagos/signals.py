@@ -1,110 +1,94 @@
-from django.db import transaction
-from django.db.models.signals import post_save
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import Pago
-from estudiantes.models import Matricula, Estudiante, Inscripcion
-from django.core.exceptions import ObjectDoesNotExist
+from estudiantes.models import Inscripcion
+from .models import Pago, Comprobante
+from .tareas import miniatura_comprobante
+from . import recaudo, seguimiento
+
+# Los cambios de estado de Pago (reserva, confirmación o reversión de la
+# inscripción) no viven en señales: pasan por services.transicionar_pagos.
+
+# Los borrados en bloque (estudiantes.services.eliminar_inscripciones_provisionales)
+# descuentan el recaudo e invalidan el seguimiento una vez por lote y
+# desactivan estos handlers, que harían una consulta por pago o comprobante.
+_pagos_gestionados = ContextVar('pagos_gestionados', default=False)
+
+
+@contextmanager
+def pagos_gestionados():
+    token = _pagos_gestionados.set(True)
+    try:
+        yield
+    finally:
+        _pagos_gestionados.reset(token)
+
+
+@receiver(pre_save, sender=Pago)
+def pago_pre_save(sender, instance: Pago, update_fields=None, **kwargs):
+    """Remember the stored estado/monto/metodo so the revenue rollup can apply a delta."""
+    instance._recaudo_previo = (None, None, None)
+    if instance._state.adding or not instance.pk:
+        return
+    if update_fields is not None and not set(update_fields) & {'estado', 'monto', 'metodo'}:
+        instance._recaudo_previo = None
+        return
+    previo = (
+        Pago.objects.filter(pk=instance.pk)
+        .values_list('estado', 'monto', 'metodo', 'recaudo_grado', 'recaudo_asignacion_id')
+        .first()
+    )
+    if previo:
+        instance._recaudo_previo = previo[:3]
+        # El grupo del recaudo solo lo escribe pagos.recaudo: la instancia
+        # puede traerlo desactualizado y un save() completo lo pisaría.
+        instance.recaudo_grado, instance.recaudo_asignacion_id = previo[3:]
+
 
 @receiver(post_save, sender=Pago)
-def pago_post_save(sender, instance: Pago, created, **kwargs):
-    """
-    - On creation: try to reserve the asignacion (add to Matricula) if Inscripcion has asignacion.
-    - On state change to 'rechazado': if inscripcion is provisional, rollback (delete inscripcion, matricula, estudiante if appropriate).
-    - On state change to 'parcial' or 'completado': finalize provisional inscription.
-    """
-    pago = instance
-    ins = getattr(pago, 'inscripcion', None)
-    if ins is None:
-        # Defensive: if for any reason the Pago lacks an Inscripcion, bail out.
+def pago_recaudo_post_save(sender, instance: Pago, **kwargs):
+    previo = getattr(instance, '_recaudo_previo', None)
+    if previo is None:
+        return
+    instance._recaudo_previo = None
+    recaudo.ajustar_pago(instance, *previo)
+
+
+@receiver(pre_delete, sender=Pago)
+def pago_pre_delete(sender, instance: Pago, **kwargs):
+    if _pagos_gestionados.get():
+        return
+    recaudo.retirar_pago(instance)
+
+
+@receiver(post_save, sender=Comprobante)
+def comprobante_miniatura(sender, instance: Comprobante, created, **kwargs):
+    """La miniatura se genera en el worker, después de confirmar la subida."""
+    if created and instance.tipo.startswith('image/') and not instance.miniatura:
+        miniatura_comprobante.encolar(comprobante_id=instance.pk)
+
+
+@receiver(post_save, sender=Inscripcion)
+@receiver(pre_delete, sender=Inscripcion)
+def inscripcion_invalidar_seguimiento(sender, instance, **kwargs):
+    if _pagos_gestionados.get():
+        return
+    seguimiento.invalidar_codigos([instance.access_code])
+
+
+@receiver(post_save, sender=Pago)
+@receiver(pre_delete, sender=Pago)
+def pago_invalidar_seguimiento(sender, instance: Pago, **kwargs):
+    if _pagos_gestionados.get():
+        return
+    seguimiento.invalidar([instance.inscripcion_id])
+
+
+@receiver(post_save, sender=Comprobante)
+@receiver(post_delete, sender=Comprobante)
+def comprobante_invalidar_seguimiento(sender, instance: Comprobante, **kwargs):
+    if _pagos_gestionados.get():
         return
-    # If created, attempt reservation on the Asignacion referenced by the Inscripcion
-    if created:
-        asign = getattr(ins, 'asignacion', None)
-        if asign is None:
-            # nothing to reserve
-            return
-        try:
-            with transaction.atomic():
-                # Lock the asignacion row to prevent concurrent reservations
-                from docentes.models import Asignacion
-                Asignacion.objects.select_for_update().get(pk=asign.pk)
-                # count current ocupados for this asignacion
-                ocupados = asign.matriculas.count()
-                if ocupados >= asign.cupo_maximo:
-                    # no cupos -> mark pago as rechazado
-                    pago.estado = 'rechazado'
-                    pago.save(update_fields=['estado'])
-                    return
-                # obtain or create matricula for this inscripcion
-                matricula, _ = Matricula.objects.get_or_create(
-                    inscripcion=ins,
-                    estudiante=ins.estudiante,
-                )
-                # idempotent add: use the asignacion instance itself
-                matricula.asignaciones.add(asign)
-                matricula.save()
-        except Exception:
-            # If reservation fails unexpectedly, mark pago as rechazado to be safe
-            pago.estado = 'rechazado'
-            pago.save(update_fields=['estado'])
-            return
-
-    # Handle state transitions: finalize or rollback
-    if pago.estado in ('parcial', 'completado'):
-        # finalize: mark inscription as not provisional
-        if getattr(ins, 'provisional', False):
-            try:
-                ins.provisional = False
-                ins.save(update_fields=['provisional'])
-            except Exception:
-                # If saving inscripcion fails, continue without raising
-                pass
-            # activate matricula if exists
-            try:
-                matricula = Matricula.objects.filter(inscripcion=ins).first()
-                if matricula:
-                    matricula.estado = 'activo'
-                    matricula.save(update_fields=['estado'])
-            except Exception:
-                pass
-
-    if pago.estado == 'rechazado':
-        # rollback provisional inscription
-        if getattr(ins, 'provisional', False):
-            try:
-                with transaction.atomic():
-                    # remove asignacion reservation from matricula if present
-                    matricula = Matricula.objects.filter(inscripcion=ins).first()
-                    if matricula:
-                        # remove asignacion reservation related to this inscripcion
-                        try:
-                            asign_id = getattr(ins, 'asignacion_id', None)
-                            if asign_id:
-                                # remove by id or by instance; use id for safety
-                                matricula.asignaciones.remove(asign_id)
-                        except Exception:
-                            # ignore if not present
-                            pass
-                        # delete matricula
-                        matricula.delete()
-                    # keep reference to estudiante and apoderado before deleting inscripcion
-                    est = getattr(ins, 'estudiante', None)
-                    ap = getattr(est, 'apoderado', None) if est is not None else None
-                    # delete inscripcion
-                    try:
-                        ins.delete()
-                    except Exception:
-                        pass
-                    # if estudiante has no other inscripciones, delete estudiante
-                    if est is not None:
-                        try:
-                            if not est.inscripcion_set.exists():
-                                est.delete()
-                                # if apoderado exists and has no other estudiantes, delete apoderado
-                                if ap and not ap.estudiantes.exists():
-                                    ap.delete()
-                        except Exception:
-                            pass
-            except Exception:
-                # best-effort rollback; don't raise
-                pass
+    seguimiento.invalidar_por_pagos([instance.pago_id])
@@ -0,0 +1,35 @@
+"""Tareas en segundo plano de pagos (las ejecuta `manage.py runworker`)."""
+from tareas.services import tarea
+from estudiantes.models import Inscripcion
+from .emails import enviar_correo_codigo, enviar_correo_pago_aprobado
+from .miniaturas import generar_miniatura
+from .models import Comprobante, Pago
+
+
+@tarea
+def correo_pago_aprobado(pago_id):
+    pago = (
+        Pago.objects
+        .select_related("inscripcion__estudiante__apoderado", "inscripcion__plan")
+        .filter(pk=pago_id)
+        .first()
+    )
+    if pago is None:
+        return
+    enviar_correo_pago_aprobado(pago, raise_errors=True)
+
+
+@tarea
+def correo_codigo_acceso(inscripcion_id, correo):
+    ins = Inscripcion.objects.select_related("estudiante__apoderado").filter(pk=inscripcion_id).first()
+    if ins is None:
+        return
+    enviar_correo_codigo(ins, correo=correo)
+
+
+@tarea
+def miniatura_comprobante(comprobante_id):
+    comprobante = Comprobante.objects.filter(pk=comprobante_id).first()
+    if comprobante is None or comprobante.miniatura:
+        return
+    generar_miniatura(comprobante)
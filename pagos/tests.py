@@ -1,3 +1,258 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib import admin
+from django.urls import reverse
+from unittest import mock
+
+from apoderados.models import Apoderado
+from docentes.models import Asignacion
+from docentes.services import retener_cupo
+from estudiantes.models import Estudiante, Inscripcion
+from planes.models import Plan
+from usuarios.models import Usuario
+from .models import Pago, Comprobante, RecaudoDiario
+from tareas.models import Tarea
+from .tareas import correo_pago_aprobado
+from .services import registrar_inscripcion, transicionar_pagos
+
+
+class PagoChangelistQueryBudgetTests(TestCase):
+    """El changelist de pagos no debe crecer en consultas con el tamaño de página."""
+
+    # sesión + usuario + conteos del changelist + date_hierarchy + filas + total de recaudo
+    PRESUPUESTO = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = Usuario.objects.create_superuser("admin", "admin@example.com", "x")
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        for i in range(30):
+            est = Estudiante.objects.create(
+                nombres=f"Nombre {i}", apellidos="Apellido", edad=10, grado="1° Prim", colegio="C",
+            )
+            ins = Inscripcion.objects.create(estudiante=est, plan=plan)
+            pago = Pago.objects.create(inscripcion=ins, monto=10, metodo="yape")
+            for j in range(i % 3 + 1):
+                Comprobante.objects.create(pago=pago, archivo=f"comprobantes/test-{i}-{j}.png")
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+        self.pago_admin = admin.site._registry[Pago]
+
+    def _consultas_changelist(self, por_pagina):
+        with mock.patch.object(self.pago_admin, "list_per_page", por_pagina):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse("admin:pagos_pago_changelist"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_presupuesto_constante_por_tamano_de_pagina(self):
+        conteos = {n: self._consultas_changelist(n) for n in (1, 10, 30)}
+        for n, consultas in conteos.items():
+            self.assertLessEqual(
+                consultas, self.PRESUPUESTO,
+                f"{consultas} consultas con {n} filas por página (presupuesto {self.PRESUPUESTO})",
+            )
+        self.assertEqual(len(set(conteos.values())), 1, f"Las consultas crecen con la página: {conteos}")
+
+    def _consultas_exportacion(self, accion, n):
+        ids = list(Pago.objects.order_by("pk").values_list("pk", flat=True)[:n])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                reverse("admin:pagos_pago_changelist"), {"action": accion, "_selected_action": ids},
+            )
+            filas = b"".join(response.streaming_content)
+        self.assertTrue(filas)
+        return len(ctx.captured_queries)
+
+    def test_exportacion_no_crece_con_las_filas(self):
+        for accion in ("exportar_csv", "exportar_xlsx"):
+            conteos = [self._consultas_exportacion(accion, n) for n in (1, 30)]
+            self.assertEqual(conteos[0], conteos[1], f"{accion}: {conteos}")
+
+    def test_celda_de_comprobantes_usa_anotaciones(self):
+        pago = self.pago_admin.get_queryset(None).order_by("id").first()
+        self.assertEqual(pago.num_comprobantes, 1)
+        self.assertEqual(pago.primera_miniatura, "")
+
+
+class TransicionPagosTests(TestCase):
+    """El motor de transiciones es idempotente y su costo no depende del lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+
+    def _pagos(self, n, provisional=False):
+        ids = []
+        for i in range(n):
+            est = Estudiante.objects.create(
+                nombres=f"Nombre {i}", apellidos="Apellido", edad=10, grado="1° Prim", colegio="C",
+            )
+            ins = Inscripcion.objects.create(estudiante=est, plan=self.plan, provisional=provisional)
+            ids.append(Pago.objects.create(inscripcion=ins, monto=10, metodo="yape", estado_solicitado="completado").pk)
+        return ids
+
+    def test_aprobar_es_idempotente(self):
+        ids = self._pagos(3)
+        resumen = transicionar_pagos(ids)
+        self.assertEqual(resumen["aplicados"], 3)
+        self.assertEqual(resumen["transiciones"], {"pendiente→completado": 3})
+        self.assertEqual(set(Pago.objects.filter(pk__in=ids).values_list("estado", flat=True)), {"completado"})
+        self.assertFalse(Inscripcion.objects.filter(pago__in=ids).exclude(estado_pago="total").exists())
+
+        self.assertEqual(
+            sorted(Tarea.objects.filter(nombre=correo_pago_aprobado.nombre_tarea)
+                   .values_list("argumentos__pago_id", flat=True)),
+            sorted(ids),
+        )
+
+        repetido = transicionar_pagos(ids)
+        self.assertEqual(repetido["aplicados"], 0)
+        self.assertEqual(repetido["sin_cambio"], 3)
+
+    def test_consultas_constantes_por_lote(self):
+        # El primer pago del día crea el grupo de RecaudoDiario (INSERT extra).
+        transicionar_pagos(self._pagos(1))
+        uno = transicionar_pagos(self._pagos(1))["consultas"]
+        diez = transicionar_pagos(self._pagos(10))["consultas"]
+        self.assertEqual(uno, diez)
+
+    def test_rechazado_no_vuelve_atras(self):
+        ids = self._pagos(1)
+        transicionar_pagos(ids, "rechazado")
+        resumen = transicionar_pagos(ids, "completado")
+        self.assertEqual(resumen["invalidos"], 1)
+        self.assertEqual(Pago.objects.get(pk=ids[0]).estado, "rechazado")
+
+    def test_rechazo_revierte_inscripcion_provisional(self):
+        ids = self._pagos(1, provisional=True)
+        Pago.objects.get(pk=ids[0]).rechazar()
+        self.assertFalse(Pago.objects.filter(pk__in=ids).exists())
+        self.assertFalse(Inscripcion.objects.exists())
+
+
+class RecaudoClaveTests(TestCase):
+    """Las salidas del recaudo restan del grupo en el que se sumó el pago."""
+
+    def setUp(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        self.primera = Asignacion.objects.create(plan=plan, cupo_maximo=5)
+        self.segunda = Asignacion.objects.create(plan=plan, cupo_maximo=5)
+        self.est = Estudiante.objects.create(nombres="Ana", apellidos="P", edad=10, grado="1° Prim", colegio="C")
+        self.ins = Inscripcion.objects.create(estudiante=self.est, plan=plan, asignacion=self.primera)
+
+    def _grupos(self):
+        return {
+            (r.grado, r.asignacion_id): (r.total, r.cantidad)
+            for r in RecaudoDiario.objects.all()
+        }
+
+    def _mover(self):
+        # Cambian el grado y la asignación después de aprobar.
+        Estudiante.objects.filter(pk=self.est.pk).update(grado="2° Prim")
+        Inscripcion.objects.filter(pk=self.ins.pk).update(asignacion=self.segunda)
+
+    def test_rechazo_resta_del_grupo_original(self):
+        pago = Pago.objects.create(inscripcion=self.ins, monto=40, metodo="yape", estado_solicitado="completado")
+        transicionar_pagos([pago.pk])
+        self.assertEqual(self._grupos(), {("1° Prim", self.primera.pk): (40, 1)})
+        self._mover()
+        transicionar_pagos([pago.pk], "rechazado")
+        self.assertEqual(self._grupos(), {("1° Prim", self.primera.pk): (0, 0)})
+
+    def test_borrar_y_editar_usan_el_grupo_guardado(self):
+        pago = Pago.objects.create(inscripcion=self.ins, monto=40, metodo="yape", estado="completado")
+        self._mover()
+        pago.monto = 55
+        pago.save()
+        self.assertEqual(self._grupos(), {("1° Prim", self.primera.pk): (55, 1)})
+        pago.delete()
+        self.assertEqual(self._grupos(), {("1° Prim", self.primera.pk): (0, 0)})
+
+
+class RegistrarInscripcionTests(TestCase):
+    """El registro completo usa un número fijo de consultas y convierte la retención en cupo."""
+
+    def test_registro_con_retencion(self):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        asignacion = Asignacion.objects.create(plan=plan, cupo_maximo=1)
+        Apoderado.objects.create(dni="12345678", nombres="Ana", apellidos="Pérez", telefono="999", correo="ana@x.com")
+        self.assertTrue(retener_cupo(asignacion.pk, "clave"))
+
+        # savepoint, plan, apoderado, estudiante, inscripción, matrícula, pago, cupo, release
+        with self.assertNumQueries(9):
+            registro = registrar_inscripcion(
+                apoderado={"dni": "12345678", "nombres": "", "apellidos": "Pérez", "telefono": "999", "correo": ""},
+                estudiante={"nombres": "Luis", "apellidos": "Pérez", "edad": 10, "grado": "1° Prim", "colegio": "C"},
+                pago={"monto": 10, "metodo": "yape", "estado": "completado"},
+                asignacion_id=asignacion.pk,
+                retencion="clave",
+            )
+        self.assertEqual(registro.puesto, 0)
+        self.assertEqual(registro.inscripcion.plan_id, plan.pk)
+        self.assertEqual(Apoderado.objects.get(dni="12345678").correo, "ana@x.com")
+        asignacion.refresh_from_db()
+        self.assertEqual((asignacion.ocupados, asignacion.retenidos), (1, 0))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SeguimientoCacheTests(TestCase):
+    """La página de seguimiento se sirve del snapshot y se invalida con los cambios."""
+
+    @classmethod
+    def setUpTestData(cls):
+        plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        est = Estudiante.objects.create(
+            nombres="Ana", apellidos="Pérez", edad=10, grado="1° Prim", colegio="C",
+        )
+        cls.ins = Inscripcion.objects.create(estudiante=est, plan=plan, access_code="ABC123XYZ0")
+        Pago.objects.create(inscripcion=cls.ins, monto=10, metodo="yape", estado="parcial")
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("pagos_regularizar_seguimiento", args=[self.ins.access_code])
+
+    def test_get_sin_consultas_con_cache(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Pérez Ana")
+
+    def test_cambio_de_pago_invalida_snapshot(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Pago.objects.create(inscripcion=self.ins, monto=25, metodo="plin")
+        response = self.client.get(self.url)
+        self.assertContains(response, "Plin")
+        self.assertFalse(response.context["puede_subir"])
+
+    def test_reenvio_con_la_misma_clave_no_duplica(self):
+        datos = {"monto": "25", "metodo": "yape"}
+        url = f"{self.url}?idem=clave-de-prueba"
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            primera = self.client.post(url, {**datos, "archivos": SimpleUploadedFile("c.pdf", b"%PDF-1.4 uno")})
+            with self.assertNumQueries(1):
+                segunda = self.client.post(url, {**datos, "archivos": SimpleUploadedFile("c.pdf", b"%PDF-1.4 dos")})
+        self.assertEqual(primera.status_code, 302)
+        self.assertEqual(segunda["Location"], primera["Location"])
+        self.assertEqual(Pago.objects.filter(inscripcion=self.ins).count(), 2)
+
+    def test_post_valida_contra_la_base_y_no_el_snapshot(self):
+        self.assertTrue(self.client.get(self.url).context["puede_subir"])
+        # Sin ejecutar on_commit el snapshot cacheado queda desfasado.
+        Pago.objects.create(inscripcion=self.ins, monto=5, metodo="plin")
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = self.client.post(self.url, {
+                "monto": "25", "metodo": "yape", "archivos": SimpleUploadedFile("c.pdf", b"%PDF-1.4 x"),
+            })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Pago.objects.filter(inscripcion=self.ins, estado="pendiente").count(), 1)
+
+    def test_codigo_inexistente(self):
+        self.assertEqual(self.client.get(reverse("pagos_regularizar_seguimiento", args=["NOEXISTE"])).status_code, 404)
@@ -1,13 +1,15 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponseBadRequest
+from django.http import Http404, HttpResponseBadRequest
 from django.urls import reverse
 from django.contrib import messages
 from django.conf import settings
+from django.core.exceptions import ValidationError
 
 from estudiantes.models import Inscripcion, Estudiante, Matricula
-from apoderados.models import Apoderado
+from apoderados.services import ultima_inscripcion_por_correo
 from planes.models import Plan
 from docentes.models import Asignacion
+from docentes.services import retener_cupo
 from types import SimpleNamespace
 from django.db import transaction
 from django.db.models import F
@@ -18,6 +20,11 @@ from .forms import (
     RegularizacionForm,
 )
 from .models import Pago, Comprobante
+from .almacenamiento import validar_comprobante
+from .idempotencia import idempotente
+from .services import registrar_inscripcion
+from . import seguimiento
+from .tareas import correo_codigo_acceso
 from decimal import Decimal
 from django.utils import timezone
 
@@ -25,14 +32,6 @@ from django.utils import timezone
 SESSION_TTL_SECONDS = 24 * 3600
 
 MAX_FILES = 3
-MAX_MB = 5  
-ALLOWED_CT = {
-    "application/pdf",
-    "image/jpeg",
-    "image/png",
-    "image/webp",
-    "image/gif",
-}
 
 def registrar_pago_con_comprobantes(inscripcion, cleaned_data, archivos):
     """
@@ -55,12 +54,7 @@ def reenviar_codigo(request):
     if request.method == "POST" and form.is_valid():
         email = form.cleaned_data["email"].strip().lower()
 
-        ins = (
-            Inscripcion.objects
-            .filter(estudiante__apoderado__correo__iexact=email)
-            .order_by("-id")
-            .first()
-        )
+        ins = ultima_inscripcion_por_correo(email)
         if not ins:
             messages.error(request, "No encontramos inscripciones asociadas a ese correo.")
         else:
@@ -69,25 +63,8 @@ def reenviar_codigo(request):
                 ins.access_code = get_random_string(10).upper()
                 ins.save(update_fields=["access_code"])
 
-            from django.core.mail import send_mail
-            path = reverse("pagos_regularizar_seguimiento", args=[ins.access_code])
-            base = getattr(settings, "SITE_BASE_URL", "").rstrip("/")
-            url = f"{base}{path}"
-
-            subject = "CEAMA – Código de acceso para pagos"
-            body = (
-                "Hola,\n\n"
-                f"Tu código de acceso es: {ins.access_code}\n"
-                f"Puedes ver/regularizar pagos aquí:\n{url}\n\n"
-                "CEAMA"
-            )
-            send_mail(
-                subject,
-                body,
-                getattr(settings, "DEFAULT_FROM_EMAIL", None),
-                [email],
-                fail_silently=True,
-            )
+            # SMTP corre en el worker; la petición solo encola la tarea.
+            correo_codigo_acceso.encolar(inscripcion_id=ins.pk, correo=email)
 
             messages.success(request, "Te enviamos el código a tu correo.")
             return redirect("pagos_regularizar_lookup")
@@ -101,18 +78,17 @@ def regularizar_lookup(request):
         return redirect("pagos_regularizar_seguimiento", code=code)
     return render(request, "pagos/regularizar_lookup.html", {"form": form})
 
+@idempotente
 def regularizar_seguimiento(request, code: str):
-    ins = get_object_or_404(Inscripcion, access_code=code)
-    pagos = ins.pago_set.select_related().order_by("-id")
-    hay_pendiente = pagos.filter(estado="pendiente").exists()
-
-    puede_subir = (getattr(ins, "estado_pago", "pendiente") != "total") and (not hay_pendiente)
+    # GET sin consultas: se sirve del snapshot cacheado (pagos.seguimiento).
+    # El POST no confía en él: puede estar desfasado (se invalida al
+    # confirmar y la caché no se comparte entre servidores).
+    snapshot = seguimiento.obtener(code)
+    if snapshot is None:
+        raise Http404("Código de acceso no válido.")
 
     if request.method == "POST":
-        if not puede_subir:
-            return HttpResponseBadRequest("Ya existe un comprobante pendiente de validación o el pago está completado.")
-
-        form = RegularizacionForm(request.POST) 
+        form = RegularizacionForm(request.POST)
         archivos = request.FILES.getlist("archivos")
 
         # Validaciones de archivos (servidor)
@@ -122,23 +98,32 @@ def regularizar_seguimiento(request, code: str):
             form.add_error(None, f"Solo se permiten {MAX_FILES} archivos.")
         else:
             for f in archivos:
-                if f.content_type not in ALLOWED_CT:
-                    form.add_error(None, "Solo PDF o imágenes (JPG/PNG/WEBP/GIF).")
-                    break
-                if f.size > MAX_MB * 1024 * 1024:
-                    form.add_error(None, f"Cada archivo debe pesar ≤ {MAX_MB} MB.")
+                try:
+                    validar_comprobante(f)
+                except ValidationError as e:
+                    form.add_error(None, e.message)
                     break
 
         if form.is_valid():
-            pago = Pago.objects.create(
-                inscripcion=ins,
-                monto=form.cleaned_data["monto"],
-                metodo=form.cleaned_data["metodo"],
-                estado="pendiente",
-                estado_solicitado="completado",
-            )
-            for f in archivos:
-                Comprobante.objects.create(pago=pago, archivo=f)
+            with transaction.atomic():
+                # Bloquea la inscripción: dos envíos simultáneos no pueden
+                # dejar dos pagos pendientes.
+                ins = Inscripcion.objects.select_for_update().filter(access_code=code).first()
+                if ins is None:
+                    raise Http404("Código de acceso no válido.")
+                if ins.estado_pago == "total" or ins.pago_set.filter(estado="pendiente").exists():
+                    return HttpResponseBadRequest(
+                        "Ya existe un comprobante pendiente de validación o el pago está completado."
+                    )
+                pago = Pago.objects.create(
+                    inscripcion=ins,
+                    monto=form.cleaned_data["monto"],
+                    metodo=form.cleaned_data["metodo"],
+                    estado="pendiente",
+                    estado_solicitado="completado",
+                )
+                for f in archivos:
+                    Comprobante.objects.create(pago=pago, archivo=f)
 
             messages.success(
                 request,
@@ -152,15 +137,13 @@ def regularizar_seguimiento(request, code: str):
         request,
         "pagos/regularizar_seguimiento.html",
         {
-            "inscripcion": ins,
-            "pagos": pagos,
-            "puede_subir": puede_subir,   
-            "hay_pendiente": hay_pendiente,
+            **snapshot,
             "form": form,
             "MAX_FILES": MAX_FILES,
         },
     )
 
+@idempotente
 def registrar_pago(request):
     inscripcion = None
     inscripcion_id = request.GET.get("inscripcion_id") or request.POST.get("inscripcion_id")
@@ -241,6 +224,9 @@ def registrar_pago(request):
                     session_preview['asignacion_obj'] = asignacion_obj
                 except Asignacion.DoesNotExist:
                     session_preview['asignacion_obj'] = None
+                # Renueva la retención del cupo mientras el apoderado paga.
+                if asignacion_obj and ses_ins.get('retencion') and not retener_cupo(asignacion_obj.pk, ses_ins['retencion']):
+                    messages.warning(request, 'La retención de tu cupo venció y la asignación ya no tiene cupos disponibles.')
 
             # Build lightweight preview objects so the template can render similarly
             # to a persisted Inscripcion + Matricula.
@@ -299,11 +285,10 @@ def registrar_pago(request):
             pago_form.add_error(None, f"Solo se permiten {MAX_FILES} comprobantes por pago.")
         else:
             for f in archivos:
-                if f.content_type not in ALLOWED_CT:
-                    pago_form.add_error(None, "Solo PDF o imágenes (JPG/PNG/WEBP/GIF).")
-                    break
-                if f.size > MAX_MB * 1024 * 1024:
-                    pago_form.add_error(None, f"Cada archivo debe pesar ≤ {MAX_MB} MB.")
+                try:
+                    validar_comprobante(f)
+                except ValidationError as e:
+                    pago_form.add_error(None, e.message)
                     break
         if pago_form.is_valid():
             if inscripcion:
@@ -318,72 +303,17 @@ def registrar_pago(request):
                 pago_form.add_error(None, "Falta información del estudiante o apoderado. Reinicia el proceso.")
             else:
                 try:
-                    with transaction.atomic():
-                        # Apoderado: reuse by DNI if exists
-                        apod = None
-                        if ses_apod.get('dni'):
-                            apod = Apoderado.objects.filter(dni=ses_apod['dni']).first()
-                        if apod:
-                            # update contact fields if changed
-                            apod.nombres = ses_apod.get('nombres') or apod.nombres
-                            apod.apellidos = ses_apod.get('apellidos') or apod.apellidos
-                            apod.telefono = ses_apod.get('telefono') or apod.telefono
-                            apod.correo = ses_apod.get('correo') or apod.correo
-                            apod.direccion = ses_apod.get('direccion') or apod.direccion
-                            apod.save(update_fields=['nombres','apellidos','telefono','correo','direccion'])
-                        else:
-                            apod = Apoderado.objects.create(
-                                dni=ses_apod.get('dni'),
-                                nombres=ses_apod.get('nombres'),
-                                apellidos=ses_apod.get('apellidos'),
-                                telefono=ses_apod.get('telefono'),
-                                correo=ses_apod.get('correo'),
-                                direccion=ses_apod.get('direccion'),
-                            )
-
-                        # Determine plan similarly to previous logic
-                        plan = None
-                        plan_id = ses_ins.get('plan_id')
-                        asignacion_id = ses_ins.get('asignacion_id')
-                        if plan_id:
-                            plan = Plan.objects.filter(pk=plan_id).first()
-                        if not plan and asignacion_id:
-                            try:
-                                asig_tmp = Asignacion.objects.select_related('plan').get(pk=asignacion_id)
-                                plan = getattr(asig_tmp, 'plan', None)
-                            except Asignacion.DoesNotExist:
-                                plan = None
-                        if not plan:
-                            plan = Plan.objects.first()
-
-                        # Create Estudiante
-                        estudiante = Estudiante.objects.create(
-                            nombres=ses_ins.get('nombres'),
-                            apellidos=ses_ins.get('apellidos'),
-                            grado=ses_ins.get('grado'),
-                            colegio=ses_ins.get('colegio'),
-                            edad=ses_ins.get('edad'),
-                            apoderado=apod,
-                        )
-
-                        # Create Inscripcion and Matricula
-                        inscripcion = Inscripcion.objects.create(estudiante=estudiante, plan=plan)
-                        matricula = Matricula.objects.create(inscripcion=inscripcion, estudiante=estudiante)
-
-                        # Reserve asignacion if provided
-                        if asignacion_id:
-                            asignacion = Asignacion.objects.select_for_update().get(pk=asignacion_id)
-                            # Check cupo (assume cupo_maximo and relation via matriculas)
-                            current = asignacion.matriculas.count()
-                            if getattr(asignacion, 'cupo_maximo', None) is not None and current >= asignacion.cupo_maximo:
-                                raise ValueError('La asignación seleccionada ya no tiene cupos disponibles.')
-                            # add to matricula
-                            matricula.asignaciones.add(asignacion)
-                            inscripcion.asignacion = asignacion
-                            inscripcion.save(update_fields=['asignacion'])
-
-                        # Create Pago and attach comprobantes
-                        pago = registrar_pago_con_comprobantes(inscripcion, pago_form.cleaned_data, archivos)
+                    registro = registrar_inscripcion(
+                        apoderado=ses_apod,
+                        estudiante=ses_ins,
+                        pago=pago_form.cleaned_data,
+                        archivos=archivos,
+                        plan_id=ses_ins.get('plan_id'),
+                        asignacion_id=ses_ins.get('asignacion_id'),
+                        retencion=ses_ins.get('retencion'),
+                    )
+                    inscripcion = registro.inscripcion
+                    puesto = registro.puesto
 
                     # If we reach here, transaction committed successfully
                     # Clear session data used for the flow
@@ -391,7 +321,14 @@ def registrar_pago(request):
                     request.session.pop('ceama_apoderado', None)
                     request.session.modified = True
 
-                    messages.success(request, "Pago registrado. Queda pendiente de confirmación por administración.")
+                    if puesto:
+                        messages.warning(
+                            request,
+                            f"Pago registrado, pero la asignación ya no tiene cupos: quedaste en lista de espera "
+                            f"(puesto {puesto}). Te avisaremos por correo cuando se libere un cupo.",
+                        )
+                    else:
+                        messages.success(request, "Pago registrado. Queda pendiente de confirmación por administración.")
                     return redirect(f"{reverse('registrar_pago')}?inscripcion_id={inscripcion.id}&ok=1")
                 except Exception as e:
                     pago_form.add_error(None, f"No se pudo completar el registro: {e}")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PlanesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'planes'
+
+    def ready(self):
+        # registra las señales que invalidan el mapa plan → cursos
+        from . import signals  # noqa: F401
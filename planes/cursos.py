@@ -0,0 +1,76 @@
+"""
+Mapa precalculado plan → cursos (`Plan.cursos`).
+
+Listados como el de matrículas muestran los cursos del plan en cada fila;
+en lugar de consultar por fila, cada proceso carga el mapa completo con
+dos consultas y lo reutiliza. Un sello de versión en la caché compartida
+indica cuándo recargarlo: se renueva al confirmar cualquier cambio en la
+relación `Plan.cursos` o en los cursos (ver planes/signals.py). Cada
+proceso compara el sello como mucho cada `REVISION` segundos, de modo que
+el costo por fila es una búsqueda en un dict.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+
+CLAVE_VERSION = 'planes:cursos:version'
+REVISION = 2  # s entre comprobaciones del sello compartido
+
+_lock = threading.Lock()
+_estado = {'mapa': None, 'version': None, 'revisado': 0.0}
+
+
+def _version_compartida():
+    v = cache.get(CLAVE_VERSION)
+    if v is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        v = cache.get(CLAVE_VERSION)
+    return v
+
+
+def _cargar():
+    from docentes.models import Curso
+    from .models import Plan
+
+    cursos = {c.pk: c for c in Curso.objects.order_by('nombre', 'pk')}
+    orden = {pk: i for i, pk in enumerate(cursos)}
+    mapa = defaultdict(list)
+    for plan_id, curso_id in Plan.cursos.through.objects.values_list('plan_id', 'curso_id'):
+        mapa[plan_id].append(curso_id)
+    return {
+        plan_id: tuple(cursos[pk] for pk in sorted(ids, key=orden.__getitem__))
+        for plan_id, ids in mapa.items()
+    }
+
+
+def mapa_cursos():
+    """{plan_id: (Curso, ...)} ordenado por nombre. Las instancias son de solo lectura."""
+    ahora = time.monotonic()
+    if _estado['mapa'] is not None and ahora - _estado['revisado'] < REVISION:
+        return _estado['mapa']
+    with _lock:
+        v = _version_compartida()
+        if _estado['mapa'] is None or _estado['version'] != v:
+            _estado['mapa'] = _cargar()
+            _estado['version'] = v
+        _estado['revisado'] = ahora
+        return _estado['mapa']
+
+
+def cursos_de_plan(plan_id):
+    if plan_id is None:
+        return ()
+    return mapa_cursos().get(plan_id, ())
+
+
+def _renovar():
+    _estado['mapa'] = None
+    cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar():
+    """Renueva el sello (y descarta el mapa de este proceso) al confirmar la transacción."""
+    transaction.on_commit(_renovar)
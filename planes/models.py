@@ -22,7 +22,7 @@ class Plan(models.Model):
     # Nota: la capacidad se gestiona por `Asignacion` (grupos), no por `Plan`.
     
     def cursos_base(self):
-        from docentes.models import Curso
-        qs = Curso.objects.all()
-        return qs
+        """Cursos del plan (tupla ordenada por nombre) desde el mapa precalculado."""
+        from .cursos import cursos_de_plan
+        return cursos_de_plan(self.pk)
 
@@ -0,0 +1,21 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from docentes.models import Curso
+from . import cursos
+from .models import Plan
+
+
+@receiver(m2m_changed, sender=Plan.cursos.through)
+def plan_cursos_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cursos.invalidar()
+
+
+# Renombrar o borrar un curso cambia lo que muestra el mapa; borrar un plan
+# elimina sus filas intermedias sin emitir m2m_changed.
+@receiver(post_save, sender=Curso)
+@receiver(post_delete, sender=Curso)
+@receiver(post_delete, sender=Plan)
+def invalidar_mapa_cursos(sender, **kwargs):
+    cursos.invalidar()
@@ -1,3 +1,50 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from docentes.models import Curso
+from . import cursos
+from .models import Plan
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class MapaCursosTests(TestCase):
+    """El mapa plan → cursos se reutiliza entre llamadas y se recarga cuando cambia el sello."""
+
+    def setUp(self):
+        cache.clear()
+        cursos._estado.update(mapa=None, version=None, revisado=0.0)
+        self.plan = Plan.objects.create(nombre="Plan test", nivel="primaria")
+        self.aritmetica, self.fisica = Curso.objects.create(nombre="Aritmética"), Curso.objects.create(nombre="Física")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.cursos.add(self.fisica)
+
+    def nombres(self):
+        return [c.nombre for c in cursos.cursos_de_plan(self.plan.pk)]
+
+    def test_cambios_en_la_relacion_recargan_el_mapa(self):
+        self.assertEqual(self.nombres(), ["Física"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.nombres(), ["Física"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.cursos.add(self.aritmetica)
+        self.assertEqual(self.nombres(), ["Aritmética", "Física"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fisica.nombre = "Física I"
+            self.fisica.save()
+        self.assertEqual(self.nombres(), ["Aritmética", "Física I"])
+
+    def test_sello_renovado_por_otro_proceso(self):
+        self.assertEqual(self.nombres(), ["Física"])
+        # Otro proceso cambió la relación y renovó el sello compartido.
+        Plan.cursos.through.objects.create(plan=self.plan, curso=self.aritmetica)
+        cache.set(cursos.CLAVE_VERSION, time.time_ns(), None)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.nombres(), ["Física"])
+        despues = time.monotonic() + cursos.REVISION
+        with mock.patch.object(cursos.time, "monotonic", return_value=despues):
+            self.assertEqual(self.nombres(), ["Aritmética", "Física"])
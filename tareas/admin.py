@@ -0,0 +1,21 @@
+from django.contrib import admin, messages
+from django.utils import timezone
+
+from .models import Tarea
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'nombre', 'estado', 'intentos', 'disponible_en', 'creada')
+    list_filter = ('estado', 'nombre')
+    search_fields = ('nombre',)
+    ordering = ('-id',)
+    readonly_fields = ('nombre', 'argumentos', 'intentos', 'ultimo_error', 'creada', 'actualizada')
+    actions = ['reintentar']
+
+    @admin.action(description="Reintentar tarea(s) ahora")
+    def reintentar(self, request, queryset):
+        n = queryset.exclude(estado='completada').update(
+            estado='pendiente', intentos=0, disponible_en=timezone.now(),
+        )
+        self.message_user(request, f"{n} tarea(s) reprogramadas.", level=messages.SUCCESS)
@@ -0,0 +1,69 @@
+import select
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tareas.services import CANAL, ejecutar_siguiente
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de tareas en segundo plano (correos, miniaturas, etc.)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help="Segundos de espera cuando la cola está vacía (por defecto 5).",
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help="Vacía la cola y termina (útil para cron o pruebas).",
+        )
+
+    def handle(self, *args, **options):
+        self._detener = False
+        signal.signal(signal.SIGTERM, self._pedir_detencion)
+        signal.signal(signal.SIGINT, self._pedir_detencion)
+
+        escuchando = False
+        procesadas = 0
+        while not self._detener:
+            t = ejecutar_siguiente()
+            if t is not None:
+                procesadas += 1
+                self.stdout.write(f"{t.nombre} #{t.pk}: {t.get_estado_display()} (intento {t.intentos})")
+                continue
+            if options['una_vez']:
+                break
+            if not escuchando:
+                escuchando = self._escuchar()
+            self._esperar(options['intervalo'], escuchando)
+
+        self.stdout.write(self.style.SUCCESS(f"Worker detenido. Tareas procesadas: {procesadas}."))
+
+    def _pedir_detencion(self, signum, frame):
+        self._detener = True
+
+    def _escuchar(self):
+        """LISTEN en Postgres para despertar apenas se confirme una tarea nueva."""
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CANAL}")
+        return True
+
+    def _esperar(self, segundos, escuchando):
+        if not escuchando:
+            time.sleep(segundos)
+            return
+        pg = connection.connection
+        try:
+            select.select([pg], [], [], segundos)
+        except InterruptedError:
+            return
+        pg.poll()
+        pg.notifies.clear()
@@ -0,0 +1,35 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Tarea(models.Model):
+    """
+    Trabajo pendiente para el worker (`manage.py runworker`). La fila se crea
+    dentro de la transacción de quien la encola, así que solo es visible (y
+    ejecutable) si esa transacción se confirma.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    nombre = models.CharField(max_length=150)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    disponible_en = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    actualizada = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nombre} #{self.pk} ({self.get_estado_display()})"
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='tarea_estado_disponible_idx'),
+        ]
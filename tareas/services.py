@@ -0,0 +1,116 @@
+import datetime
+import functools
+import logging
+import traceback
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'tareas'
+# Reintentos: 30 s, 1 min, 2 min, ... con tope de 1 hora.
+BACKOFF_BASE_SEGUNDOS = 30
+BACKOFF_MAX_SEGUNDOS = 3600
+
+_registro = {}
+
+
+def tarea(func=None, *, max_intentos=5):
+    """
+    Registra una función como tarea en segundo plano. La función decorada
+    sigue pudiendo llamarse directamente y además expone `.encolar(**kwargs)`.
+    Los argumentos deben ser serializables a JSON (ids, no instancias).
+    """
+    if func is None:
+        return functools.partial(tarea, max_intentos=max_intentos)
+
+    nombre = f"{func.__module__}.{func.__name__}"
+    _registro[nombre] = func
+    func.nombre_tarea = nombre
+    func.encolar = functools.partial(encolar, nombre, max_intentos=max_intentos)
+    func.encolar_lote = functools.partial(encolar_lote, nombre, max_intentos=max_intentos)
+    return func
+
+
+def _notificar_worker():
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, '')", [CANAL])
+
+
+def encolar(nombre, max_intentos=5, **argumentos):
+    """
+    Crea la tarea dentro de la transacción actual y, al confirmarse, despierta
+    al worker con NOTIFY. Si la transacción se revierte la tarea desaparece.
+    """
+    if nombre not in _registro:
+        raise KeyError(f"Tarea no registrada: {nombre}")
+    t = Tarea.objects.create(nombre=nombre, argumentos=argumentos, max_intentos=max_intentos)
+    transaction.on_commit(_notificar_worker)
+    return t
+
+
+def encolar_lote(nombre, lista_argumentos, max_intentos=5):
+    """
+    Como `encolar`, pero crea una tarea por cada dict de `lista_argumentos`
+    con un solo INSERT. Cada una se ejecuta y se reintenta por separado.
+    """
+    if nombre not in _registro:
+        raise KeyError(f"Tarea no registrada: {nombre}")
+    tareas = Tarea.objects.bulk_create([
+        Tarea(nombre=nombre, argumentos=argumentos, max_intentos=max_intentos)
+        for argumentos in lista_argumentos
+    ])
+    if tareas:
+        transaction.on_commit(_notificar_worker)
+    return tareas
+
+
+def _backoff(intentos):
+    segundos = min(BACKOFF_BASE_SEGUNDOS * 2 ** max(intentos - 1, 0), BACKOFF_MAX_SEGUNDOS)
+    return datetime.timedelta(seconds=segundos)
+
+
+def ejecutar_siguiente():
+    """
+    Toma la siguiente tarea disponible con SELECT ... FOR UPDATE SKIP LOCKED
+    y la ejecuta mientras mantiene el bloqueo de su fila: varios workers
+    pueden correr en paralelo sin pisarse y, si el proceso muere, la
+    transacción se revierte y la tarea vuelve a quedar disponible.
+    Devuelve la tarea procesada o None si la cola está vacía.
+    """
+    with transaction.atomic():
+        t = (
+            Tarea.objects
+            .select_for_update(skip_locked=True)
+            .filter(estado='pendiente', disponible_en__lte=timezone.now())
+            .order_by('disponible_en', 'id')
+            .first()
+        )
+        if t is None:
+            return None
+
+        t.intentos += 1
+        func = _registro.get(t.nombre)
+        try:
+            if func is None:
+                raise LookupError(f"Tarea no registrada: {t.nombre}")
+            with transaction.atomic():
+                func(**t.argumentos)
+        except Exception:
+            t.ultimo_error = traceback.format_exc()
+            if t.intentos >= t.max_intentos:
+                t.estado = 'fallida'
+                logger.error("Tarea %s #%s falló definitivamente", t.nombre, t.pk)
+            else:
+                t.disponible_en = timezone.now() + _backoff(t.intentos)
+                logger.warning("Tarea %s #%s falló (intento %s), se reintentará", t.nombre, t.pk, t.intentos)
+        else:
+            t.estado = 'completada'
+            t.ultimo_error = ''
+        t.save(update_fields=['estado', 'intentos', 'disponible_en', 'ultimo_error', 'actualizada'])
+    return t